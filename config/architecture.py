@@ -1,6 +1,7 @@
 """
 Configuración de la nueva arquitectura de la aplicación
 """
+import threading
 from typing import Optional
 
 
@@ -8,32 +9,68 @@ class ApplicationControllers:
     """Clase para gestionar todos los controladores de la aplicación con inicialización perezosa"""
     
     def __init__(self):
+        self._bigquery_service = None
+        self._firebase_service = None
         self._usuarios_controller = None
         self._instalaciones_controller = None
         self._contactos_controller = None
+        # Los getters pueden llamarse desde tareas en segundo plano
+        self._lock = threading.RLock()
+    
+    def get_bigquery_service(self):
+        """Obtener el servicio de BigQuery compartido (un cliente y un cache para toda la app)"""
+        if self._bigquery_service is None:
+            with self._lock:
+                if self._bigquery_service is None:
+                    from services.bigquery_service import BigQueryService
+                    self._bigquery_service = BigQueryService()
+        return self._bigquery_service
+    
+    def get_firebase_service(self):
+        """Obtener el servicio de Firebase compartido (una requests.Session con pool de conexiones y una app del Admin SDK para toda la app)"""
+        if self._firebase_service is None:
+            with self._lock:
+                if self._firebase_service is None:
+                    from services.firebase_service import FirebaseService
+                    self._firebase_service = FirebaseService()
+        return self._firebase_service
     
     def get_usuarios_controller(self):
         """Obtener controlador de usuarios (inicialización perezosa)"""
         if self._usuarios_controller is None:
-            from controllers.usuarios_controller import UsuariosController
-            self._usuarios_controller = UsuariosController()
+            with self._lock:
+                if self._usuarios_controller is None:
+                    from controllers.usuarios_controller import UsuariosController
+                    self._usuarios_controller = UsuariosController()
         return self._usuarios_controller
     
     def get_instalaciones_controller(self):
         """Obtener controlador de instalaciones (inicialización perezosa)"""
         if self._instalaciones_controller is None:
-            from controllers.instalaciones_controller import InstalacionesController
-            self._instalaciones_controller = InstalacionesController()
+            with self._lock:
+                if self._instalaciones_controller is None:
+                    from controllers.instalaciones_controller import InstalacionesController
+                    self._instalaciones_controller = InstalacionesController()
         return self._instalaciones_controller
     
     def get_contactos_controller(self):
         """Obtener controlador de contactos (inicialización perezosa)"""
         if self._contactos_controller is None:
-            from controllers.contactos_controller import ContactosController
-            self._contactos_controller = ContactosController()
+            with self._lock:
+                if self._contactos_controller is None:
+                    from controllers.contactos_controller import ContactosController
+                    self._contactos_controller = ContactosController()
         return self._contactos_controller
     
     # Propiedades para compatibilidad
+    @property
+    def bigquery_service(self):
+        return self.get_bigquery_service()
+    
+    @property
+    def firebase_service(self):
+        return self.get_firebase_service()
+    
     @property
     def usuarios(self):
         return self.get_usuarios_controller()
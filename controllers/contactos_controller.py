@@ -24,6 +24,10 @@ class ContactosController:
         """Obtener lista de contactos"""
         return self.service.get_contactos(cliente_rol)
     
+    def get_contactos_snapshot(self) -> Optional[List[Contacto]]:
+        """Obtener contactos guardados localmente (None si no hay snapshot)"""
+        return self.service.get_contactos_snapshot()
+    
     def get_contacto_by_email(self, email: str) -> Optional[Contacto]:
         """Obtener contacto por email"""
         return self.service.get_contacto_by_email(email)
@@ -36,6 +40,10 @@ class ContactosController:
         """Obtener todos los contactos agrupados por instalación"""
         return self.service.get_todos_contactos_por_instalacion()
     
+    def get_todos_contactos_por_instalacion_snapshot(self) -> Optional[Dict[str, List[Contacto]]]:
+        """Obtener el mapa instalación -> contactos guardado localmente"""
+        return self.service.get_todos_contactos_por_instalacion_snapshot()
+    
     def get_contactos_usuario(self, email: str, instalacion_rol: str) -> List[str]:
         """Obtener contactos asignados a un usuario para una instalación"""
         return self.service.get_contactos_usuario(email, instalacion_rol)
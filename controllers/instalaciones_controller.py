@@ -4,6 +4,7 @@ Controlador para gestión de instalaciones
 from typing import List, Optional, Dict, Any
 # Importación removida para inicialización perezosa
 from models.instalacion_model import Instalacion, InstalacionUsuario
+from services.instalaciones_index import InstalacionesIndex
 
 
 class InstalacionesController:
@@ -24,6 +25,10 @@ class InstalacionesController:
         """Obtener lista de instalaciones"""
         return self.service.get_instalaciones(cliente_rol)
     
+    def get_instalaciones_snapshot(self) -> Optional[List[Instalacion]]:
+        """Obtener instalaciones guardadas localmente (None si no hay snapshot)"""
+        return self.service.get_instalaciones_snapshot()
+    
     def get_instalaciones_con_zonas(self, cliente_rol: Optional[str] = None) -> List[Instalacion]:
         """Obtener instalaciones con información de zonas"""
         return self.service.get_instalaciones_con_zonas(cliente_rol)
@@ -60,6 +65,10 @@ class InstalacionesController:
         """Desasignar instalaciones de un usuario"""
         return self.service.desasignar_instalaciones_usuario(email, instalaciones_roles)
     
+    def get_indice(self, revalidar: bool = True) -> InstalacionesIndex:
+        """Obtener índice zona -> cliente -> instalación (revalidar=False: el ya cargado)"""
+        return self.service.get_indice(revalidar)
+    
     def get_zonas(self) -> List[str]:
         """Obtener lista de zonas disponibles"""
         return self.service.get_zonas()
@@ -71,15 +80,8 @@ class InstalacionesController:
     def get_instalaciones_filtradas(self, zona: Optional[str] = None, cliente: Optional[str] = None) -> List[Instalacion]:
         """Obtener instalaciones filtradas por zona y/o cliente"""
         try:
-            instalaciones = self.service.get_instalaciones()
-            
-            if zona:
-                instalaciones = [inst for inst in instalaciones if inst.zona == zona]
-            
-            if cliente:
-                instalaciones = [inst for inst in instalaciones if inst.cliente_rol == cliente]
-            
-            return instalaciones
+            # Filtro en memoria sobre el índice ya cargado
+            return self.service.get_indice(revalidar=False).seleccionar(zona or None, cliente or None)
             
         except Exception as e:
             print(f"Error al filtrar instalaciones: {e}")
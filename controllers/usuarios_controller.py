@@ -24,6 +24,14 @@ class UsuariosController:
         """Obtener lista de usuarios"""
         return self.service.get_usuarios(cliente_rol)
     
+    def enriquecer_con_firebase(self, usuarios: List[Usuario]) -> List[Usuario]:
+        """Completar usuarios con el estado real de sus cuentas de Firebase"""
+        return self.service.enriquecer_con_firebase(usuarios)
+    
+    def get_usuarios_snapshot(self) -> Optional[List[Usuario]]:
+        """Obtener usuarios guardados localmente (None si no hay snapshot)"""
+        return self.service.get_usuarios_snapshot()
+    
     def get_usuario_by_email(self, email: str) -> Optional[Usuario]:
         """Obtener usuario por email"""
         return self.service.get_usuario_by_email(email)
@@ -54,6 +62,10 @@ class UsuariosController:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def crear_usuarios_masivo(self, usuarios: List[Dict[str, Any]], progreso=None) -> Dict[str, Any]:
+        """Crear usuarios validados de una carga masiva (Firebase en paralelo + BigQuery por lotes)"""
+        return self.service.crear_usuarios_masivo(usuarios, progreso)
+    
     def update_usuario(self, email: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Actualizar usuario"""
         return self.service.update_usuario(email, updates)
@@ -66,10 +78,31 @@ class UsuariosController:
         """Activar/desactivar usuario"""
         return self.service.toggle_usuario_activo(email, activo)
     
+    def toggle_usuarios_activo(self, usuarios: List[Usuario], activo: bool) -> Dict[str, Any]:
+        """Activar/desactivar varios usuarios a la vez"""
+        return self.service.toggle_usuarios_activo(usuarios, activo)
+    
+    def cambiar_rol_usuarios(self, emails: List[str], rol_id: str) -> Dict[str, Any]:
+        """Cambiar el rol de varios usuarios a la vez"""
+        return self.service.cambiar_rol_usuarios(emails, rol_id)
+    
+    def asignar_instalaciones_usuarios(self, emails: List[str],
+                                       instalaciones_con_cliente: Dict[str, str]) -> Dict[str, Any]:
+        """Otorgar instalaciones a varios usuarios a la vez"""
+        return self.service.asignar_instalaciones_usuarios(emails, instalaciones_con_cliente)
+    
+    def delete_usuarios(self, usuarios: List[Usuario]) -> Dict[str, Any]:
+        """Eliminar varios usuarios a la vez"""
+        return self.service.delete_usuarios(usuarios)
+    
     def get_roles(self) -> List[Dict[str, Any]]:
         """Obtener lista de roles disponibles"""
         return self.service.get_roles()
     
+    def get_roles_snapshot(self) -> Optional[List[Dict[str, Any]]]:
+        """Obtener roles guardados localmente (None si no hay snapshot)"""
+        return self.service.get_roles_snapshot()
+    
     def update_rol_usuario(self, email: str, rol_id: str) -> Dict[str, Any]:
         """Actualizar rol de usuario"""
         return self.service.update_rol_usuario(email, rol_id)
@@ -6,7 +6,7 @@ from PySide6.QtWidgets import QApplication, QMessageBox
 from PySide6.QtCore import Qt
 from ui.login_window import LoginWindow
 from ui.main_window_refactored import MainWindow
-from services.firebase_service import FirebaseService
+from config.architecture import controllers
 from config.settings import APP_VERSION
 
 
@@ -31,7 +31,7 @@ class PanelAdminApp:
         
         self.login_window = None
         self.main_window = None
-        self.firebase_service = FirebaseService()
+        self.firebase_service = controllers.get_firebase_service()
     
     def run(self):
         """Ejecutar aplicación"""
@@ -61,6 +61,8 @@ class PanelAdminApp:
             # Mostrar ventana principal refactorizada
             self.main_window = MainWindow(usuario_data)
             self.main_window.show()
+            # Llenar el cache compartido en segundo plano mientras se muestra la ventana
+            self.main_window.iniciar_precarga()
             
             print(f"✅ Usuario logueado: {usuario_data.get('email_login', 'N/A')}")
             print(f"🏗️ Arquitectura refactorizada v{APP_VERSION}")
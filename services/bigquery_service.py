@@ -2,11 +2,89 @@
 Servicio de BigQuery - CRUD de datos
 """
 from google.cloud import bigquery
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
+import functools
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+import threading
 import uuid
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from config.settings import *
+from services.dml_scheduler import DmlScheduler
+from services.freshness import FreshnessOracle
+from services.query_cache import QueryCache
+from services.snapshot_store import SnapshotStore
+from services.write_queue import WriteQueue
+
+
+def _safe_str(value):
+    """Limpiar cadenas con caracteres que no se pueden codificar"""
+    if value is None:
+        return None
+    try:
+        # Si ya es string, verificar codificación
+        if isinstance(value, str):
+            # Intentar codificar y decodificar para limpiar
+            return value.encode('utf-8', errors='ignore').decode('utf-8')
+        else:
+            # Convertir a string y limpiar
+            return str(value).encode('utf-8', errors='ignore').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError, AttributeError):
+        # Fallback: convertir a string y limpiar caracteres problemáticos
+        try:
+            return str(value).encode('ascii', errors='ignore').decode('ascii')
+        except Exception:
+            return str(value)
+
+
+def _struct_array_param(nombre: str, campos: List[tuple], filas: List[Dict]):
+    """Parámetro ARRAY<STRUCT> para escrituras por conjuntos (`FROM UNNEST(@nombre)`)
+
+    Args:
+        campos: lista de (campo, tipo BigQuery) en el orden del STRUCT
+        filas: diccionarios con al menos esos campos
+    """
+    # Tipo explícito: permite enviar un arreglo vacío
+    tipo_struct = bigquery.StructQueryParameterType(*[
+        bigquery.ScalarQueryParameterType(tipo, name=campo) for campo, tipo in campos
+    ])
+    return bigquery.ArrayQueryParameter(nombre, tipo_struct, [
+        bigquery.StructQueryParameter(None, *[
+            bigquery.ScalarQueryParameter(campo, tipo, fila.get(campo)) for campo, tipo in campos
+        ])
+        for fila in filas
+    ])
+
+
+def _escritura(*tablas: str, parche: Optional[str] = None):
+    """Declarar las tablas que modifica un método de escritura.
+
+    La escritura pasa por el planificador DML: espera el turno de `tablas` y se
+    reintenta si BigQuery la rechaza por un conflicto de concurrencia.
+    
+    Si la escritura es exitosa se aplica, todavía dentro del turno, el método
+    `parche` (mismos argumentos precedidos por el resultado) para actualizar el
+    cache en sitio; si no hay parche, éste devuelve False o la escritura falla,
+    se invalidan solo las entradas que dependen de `tablas`.
+    """
+    def decorador(metodo):
+        @functools.wraps(metodo)
+        def envoltura(self, *args, **kwargs):
+            try:
+                return self._dml.ejecutar(
+                    tablas, lambda: metodo(self, *args, **kwargs),
+                    al_terminar=lambda resultado: self._tras_escritura(tablas, parche, resultado, args, kwargs)
+                )
+            except Exception:
+                self._retirar_vuelos(tablas)
+                self._cache.invalidate_tables(*tablas)
+                raise
+        envoltura.tablas_escritura = tablas
+        return envoltura
+    return decorador
 
 
 class BigQueryService:
@@ -15,93 +93,307 @@ class BigQueryService:
     def __init__(self):
         """Inicializar servicio de BigQuery"""
         self._client = None
-        # Cache en memoria para mejorar rendimiento
-        self._roles_cache = None
-        self._usuarios_cache = {}  # Cache por cliente_rol
-        self._cache_timestamp = None
-        self._cache_duration = 300  # 5 minutos
-        self._instalaciones_cache = None
-        self._contactos_instalacion_cache = None
+        self._client_lock = threading.Lock()
+        # Cache en memoria con vigencia por clave e invalidación por tabla
+        self._cache = QueryCache(max_entradas=CACHE_MAX_ENTRADAS, ttl_defecto=CACHE_TTL_DEFECTO)
+        # Al vencer una entrada solo se vuelve a consultar si sus tablas cambiaron
+        self._frescura = FreshnessOracle(lambda: self.client, TABLAS, FRESCURA_INTERVALO)
+        self._cache.frescura = self._frescura
+        # Escrituras ordenadas por tabla (límites de DML concurrente de BigQuery)
+        self._dml = DmlScheduler(DML_MAX_CONCURRENTES, DML_REINTENTOS, DML_ESPERA_BASE)
+        # Último resultado de las consultas principales en disco (arranque en frío)
+        self._snapshots = None
+        # Escrituras diferidas que se reintentan en segundo plano
+        self._pendientes = None
+        # Consultas en curso por (SQL, parámetros): las idénticas comparten un job
+        self._vuelos: Dict[tuple, Dict] = {}
+        self._vuelos_lock = threading.Lock()
+        self._consultas_compartidas = 0
     
     @property
     def client(self):
         """Obtener cliente de BigQuery (inicialización perezosa)"""
         if self._client is None:
-            try:
-                # Configurar credenciales si no están configuradas
-                if not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
-                    # Buscar archivo de credenciales en directorios conocidos:
-                    # - Directorio de trabajo
-                    # - Directorio del ejecutable (cuando está congelado con PyInstaller)
-                    # - BASE_DIR del proyecto
-                    creds_candidates = [
-                        'worldwide-470917-f19e4e7e3cf6.json',
-                        'worldwide-470917-b0939d44c1ae.json',
-                        'service-account.json',
-                        'credentials.json'
-                    ]
-                    search_dirs = [os.getcwd()]
-                    try:
-                        import sys as _sys
-                        exe_dir = os.path.dirname(_sys.executable)
-                        if exe_dir and exe_dir not in search_dirs:
-                            search_dirs.append(exe_dir)
-                    except Exception:
-                        pass
+            # Varias tareas en segundo plano pueden pedir el cliente a la vez
+            with self._client_lock:
+                if self._client is None:
                     try:
-                        if 'BASE_DIR' in globals():
-                            search_dirs.append(str(BASE_DIR))
-                    except Exception:
-                        pass
-                    found = False
-                    for d in search_dirs:
-                        for name in creds_candidates:
-                            candidate = os.path.join(d, name)
-                            if os.path.exists(candidate):
-                                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.abspath(candidate)
-                                print(f"✅ Credenciales configuradas: {candidate}")
-                                found = True
-                                break
-                        if found:
-                            break
-                    if not found:
-                        print("⚠️ No se encontró archivo de credenciales")
+                        # Configurar credenciales si no están configuradas
+                        if not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
+                            # Buscar archivo de credenciales en directorios conocidos:
+                            # - Directorio de trabajo
+                            # - Directorio del ejecutable (cuando está congelado con PyInstaller)
+                            # - BASE_DIR del proyecto
+                            creds_candidates = [
+                                'worldwide-470917-f19e4e7e3cf6.json',
+                                'worldwide-470917-b0939d44c1ae.json',
+                                'service-account.json',
+                                'credentials.json'
+                            ]
+                            search_dirs = [os.getcwd()]
+                            try:
+                                import sys as _sys
+                                exe_dir = os.path.dirname(_sys.executable)
+                                if exe_dir and exe_dir not in search_dirs:
+                                    search_dirs.append(exe_dir)
+                            except Exception:
+                                pass
+                            try:
+                                if 'BASE_DIR' in globals():
+                                    search_dirs.append(str(BASE_DIR))
+                            except Exception:
+                                pass
+                            found = False
+                            for d in search_dirs:
+                                for name in creds_candidates:
+                                    candidate = os.path.join(d, name)
+                                    if os.path.exists(candidate):
+                                        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.path.abspath(candidate)
+                                        print(f"✅ Credenciales configuradas: {candidate}")
+                                        found = True
+                                        break
+                                if found:
+                                    break
+                            if not found:
+                                print("⚠️ No se encontró archivo de credenciales")
                 
-                # Configurar codificación UTF-8 para Windows
-                import locale
-                import sys
-                if os.name == 'nt':  # Windows
-                    os.environ['PYTHONIOENCODING'] = 'utf-8'
-                    # Configurar stdout y stderr para UTF-8
-                    sys.stdout.reconfigure(encoding='utf-8')
-                    sys.stderr.reconfigure(encoding='utf-8')
-                    try:
-                        locale.setlocale(locale.LC_ALL, 'es_ES.UTF-8')
-                    except locale.Error:
-                        # Fallback si no está disponible
-                        locale.setlocale(locale.LC_ALL, 'C.UTF-8')
+                        # Configurar codificación UTF-8 para Windows
+                        import locale
+                        import sys
+                        if os.name == 'nt':  # Windows
+                            os.environ['PYTHONIOENCODING'] = 'utf-8'
+                            # Configurar stdout y stderr para UTF-8
+                            sys.stdout.reconfigure(encoding='utf-8')
+                            sys.stderr.reconfigure(encoding='utf-8')
+                            try:
+                                locale.setlocale(locale.LC_ALL, 'es_ES.UTF-8')
+                            except locale.Error:
+                                # Fallback si no está disponible
+                                locale.setlocale(locale.LC_ALL, 'C.UTF-8')
                 
-                self._client = bigquery.Client(project=PROJECT_ID)
-                print("✅ Cliente de BigQuery inicializado correctamente")
-            except Exception as e:
-                print(f"⚠️ Error al conectar con BigQuery: {e}")
-                print("💡 Asegúrate de tener las credenciales de Google Cloud configuradas")
-                raise e
+                        self._client = bigquery.Client(project=PROJECT_ID)
+                        print("✅ Cliente de BigQuery inicializado correctamente")
+                    except Exception as e:
+                        print(f"⚠️ Error al conectar con BigQuery: {e}")
+                        print("💡 Asegúrate de tener las credenciales de Google Cloud configuradas")
+                        raise e
         return self._client
     
-    def _is_cache_valid(self) -> bool:
-        """Verificar si el cache es válido"""
-        if not self._cache_timestamp:
-            return False
-        return (datetime.now() - self._cache_timestamp).seconds < self._cache_duration
+    @property
+    def cache(self) -> QueryCache:
+        """Cache de consultas compartido por todos los métodos get_*"""
+        return self._cache
     
     def clear_cache(self):
         """Limpiar cache manualmente"""
-        self._roles_cache = None
-        self._usuarios_cache = {}  # Limpiar cache por cliente
-        self._instalaciones_cache = None
-        self._contactos_instalacion_cache = None
-        self._cache_timestamp = None
+        self._cache.clear()
+    
+    def invalidate_tables(self, *tablas: str) -> int:
+        """Invalidar solo las entradas del cache que dependen de las tablas indicadas"""
+        return self._cache.invalidate_tables(*tablas)
+    
+    def revalidar(self) -> List[str]:
+        """Releer los metadatos de todas las tablas e invalidar solo lo que cambió.
+        
+        Reemplaza a clear_cache en "Sincronizar": si nada cambió, el cache se conserva.
+        """
+        cambiadas = self._frescura.actualizar(forzar=True)
+        if cambiadas:
+            self._cache.invalidate_tables(*cambiadas)
+        print(f"[FRESCURA] Tablas modificadas: {len(cambiadas)} de {len(self._frescura.tablas)}")
+        return sorted(cambiadas)
+    
+    def dml_stats(self) -> Dict:
+        """Estadísticas del planificador de escrituras"""
+        return self._dml.stats()
+    
+    def cache_stats(self) -> Dict:
+        """Obtener contadores de hits/misses del cache (y consultas compartidas en vuelo)"""
+        return dict(self._cache.stats(), compartidas=self._consultas_compartidas)
+    
+    def _consultar(self, query: str, job_config: Optional[bigquery.QueryJobConfig] = None) -> List:
+        """
+        Ejecutar una consulta de lectura y devolver sus filas.
+        
+        Las llamadas simultáneas con el mismo SQL y parámetros comparten un único job
+        (single-flight): la primera lo ejecuta y las demás esperan su resultado, como
+        máximo CONSULTA_ESPERA_COMPARTIDA segundos (luego ejecutan el suyo). Una escritura
+        retira los jobs en curso sobre sus tablas (`_retirar_vuelos`): quien llega después
+        no recibe filas leídas antes de ella.
+        """
+        parametros = job_config.query_parameters if job_config is not None else []
+        clave = (query, json.dumps([p.to_api_repr() for p in parametros], sort_keys=True, default=str))
+        with self._vuelos_lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = {'listo': threading.Event(), 'filas': None, 'error': None}
+            else:
+                self._consultas_compartidas += 1
+        
+        if lider:
+            try:
+                vuelo['filas'] = list(self.client.query(query, job_config=job_config).result())
+            except Exception as e:
+                vuelo['error'] = e
+            finally:
+                with self._vuelos_lock:
+                    if self._vuelos.get(clave) is vuelo:
+                        del self._vuelos[clave]
+                vuelo['listo'].set()
+        elif not vuelo['listo'].wait(CONSULTA_ESPERA_COMPARTIDA):
+            print(f"[BQ] Job compartido sin respuesta tras {CONSULTA_ESPERA_COMPARTIDA}s: se ejecuta uno propio")
+            return list(self.client.query(query, job_config=job_config).result())
+        
+        if vuelo['error'] is not None:
+            raise vuelo['error']
+        return vuelo['filas']
+    
+    def _retirar_vuelos(self, tablas: tuple) -> None:
+        """Sacar del single-flight los jobs en curso que leen `tablas` (siguen para quien ya espera)"""
+        marcas = [f"`{tabla}`" for tabla in tablas]
+        with self._vuelos_lock:
+            for clave in [c for c in self._vuelos if any(m in c[0] for m in marcas)]:
+                del self._vuelos[clave]
+    
+    @property
+    def snapshots(self) -> Optional[SnapshotStore]:
+        """Almacén local de snapshots (None si no se pudo abrir)"""
+        if self._snapshots is None:
+            try:
+                self._snapshots = SnapshotStore(SNAPSHOT_DB_PATH, SNAPSHOT_SCHEMA_VERSION)
+            except Exception as e:
+                print(f"[SNAPSHOT] Almacén local no disponible: {e}")
+                self._snapshots = False
+        return self._snapshots or None
+    
+    def get_snapshot(self, clave: str):
+        """Último resultado guardado en disco de una consulta, o None si no hay"""
+        store = self.snapshots
+        if store is None:
+            return None
+        guardado = store.cargar(clave)
+        return guardado[0] if guardado else None
+    
+    def _guardar_snapshot(self, clave: str, valor) -> None:
+        store = self.snapshots
+        if store is not None:
+            store.guardar(clave, valor)
+    
+    @property
+    def pendientes(self) -> Optional[WriteQueue]:
+        """Cola local de escrituras diferidas (None si no se pudo abrir)"""
+        if self._pendientes is None:
+            try:
+                self._pendientes = WriteQueue(PENDIENTES_DB_PATH)
+            except Exception as e:
+                print(f"[PENDIENTES] Cola local no disponible: {e}")
+                self._pendientes = False
+        return self._pendientes or None
+    
+    def _diferir(self, clave: str, tipo: str, datos: Dict) -> bool:
+        """Guardar una escritura para reintentarla cuando las filas salgan del streaming buffer"""
+        cola = self.pendientes
+        if cola is None:
+            return False
+        try:
+            cola.encolar(clave, tipo, datos, PENDIENTES_DEMORA)
+            print(f"[PENDIENTES] '{clave}' diferida {PENDIENTES_DEMORA}s")
+            return True
+        except Exception as e:
+            print(f"[PENDIENTES] No se pudo diferir '{clave}': {e}")
+            return False
+    
+    def _descartar_pendiente(self, clave: str) -> None:
+        """Olvidar una escritura diferida que otra escritura posterior ya dejó aplicada"""
+        cola = self.pendientes
+        if cola is not None:
+            try:
+                cola.completar(clave)
+            except Exception as e:
+                print(f"[PENDIENTES] No se pudo descartar '{clave}': {e}")
+    
+    def estado_pendientes(self) -> Dict:
+        """Cantidad de escrituras diferidas, próximo intento y último error"""
+        cola = self.pendientes
+        if cola is None:
+            return {'cantidad': 0, 'proximo_intento': None, 'ultimo_error': None}
+        return cola.estado()
+    
+    def procesar_pendientes(self) -> Dict:
+        """
+        Reintentar las escrituras diferidas cuyo plazo venció.
+        
+        Las que vuelven a fallar se posponen con espera creciente (hasta
+        PENDIENTES_DEMORA_MAXIMA); nunca se descartan sin aplicarse.
+        
+        Returns:
+            Dict con 'aplicadas' y el estado actual de la cola
+        """
+        cola = self.pendientes
+        if cola is None:
+            return dict(self.estado_pendientes(), aplicadas=0)
+        
+        aplicadores = {
+            'instalaciones_contacto': lambda d: self._aplicar_instalaciones_contacto(d['contacto_id'], d['filas']),
+            'borrar_contactos': lambda d: self._borrar_contactos(d['contactos']),
+        }
+        aplicadas = 0
+        for entrada in cola.vencidas():
+            aplicar = aplicadores.get(entrada['tipo'])
+            if aplicar is None:
+                cola.reprogramar(entrada['clave'], f"Tipo desconocido: {entrada['tipo']}", PENDIENTES_DEMORA_MAXIMA)
+                continue
+            try:
+                resultado = aplicar(entrada['datos'])
+            except Exception as e:
+                resultado = {'success': False, 'error': str(e)}
+            if resultado.get('success'):
+                # Si entretanto se encoló un estado más reciente, éste queda pendiente
+                cola.completar(entrada['clave'], entrada['datos'])
+                aplicadas += 1
+                print(f"[PENDIENTES] '{entrada['clave']}' aplicada")
+            else:
+                demora = min(PENDIENTES_DEMORA * 2 ** entrada['intentos'], PENDIENTES_DEMORA_MAXIMA)
+                cola.reprogramar(entrada['clave'], resultado.get('error', ''), demora)
+        return dict(cola.estado(), aplicadas=aplicadas)
+    
+    def precalentar(self, progreso=None) -> Dict[str, bool]:
+        """
+        Ejecutar en paralelo (un job de BigQuery cada una) las consultas que usan las
+        pestañas para dejar el cache compartido lleno tras el login.
+        
+        Args:
+            progreso: callback opcional progreso(porcentaje, mensaje)
+            
+        Returns:
+            Dict nombre de consulta -> True si su resultado quedó en el cache
+        """
+        # Los get_* capturan sus errores y devuelven []/{} sin cachear: el éxito se
+        # comprueba por la clave que cada consulta deja en el cache
+        consultas = {
+            'roles': (self.get_roles, "roles"),
+            'usuarios': (self.get_usuarios_con_roles, "usuarios_con_roles:all"),
+            'instalaciones': (self.get_instalaciones_con_zonas, "instalaciones_con_zonas:all"),
+            'contactos': (self.get_contactos, "contactos:all"),
+            'contactos por instalación': (self.get_todos_contactos_por_instalacion, "todos_contactos_por_instalacion"),
+        }
+        resultado = {}
+        with ThreadPoolExecutor(max_workers=len(consultas)) as pool:
+            futuros = {pool.submit(funcion): nombre for nombre, (funcion, _) in consultas.items()}
+            for i, futuro in enumerate(as_completed(futuros), start=1):
+                nombre = futuros[futuro]
+                try:
+                    futuro.result()
+                    resultado[nombre] = self._cache.peek(consultas[nombre][1]) is not None
+                    if not resultado[nombre]:
+                        print(f"[PRECALENTAR] Error cargando {nombre}: la consulta falló")
+                except Exception as e:
+                    print(f"[PRECALENTAR] Error cargando {nombre}: {e}")
+                    resultado[nombre] = False
+                if progreso:
+                    progreso(int(i * 100 / len(consultas)), f"Cargado: {nombre}")
+        return resultado
     
     # ============================================
     # USUARIOS
@@ -109,6 +401,11 @@ class BigQueryService:
     
     def get_usuarios(self, cliente_rol: Optional[str] = None) -> List[Dict]:
         """Obtener lista de usuarios"""
+        cache_key = f"usuarios:{cliente_rol or 'all'}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT 
                 email_login,
@@ -129,9 +426,12 @@ class BigQueryService:
         
         query += " ORDER BY nombre_completo"
         
-        results = self.client.query(query).result()
-        return [dict(row) for row in results]
+        results = self._consultar(query)
+        usuarios = [dict(row) for row in results]
+        self._cache.set(cache_key, usuarios, tablas=(TABLE_USUARIOS,), ttl=CACHE_TTL_USUARIOS)
+        return usuarios
     
+    @_escritura(TABLE_USUARIOS, parche="_parche_create_usuario")
     def create_usuario(self, email: str, firebase_uid: str, cliente_rol: str,
                       nombre_completo: str, rol_id: str = "CLIENTE", cargo: str = None, 
                       telefono: str = None, ver_todas_instalaciones: bool = False) -> Dict:
@@ -164,11 +464,122 @@ class BigQueryService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @_escritura(TABLE_USUARIOS, TABLE_USUARIO_INST, TABLE_CONTACTOS, TABLE_INST_CONTACTO)
+    def crear_usuarios_lote(self, usuarios: List[Dict]) -> Dict:
+        """
+        Crear un lote de usuarios (ya creados en Firebase) con sus instalaciones y,
+        si corresponde, su contacto, en un único script transaccional de BigQuery.
+        
+        Args:
+            usuarios: dicts con email, firebase_uid, cliente_rol, nombre, rol, cargo, telefono,
+                      es_contacto ('SI'/'NO') e instalaciones_con_cliente {instalacion_rol: cliente_rol}
+        """
+        if not usuarios:
+            return {'success': True, 'creados': 0}
+        
+        filas_usuarios, filas_inst, filas_contactos, filas_inst_contacto = [], [], [], []
+        for u in usuarios:
+            filas_usuarios.append({
+                'email': u['email'], 'firebase_uid': u['firebase_uid'], 'cliente_rol': u.get('cliente_rol'),
+                'nombre': u.get('nombre'), 'rol_id': u.get('rol') or 'CLIENTE',
+                'cargo': u.get('cargo'), 'telefono': u.get('telefono'),
+            })
+            instalaciones = u.get('instalaciones_con_cliente') or {}
+            for instalacion_rol, cliente_rol in instalaciones.items():
+                filas_inst.append({'email': u['email'], 'cliente_rol': cliente_rol, 'instalacion_rol': instalacion_rol})
+            if u.get('es_contacto') == 'SI':
+                contacto_id = str(uuid.uuid4())
+                filas_contactos.append({
+                    'contacto_id': contacto_id, 'nombre': u.get('nombre'), 'telefono': u.get('telefono'),
+                    'cargo': u.get('cargo'), 'email': u['email'],
+                })
+                for instalacion_rol, cliente_rol in instalaciones.items():
+                    filas_inst_contacto.append({'contacto_id': contacto_id, 'cliente_rol': cliente_rol,
+                                                'instalacion_rol': instalacion_rol})
+        
+        # (sentencia, nombre de la fuente, campos, filas); solo las que tienen filas
+        escrituras = [
+            (f"""
+                INSERT INTO `{TABLE_USUARIOS}`
+                (email_login, firebase_uid, cliente_rol, nombre_completo, rol_id, cargo, telefono,
+                 activo, ver_todas_instalaciones, fecha_creacion)
+                SELECT email, firebase_uid, cliente_rol, nombre, rol_id, cargo, telefono,
+                       TRUE, FALSE, CURRENT_TIMESTAMP()
+                FROM {{fuente}}
+            """, "usuarios", [
+                ('email', 'STRING'), ('firebase_uid', 'STRING'), ('cliente_rol', 'STRING'), ('nombre', 'STRING'),
+                ('rol_id', 'STRING'), ('cargo', 'STRING'), ('telefono', 'STRING'),
+            ], filas_usuarios),
+            (f"""
+                INSERT INTO `{TABLE_USUARIO_INST}`
+                (email_login, cliente_rol, instalacion_rol, puede_ver, requiere_encuesta_individual)
+                SELECT email, cliente_rol, instalacion_rol, TRUE, FALSE
+                FROM {{fuente}}
+            """, "instalaciones", [
+                ('email', 'STRING'), ('cliente_rol', 'STRING'), ('instalacion_rol', 'STRING'),
+            ], filas_inst),
+            (f"""
+                INSERT INTO `{TABLE_CONTACTOS}`
+                (contacto_id, nombre_contacto, telefono, cargo, email,
+                 activo, fecha_creacion, es_usuario_app, email_usuario_app)
+                SELECT contacto_id, nombre, telefono, cargo, email,
+                       TRUE, CURRENT_TIMESTAMP(), TRUE, email
+                FROM {{fuente}}
+            """, "contactos", [
+                ('contacto_id', 'STRING'), ('nombre', 'STRING'), ('telefono', 'STRING'),
+                ('cargo', 'STRING'), ('email', 'STRING'),
+            ], filas_contactos),
+            (f"""
+                INSERT INTO `{TABLE_INST_CONTACTO}` (cliente_rol, instalacion_rol, contacto_id)
+                SELECT cliente_rol, instalacion_rol, contacto_id
+                FROM {{fuente}}
+            """, "instalaciones_contacto", [
+                ('contacto_id', 'STRING'), ('cliente_rol', 'STRING'), ('instalacion_rol', 'STRING'),
+            ], filas_inst_contacto),
+        ]
+        
+        try:
+            # Lotes grandes pasan por tablas temporales (load job); el script es siempre un solo job
+            with ExitStack() as pila:
+                sentencias, parametros = [], []
+                for sentencia, nombre, campos, filas in escrituras:
+                    if not filas:
+                        continue
+                    fuente, params = pila.enter_context(self._origen_filas(nombre, campos, filas))
+                    sentencias.append(sentencia.format(fuente=fuente))
+                    parametros.extend(params)
+                
+                script = "BEGIN TRANSACTION;\n" + ";\n".join(sentencias) + ";\nCOMMIT TRANSACTION;"
+                job_config = bigquery.QueryJobConfig(query_parameters=parametros)
+                self.client.query(script, job_config=job_config).result()
+            return {'success': True, 'creados': len(filas_usuarios)}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
     def update_usuario(self, email: str, **campos) -> Dict:
-        """Actualizar un usuario"""
-        set_clauses = []
-        parameters = [bigquery.ScalarQueryParameter("email", "STRING", email)]
+        """Actualizar un usuario
         
+        Las actualizaciones con los mismos campos y valores que esperan turno sobre la
+        tabla (p.ej. desactivar varios usuarios seguidos) se agrupan en un solo UPDATE.
+        """
+        clave = ("update_usuarios", tuple(sorted(campos.items())))
+        result = self._dml.agrupar(
+            (TABLE_USUARIOS,), clave, email,
+            lambda emails: self.update_usuarios(emails, **campos)
+        )
+        if result.get('success'):
+            return {'success': True, 'message': 'Usuario actualizado'}
+        return result
+    
+    @_escritura(TABLE_USUARIOS, parche="_parche_update_usuarios")
+    def update_usuarios(self, emails: List[str], **campos) -> Dict:
+        """Actualizar los mismos campos de varios usuarios con un único UPDATE"""
+        emails = list(dict.fromkeys(emails))
+        if not emails or not campos:
+            return {'success': True, 'message': 'Sin usuarios para actualizar', 'actualizados': 0}
+
+        set_clauses = []
+        parameters = [bigquery.ArrayQueryParameter("emails", "STRING", emails)]
         for campo, valor in campos.items():
             set_clauses.append(f"{campo} = @{campo}")
             tipo = "STRING"
@@ -177,123 +588,125 @@ class BigQueryService:
             elif isinstance(valor, int):
                 tipo = "INT64"
             parameters.append(bigquery.ScalarQueryParameter(campo, tipo, valor))
-        
+
         query = f"""
             UPDATE `{TABLE_USUARIOS}`
             SET {', '.join(set_clauses)}
-            WHERE email_login = @email
+            WHERE email_login IN UNNEST(@emails)
         """
-        
+
         job_config = bigquery.QueryJobConfig(query_parameters=parameters)
-        
+
         try:
-            self.client.query(query, job_config=job_config).result()
-            return {'success': True, 'message': 'Usuario actualizado'}
+            job = self.client.query(query, job_config=job_config)
+            job.result()
+            actualizados = job.num_dml_affected_rows or 0
+            return {'success': True, 'message': f'{actualizados} usuarios actualizados', 'actualizados': actualizados}
         except Exception as e:
             return {'success': False, 'error': str(e)}
-    
+
     def delete_usuario(self, email: str) -> Dict:
         """Eliminar un usuario (marca como inactivo)"""
         return self.update_usuario(email, activo=False)
 
-    def delete_usuario_total(self, email: str) -> Dict:
-        """Eliminar completamente un usuario y sus relaciones en BigQuery.
+    @_escritura(TABLE_USUARIOS, TABLE_USUARIO_INST, TABLE_USUARIO_CONTACTOS,
+                TABLE_CONTACTOS, TABLE_INST_CONTACTO, parche="_parche_delete_usuario_total")
+    def delete_usuario_total(self, emails: Union[str, List[str]]) -> Dict:
+        """Eliminar completamente uno o varios usuarios y sus relaciones en BigQuery.
+
+        Todo se envía como un único script transaccional:
+        - Borrar filas en `usuario_instalaciones` de los emails
+        - Borrar filas en `usuario_contactos` de los emails
+        - Borrar los contactos asociados a los emails y sus asignaciones en `instalacion_contacto`
+        - Borrar los registros en `usuarios_app`
 
-        Acciones:
-        - Borrar filas en `usuario_instalaciones` del email
-        - Borrar filas en `usuario_contactos` del email (si existe la tabla)
-        - Si existe contacto asociado al email, borrar sus asignaciones en `instalacion_contacto` y el registro en `contactos`
-        - Borrar el registro en `usuarios_app`
+        Si la transacción falla por filas en streaming buffer, se reintenta sin transacción
+        tolerando esas filas: el contacto queda activo=FALSE si no se puede borrar (si tampoco
+        se puede actualizar, se deja igual) y su borrado se encola como escritura diferida.
         """
-        errors: list[str] = []
+        emails = [emails] if isinstance(emails, str) else list(emails)
+        if not emails:
+            return {"success": True, "message": "Sin usuarios para eliminar", "contactos_eliminados": []}
 
-        def exec_dml(query: str, params: list) -> None:
-            try:
-                job_config = bigquery.QueryJobConfig(query_parameters=params)
-                self.client.query(query, job_config=job_config).result()
-            except Exception as e:
-                errors.append(str(e))
+        # Los contactos se capturan antes de borrar para poder limpiar el cache
+        declarar = f"""
+            DECLARE contactos ARRAY<STRING> DEFAULT (
+                SELECT ARRAY_AGG(contacto_id) FROM `{TABLE_CONTACTOS}`
+                WHERE email_usuario_app IN UNNEST(@emails) OR email IN UNNEST(@emails)
+            );
+        """
+        borrar_inst = f"DELETE FROM `{TABLE_USUARIO_INST}` WHERE email_login IN UNNEST(@emails)"
+        borrar_permisos = f"DELETE FROM `{TABLE_USUARIO_CONTACTOS}` WHERE email_login IN UNNEST(@emails)"
+        borrar_inst_contacto = f"DELETE FROM `{TABLE_INST_CONTACTO}` WHERE contacto_id IN UNNEST(contactos)"
+        borrar_contactos = f"DELETE FROM `{TABLE_CONTACTOS}` WHERE contacto_id IN UNNEST(contactos)"
+        desactivar_contactos = f"UPDATE `{TABLE_CONTACTOS}` SET activo = FALSE WHERE contacto_id IN UNNEST(contactos)"
+        borrar_usuarios = f"DELETE FROM `{TABLE_USUARIOS}` WHERE email_login IN UNNEST(@emails)"
 
-        # 1) usuario_instalaciones
-        exec_dml(
-            f"""
-            DELETE FROM `{TABLE_USUARIO_INST}`
-            WHERE email_login = @email
-            """,
-            [bigquery.ScalarQueryParameter("email", "STRING", email)],
-        )
+        script = f"""
+            {declarar}
+            BEGIN TRANSACTION;
+            {borrar_inst};
+            {borrar_permisos};
+            {borrar_inst_contacto};
+            {borrar_contactos};
+            {borrar_usuarios};
+            COMMIT TRANSACTION;
+            SELECT contactos, CAST([] AS ARRAY<STRING>) AS errores;
+        """
 
-        # 2) usuario_contactos (si existe)
-        try:
-            exec_dml(
-                f"""
-                DELETE FROM `{TABLE_USUARIO_CONTACTOS}`
-                WHERE email_login = @email
-                """,
-                [bigquery.ScalarQueryParameter("email", "STRING", email)],
-            )
-        except Exception as e:
-            # Tabla puede no existir, registrar pero continuar
-            errors.append(f"usuario_contactos: {e}")
+        def registrar(sentencia: str, tolerar_buffer: bool = False) -> str:
+            condicion = "STRPOS(LOWER(@@error.message), 'streaming buffer') = 0" if tolerar_buffer else "TRUE"
+            return f"""
+            BEGIN
+                {sentencia};
+            EXCEPTION WHEN ERROR THEN
+                IF {condicion} THEN SET errores = ARRAY_CONCAT(errores, [@@error.message]); END IF;
+            END;"""
+
+        script_diferido = f"""
+            {declarar}
+            DECLARE errores ARRAY<STRING> DEFAULT [];
+            {registrar(borrar_inst)}
+            {registrar(borrar_permisos)}
+            {registrar(borrar_inst_contacto, tolerar_buffer=True)}
+            BEGIN
+                {borrar_contactos};
+            EXCEPTION WHEN ERROR THEN
+                -- El UPDATE choca con el mismo streaming buffer: el borrado queda en la cola
+                {registrar(desactivar_contactos, tolerar_buffer=True)}
+            END;
+            {registrar(borrar_usuarios)}
+            SELECT contactos, errores;
+        """
 
-        # 3) contactos e instalacion_contacto
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("emails", "STRING", emails)]
+        )
+        diferido = False
         try:
-            contacto = self.get_contacto_por_email(email)
-        except Exception:
-            contacto = None
-        if contacto and contacto.get("contacto_id"):
-            contacto_id = contacto["contacto_id"]
-            # Borrar asignaciones de instalaciones del contacto
             try:
-                exec_dml(
-                    f"""
-                    DELETE FROM `{TABLE_INST_CONTACTO}`
-                    WHERE contacto_id = @contacto_id
-                    """,
-                    [bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id)],
-                )
+                filas = list(self.client.query(script, job_config=job_config).result())
             except Exception as e:
-                # Si hay streaming buffer, no bloquear la eliminación total; se limpiará en sincronizaciones futuras
                 if 'streaming buffer' not in str(e).lower():
-                    errors.append(str(e))
-            # Borrar el registro de contacto (si falla por buffer, lo dejamos activo=False como fallback)
-            try:
-                exec_dml(
-                    f"""
-                    DELETE FROM `{TABLE_CONTACTOS}`
-                    WHERE contacto_id = @contacto_id
-                    """,
-                    [bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id)],
-                )
-            except Exception as e:
-                if 'streaming buffer' in str(e).lower():
-                    # Fallback: marcar inactivo
-                    try:
-                        exec_dml(
-                            f"""
-                            UPDATE `{TABLE_CONTACTOS}`
-                            SET activo = FALSE
-                            WHERE contacto_id = @contacto_id
-                            """,
-                            [bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id)],
-                        )
-                    except Exception as e2:
-                        errors.append(str(e2))
-                else:
-                    errors.append(str(e))
-
-        # 4) usuarios_app
-        exec_dml(
-            f"""
-            DELETE FROM `{TABLE_USUARIOS}`
-            WHERE email_login = @email
-            """,
-            [bigquery.ScalarQueryParameter("email", "STRING", email)],
-        )
+                    raise
+                print("[USUARIOS] Filas en streaming buffer: eliminación sin transacción")
+                filas = list(self.client.query(script_diferido, job_config=job_config).result())
+                diferido = True
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-        if errors:
-            return {"success": False, "error": "; ".join(errors)}
-        return {"success": True, "message": "Usuario eliminado completamente"}
+        contactos = list(filas[0].contactos or []) if filas else []
+        for contacto_id in contactos:
+            # Una sincronización diferida de un contacto borrado recrearía asignaciones huérfanas
+            self._descartar_pendiente(f"instalaciones_contacto:{contacto_id}")
+        if diferido and contactos:
+            # Las asignaciones/contactos en streaming buffer se borran cuando salgan de él
+            self._diferir(f"borrar_contactos:{uuid.uuid4().hex}", "borrar_contactos", {'contactos': contactos})
+        errores = list(filas[0].errores or []) if filas else []
+        if errores:
+            return {"success": False, "error": "; ".join(errores), "contactos_eliminados": contactos}
+        mensaje = "Usuario eliminado completamente" if len(emails) == 1 else f"{len(emails)} usuarios eliminados completamente"
+        return {"success": True, "message": mensaje, "contactos_eliminados": contactos}
     
     # ============================================
     # INSTALACIONES
@@ -301,6 +714,11 @@ class BigQueryService:
     
     def get_instalaciones(self, cliente_rol: Optional[str] = None) -> List[Dict]:
         """Obtener lista de instalaciones"""
+        cache_key = f"instalaciones:{cliente_rol or 'all'}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT 
                 instalacion_rol,
@@ -317,11 +735,17 @@ class BigQueryService:
         
         query += " ORDER BY instalacion_rol"
         
-        results = self.client.query(query).result()
-        return [dict(row) for row in results]
+        results = self._consultar(query)
+        instalaciones = [dict(row) for row in results]
+        self._cache.set(cache_key, instalaciones, tablas=(TABLE_INSTALACIONES,), ttl=CACHE_TTL_INSTALACIONES)
+        return instalaciones
     
     def get_clientes(self) -> List[str]:
         """Obtener lista de clientes únicos desde las instalaciones"""
+        cached = self._cache.get("clientes")
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT DISTINCT cliente_rol
             FROM `{TABLE_INSTALACIONES}`
@@ -329,15 +753,17 @@ class BigQueryService:
             ORDER BY cliente_rol
         """
         
-        results = self.client.query(query).result()
-        return [row.cliente_rol for row in results]
+        results = self._consultar(query)
+        clientes = [row.cliente_rol for row in results]
+        self._cache.set("clientes", clientes, tablas=(TABLE_INSTALACIONES,), ttl=CACHE_TTL_INSTALACIONES)
+        return clientes
     
     def get_instalaciones_con_zonas(self, cliente_rol: Optional[str] = None) -> List[Dict]:
         """Obtener lista de instalaciones con sus zonas (optimizado con cache)"""
-        # Usar cache si no hay filtro de cliente
-        cache_key = f"instalaciones_{cliente_rol or 'all'}"
-        if not cliente_rol and hasattr(self, '_instalaciones_cache') and self._instalaciones_cache:
-            return self._instalaciones_cache
+        cache_key = f"instalaciones_con_zonas:{cliente_rol or 'all'}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         query = f"""
             SELECT 
@@ -369,13 +795,17 @@ class BigQueryService:
         )
         
         try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
+            results = self._consultar(query, job_config)
             instalaciones = [dict(row) for row in results]
             
-            # Cachear resultados si no hay filtro de cliente
+            # Cachear resultados (por cliente o completos)
+            self._cache.set(
+                cache_key, instalaciones,
+                tablas=(TABLE_INSTALACIONES, TABLE_ZONAS_INSTALACIONES),
+                ttl=CACHE_TTL_INSTALACIONES
+            )
             if not cliente_rol:
-                self._instalaciones_cache = instalaciones
+                self._guardar_snapshot("instalaciones_con_zonas", instalaciones)
             
             return instalaciones
         except Exception as e:
@@ -388,6 +818,10 @@ class BigQueryService:
     
     def get_contactos(self, cliente_rol: Optional[str] = None) -> List[Dict]:
         """Obtener lista de contactos"""
+        cached = self._cache.get("contactos:all")
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT 
                 contacto_id,
@@ -406,9 +840,13 @@ class BigQueryService:
         
         query += " ORDER BY nombre_contacto"
         
-        results = self.client.query(query).result()
-        return [dict(row) for row in results]
+        results = self._consultar(query)
+        contactos = [dict(row) for row in results]
+        self._cache.set("contactos:all", contactos, tablas=(TABLE_CONTACTOS,), ttl=CACHE_TTL_CONTACTOS)
+        self._guardar_snapshot("contactos", contactos)
+        return contactos
     
+    @_escritura(TABLE_CONTACTOS, parche="_parche_create_contacto")
     def create_contacto(self, nombre: str, telefono: str,
                        cargo: str = None, email: str = None, es_usuario_app: bool = False) -> Dict:
         """Crear un nuevo contacto"""
@@ -444,6 +882,7 @@ class BigQueryService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @_escritura(TABLE_CONTACTOS, parche="_parche_update_contacto")
     def update_contacto(self, contacto_id: str, **campos) -> Dict:
         """Actualizar un contacto"""
         set_clauses = []
@@ -476,6 +915,7 @@ class BigQueryService:
         """Eliminar un contacto (marca como inactivo)"""
         return self.update_contacto(contacto_id, activo=False)
     
+    @_escritura(TABLE_CONTACTOS)
     def update_contacto_por_email(self, email: str, **campos) -> Dict:
         """Actualizar contacto usando email_usuario_app"""
         set_clauses = []
@@ -504,6 +944,7 @@ class BigQueryService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @_escritura(TABLE_INST_CONTACTO, parche="_parche_asignar_contacto_instalacion")
     def asignar_contacto_instalacion(self, contacto_id: str, instalacion_rol: str) -> Dict:
         """Asignar un contacto a una instalación"""
         query = f"""
@@ -528,6 +969,11 @@ class BigQueryService:
     
     def get_contacto_por_email(self, email: str) -> Dict:
         """Obtener contacto por email del usuario app"""
+        cache_key = f"contacto_por_email:{email}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT contacto_id, nombre_contacto, telefono, cargo, email, 
                    activo, es_usuario_app, email_usuario_app
@@ -544,14 +990,17 @@ class BigQueryService:
         )
         
         try:
-            results = self.client.query(query, job_config=job_config).result()
+            results = self._consultar(query, job_config)
             for row in results:
-                return dict(row)
+                contacto = dict(row)
+                self._cache.set(cache_key, contacto, tablas=(TABLE_CONTACTOS,), ttl=CACHE_TTL_CONTACTOS)
+                return contacto
             return None
         except Exception as e:
             print(f"Error al obtener contacto: {e}")
             return None
     
+    @_escritura(TABLE_INST_CONTACTO, parche="_parche_sincronizar_instalaciones_contacto")
     def sincronizar_instalaciones_contacto(self, email_usuario: str, instalaciones_con_cliente: Dict[str, str]) -> Dict:
         """
         Sincronizar instalaciones de usuario con instalaciones de contacto
@@ -565,56 +1014,110 @@ class BigQueryService:
             if not contacto:
                 return {'success': False, 'error': 'Usuario no es contacto'}
             contacto_id = contacto['contacto_id']
+            filas = [{'instalacion_rol': inst, 'cliente_rol': cliente}
+                     for inst, cliente in (instalaciones_con_cliente or {}).items()]
             
-            # Calcular delta: existentes vs deseadas
-            existentes = set(self.get_instalaciones_contacto(contacto_id) or [])
-            deseadas = set(instalaciones_con_cliente.keys()) if instalaciones_con_cliente else set()
-            a_eliminar = list(existentes - deseadas)
-            a_insertar = [(inst, instalaciones_con_cliente.get(inst)) for inst in (deseadas - existentes)]
-
-            # Intentar eliminar solo las que sobran (puede fallar si hay streaming buffer)
-            if a_eliminar:
-                try:
-                    delete_query = f"""
-                        DELETE FROM `{TABLE_INST_CONTACTO}`
-                        WHERE contacto_id = @contacto_id
-                                    AND instalacion_rol IN UNNEST(@insts)
+            eliminacion_diferida = False
+            try:
+                self._merge_asignaciones(
+                    TABLE_INST_CONTACTO,
+                    alcance={'contacto_id': contacto_id},
+                    claves=['instalacion_rol'],
+                    campos=[('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING')],
+                    filas=filas,
+                    extras={'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+                )
+            except Exception as me:
+                # Filas antiguas aún en streaming buffer: insertar las faltantes y diferir las bajas
+                if 'streaming buffer' not in str(me).lower():
+                    raise
+                print("[CONTACTO] Eliminación diferida por streaming buffer; se intentará más tarde")
+                self._diferir(
+                    f"instalaciones_contacto:{contacto_id}", "instalaciones_contacto",
+                    {'contacto_id': contacto_id, 'filas': filas}
+                )
+                eliminacion_diferida = True
+                if filas:
+                    insert_query = f"""
+                        INSERT INTO `{TABLE_INST_CONTACTO}` (contacto_id, instalacion_rol, cliente_rol, fecha_asignacion)
+                        SELECT @contacto_id, s.instalacion_rol, s.cliente_rol, CURRENT_TIMESTAMP()
+                        FROM UNNEST(@filas) s
+                        WHERE s.instalacion_rol NOT IN (
+                            SELECT instalacion_rol FROM `{TABLE_INST_CONTACTO}` WHERE contacto_id = @contacto_id
+                        )
                     """
-                    job_config = bigquery.QueryJobConfig(
-                        query_parameters=[
-                                        bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id),
-                                        bigquery.ArrayQueryParameter("insts", "STRING", a_eliminar),
-                        ]
-                    )
-                    self.client.query(delete_query, job_config=job_config).result()
-                except Exception as de:
-                    # Si hay buffer de streaming, avisar pero continuar con inserciones
-                    if 'streaming buffer' in str(de).lower():
-                        print("[CONTACTO] Eliminación diferida por streaming buffer; se intentará más tarde")
-                    else:
-                        raise
+                    job_config = bigquery.QueryJobConfig(query_parameters=[
+                        bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id),
+                        _struct_array_param("filas", [('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING')], filas),
+                    ])
+                    self.client.query(insert_query, job_config=job_config).result()
+            else:
+                # El estado deseado quedó aplicado: una baja diferida anterior ya no hace falta
+                self._descartar_pendiente(f"instalaciones_contacto:{contacto_id}")
 
-            # Insertar nuevas asignaciones (streaming insert está bien para altas)
-            if a_insertar:
-                rows_to_insert = []
-                for inst, cliente_rol in a_insertar:
-                    rows_to_insert.append({
-                        'cliente_rol': cliente_rol,
-                        'instalacion_rol': inst,
-                        'contacto_id': contacto_id,
-                        'fecha_asignacion': None
-                    })
-                table_ref = self.client.get_table(TABLE_INST_CONTACTO)
-                errors = self.client.insert_rows_json(table_ref, rows_to_insert)
-                if errors:
-                    return {'success': False, 'error': f'Error en inserción masiva: {errors}'}
+            return {
+                'success': True,
+                'message': f'{len(filas)} instalaciones sincronizadas',
+                'contacto_id': contacto_id,
+                'eliminacion_diferida': eliminacion_diferida
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    @_escritura(TABLE_INST_CONTACTO)
+    def _aplicar_instalaciones_contacto(self, contacto_id: str, filas: List[Dict]) -> Dict:
+        """Reintento diferido: dejar al contacto exactamente con las instalaciones `filas`
 
-            return {'success': True, 'message': f'{len(deseadas)} instalaciones sincronizadas'}
+        Si el contacto ya no existe (o quedó inactivo al eliminarse) no se aplica nada:
+        el MERGE insertaría asignaciones huérfanas.
+        """
+        try:
+            existe_query = f"""
+                SELECT COUNT(*) AS n FROM `{TABLE_CONTACTOS}`
+                WHERE contacto_id = @contacto_id AND activo = TRUE
+            """
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id)
+            ])
+            existe = list(self.client.query(existe_query, job_config=job_config).result())
+            if not existe or not existe[0].n:
+                print(f"[PENDIENTES] Contacto {contacto_id} ya no existe: sincronización descartada")
+                return {'success': True, 'omitida': True}
+            self._merge_asignaciones(
+                TABLE_INST_CONTACTO,
+                alcance={'contacto_id': contacto_id},
+                claves=['instalacion_rol'],
+                campos=[('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING')],
+                filas=filas,
+                extras={'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+            )
+            return {'success': True}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    @_escritura(TABLE_INST_CONTACTO, TABLE_CONTACTOS)
+    def _borrar_contactos(self, contactos: List[str]) -> Dict:
+        """Reintento diferido: borrar contactos y sus asignaciones que quedaron en streaming buffer"""
+        script = f"""
+            DELETE FROM `{TABLE_INST_CONTACTO}` WHERE contacto_id IN UNNEST(@contactos);
+            DELETE FROM `{TABLE_CONTACTOS}` WHERE contacto_id IN UNNEST(@contactos);
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("contactos", "STRING", contactos)]
+        )
+        try:
+            self.client.query(script, job_config=job_config).result()
+            return {'success': True}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def get_instalaciones_contacto(self, contacto_id: str) -> List[str]:
         """Obtener instalaciones asignadas a un contacto"""
+        cache_key = f"instalaciones_contacto:{contacto_id}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT instalacion_rol
             FROM `{TABLE_INST_CONTACTO}`
@@ -627,34 +1130,23 @@ class BigQueryService:
             ]
         )
         
-        results = self.client.query(query, job_config=job_config).result()
-        return [row.instalacion_rol for row in results]
+        results = self._consultar(query, job_config)
+        instalaciones = [row.instalacion_rol for row in results]
+        self._cache.set(cache_key, instalaciones, tablas=(TABLE_INST_CONTACTO,), ttl=CACHE_TTL_PERMISOS)
+        return instalaciones
     
+    @_escritura(TABLE_INST_CONTACTO, parche="_parche_asignar_instalaciones_contacto")
     def asignar_instalaciones_contacto(self, contacto_id: str, instalaciones: List[str]) -> Dict:
         """Asignar múltiples instalaciones a un contacto"""
-        delete_query = f"""
-            DELETE FROM `{TABLE_INST_CONTACTO}`
-            WHERE contacto_id = @contacto_id
-        """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("contacto_id", "STRING", contacto_id)
-            ]
-        )
         try:
-            self.client.query(delete_query, job_config=job_config).result()
-            if instalaciones:
-                rows_to_insert = []
-                for instalacion in instalaciones:
-                    rows_to_insert.append({
-                        'instalacion_rol': instalacion,
-                        'contacto_id': contacto_id,
-                        'fecha_asignacion': None
-                    })
-                table_ref = self.client.get_table(TABLE_INST_CONTACTO)
-                errors = self.client.insert_rows_json(table_ref, rows_to_insert)
-                if errors:
-                    return {'success': False, 'error': f'Error en inserción masiva: {errors}'}
+            self._merge_asignaciones(
+                TABLE_INST_CONTACTO,
+                alcance={'contacto_id': contacto_id},
+                claves=['instalacion_rol'],
+                campos=[('instalacion_rol', 'STRING')],
+                filas=[{'instalacion_rol': inst} for inst in instalaciones or []],
+                extras={'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+            )
             return {'success': True, 'message': f'{len(instalaciones)} instalaciones asignadas'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -665,6 +1157,11 @@ class BigQueryService:
     
     def get_instalaciones_usuario(self, email: str) -> List[str]:
         """Obtener instalaciones asignadas a un usuario"""
+        cache_key = f"instalaciones_usuario:{email}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT instalacion_rol
             FROM `{TABLE_USUARIO_INST}`
@@ -677,8 +1174,10 @@ class BigQueryService:
             ]
         )
         
-        results = self.client.query(query, job_config=job_config).result()
-        return [row.instalacion_rol for row in results]
+        results = self._consultar(query, job_config)
+        instalaciones = [row.instalacion_rol for row in results]
+        self._cache.set(cache_key, instalaciones, tablas=(TABLE_USUARIO_INST,), ttl=CACHE_TTL_PERMISOS)
+        return instalaciones
     
     def get_instalaciones_usuario_detalle(self, email: str) -> Dict[str, Dict]:
         """
@@ -687,6 +1186,11 @@ class BigQueryService:
         Returns:
             Dict {instalacion_rol: {'puede_ver': bool, 'requiere_encuesta_individual': bool}}
         """
+        cache_key = f"instalaciones_usuario_detalle:{email}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT 
                 instalacion_rol,
@@ -703,98 +1207,115 @@ class BigQueryService:
         )
         
         try:
-            results = self.client.query(query, job_config=job_config).result()
+            results = self._consultar(query, job_config)
             detalle = {}
             for row in results:
                 detalle[row.instalacion_rol] = {
                     'puede_ver': row.puede_ver,
                     'requiere_encuesta_individual': row.requiere_encuesta_individual
                 }
+            self._cache.set(cache_key, detalle, tablas=(TABLE_USUARIO_INST,), ttl=CACHE_TTL_PERMISOS)
             return detalle
         except Exception as e:
             print(f"Error al obtener detalle de instalaciones: {e}")
             return {}
     
+    @_escritura(TABLE_USUARIO_INST, parche="_parche_asignar_instalaciones")
     def asignar_instalaciones(self, email: str, cliente_rol: str, instalaciones: List[str]) -> Dict:
         """Asignar instalaciones a un usuario"""
-        delete_query = f"""
-            DELETE FROM `{TABLE_USUARIO_INST}`
-            WHERE email_login = @email
-        """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("email", "STRING", email)
-            ]
-        )
         try:
-            self.client.query(delete_query, job_config=job_config).result()
-            if instalaciones:
-                rows_to_insert = []
-                for instalacion in instalaciones:
-                    rows_to_insert.append({
-                        'email_login': email,
-                        'cliente_rol': cliente_rol,
-                        'instalacion_rol': instalacion,
-                        'puede_ver': True,
-                        'fecha_asignacion': None
-                    })
-                table_ref = self.client.get_table(TABLE_USUARIO_INST)
-                errors = self.client.insert_rows_json(table_ref, rows_to_insert)
-                if errors:
-                    return {'success': False, 'error': f'Error en inserción masiva: {errors}'}
+            self._merge_asignaciones(
+                TABLE_USUARIO_INST,
+                alcance={'email_login': email},
+                claves=['instalacion_rol'],
+                campos=[('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING'), ('puede_ver', 'BOOL')],
+                filas=[{'instalacion_rol': inst, 'cliente_rol': cliente_rol, 'puede_ver': True}
+                       for inst in instalaciones or []],
+                extras={'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+            )
             return {'success': True, 'message': f'{len(instalaciones)} instalaciones asignadas'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @_escritura(TABLE_USUARIO_INST, parche="_parche_asignar_instalaciones_multi_cliente")
     def asignar_instalaciones_multi_cliente(self, email: str, instalaciones_con_cliente: Dict[str, str], instalaciones_detalle: Dict[str, Dict] = None) -> Dict:
         """
         Asignar instalaciones de múltiples clientes a un usuario
         """
-        delete_query = f"""
-            DELETE FROM `{TABLE_USUARIO_INST}`
-            WHERE email_login = @email
+        filas = []
+        for instalacion_rol, cliente_rol in (instalaciones_con_cliente or {}).items():
+            requiere_encuesta = False
+            if instalaciones_detalle and instalacion_rol in instalaciones_detalle:
+                requiere_encuesta = instalaciones_detalle[instalacion_rol].get('requiere_encuesta_individual', False)
+            filas.append({
+                'instalacion_rol': instalacion_rol,
+                'cliente_rol': cliente_rol,
+                'puede_ver': True,
+                'requiere_encuesta_individual': bool(requiere_encuesta),
+            })
+        try:
+            self._merge_asignaciones(
+                TABLE_USUARIO_INST,
+                alcance={'email_login': email},
+                claves=['instalacion_rol'],
+                campos=[('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING'), ('puede_ver', 'BOOL'),
+                        ('requiere_encuesta_individual', 'BOOL')],
+                filas=filas,
+                extras={'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+            )
+            return {'success': True, 'message': f'{len(filas)} instalaciones asignadas'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    @_escritura(TABLE_USUARIO_INST, parche="_parche_asignar_instalaciones_usuarios")
+    def asignar_instalaciones_usuarios(self, emails: List[str], instalaciones_con_cliente: Dict[str, str]) -> Dict:
         """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("email", "STRING", email)
-            ]
-        )
+        Otorgar las mismas instalaciones a varios usuarios con un único MERGE
+
+        A diferencia de asignar_instalaciones, solo agrega: las asignaciones existentes
+        se conservan (y quedan visibles) y no se borra ninguna.
+        """
+        emails = list(dict.fromkeys(emails))
+        filas = [{'instalacion_rol': inst, 'cliente_rol': cliente}
+                 for inst, cliente in (instalaciones_con_cliente or {}).items()]
+        if not emails or not filas:
+            return {'success': True, 'message': 'Sin instalaciones para asignar'}
+
+        query = f"""
+            MERGE `{TABLE_USUARIO_INST}` t
+            USING (
+                SELECT email AS email_login, i.instalacion_rol, i.cliente_rol
+                FROM UNNEST(@emails) email CROSS JOIN {{fuente}} i
+            ) s
+            ON t.email_login = s.email_login AND t.instalacion_rol = s.instalacion_rol
+            WHEN MATCHED THEN UPDATE SET puede_ver = TRUE, cliente_rol = s.cliente_rol
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (email_login, instalacion_rol, cliente_rol, puede_ver, fecha_asignacion)
+                VALUES (s.email_login, s.instalacion_rol, s.cliente_rol, TRUE, CURRENT_TIMESTAMP())
+        """
+        campos = [('instalacion_rol', 'STRING'), ('cliente_rol', 'STRING')]
         try:
-            self.client.query(delete_query, job_config=job_config).result()
-            rows_to_insert = []
-            if instalaciones_con_cliente:
-                seen_pairs = set()
-            for instalacion_rol, cliente_rol in instalaciones_con_cliente.items():
-                requiere_encuesta = False
-                if instalaciones_detalle and instalacion_rol in instalaciones_detalle:
-                    requiere_encuesta = instalaciones_detalle[instalacion_rol].get('requiere_encuesta_individual', False)
-                    key = (email, instalacion_rol)
-                    if key in seen_pairs:
-                        continue
-                    seen_pairs.add(key)
-                    rows_to_insert.append({
-                        'email_login': email,
-                        'cliente_rol': cliente_rol,
-                        'instalacion_rol': instalacion_rol,
-                        'puede_ver': True,
-                        'requiere_encuesta_individual': requiere_encuesta,
-                        'fecha_asignacion': None
-                    })
-                if rows_to_insert:
-                    table_ref = self.client.get_table(TABLE_USUARIO_INST)
-                    errors = self.client.insert_rows_json(table_ref, rows_to_insert)
-                    if errors:
-                        return {'success': False, 'error': f'Error en inserción masiva: {errors}'}
-            return {'success': True, 'message': f'{len(instalaciones_con_cliente)} instalaciones asignadas'}
+            with self._origen_filas("instalaciones", campos, filas) as (fuente, parametros):
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ArrayQueryParameter("emails", "STRING", emails),
+                    *parametros,
+                ])
+                self.client.query(query.format(fuente=fuente), job_config=job_config).result()
+            return {'success': True, 'message': f'{len(filas)} instalaciones asignadas a {len(emails)} usuarios'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
-    
+
     # ============================================
     # PERMISOS - USUARIO_CONTACTOS (CONTROL GRANULAR)
     # ============================================
     
     def get_contactos_usuario(self, email: str, instalacion_rol: str) -> List[str]:
         """Obtener contactos asignados a un usuario para una instalación"""
+        cache_key = f"contactos_usuario:{email}:{instalacion_rol}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT contacto_id
             FROM `{TABLE_USUARIO_CONTACTOS}`
@@ -809,45 +1330,34 @@ class BigQueryService:
             ]
         )
         
-        results = self.client.query(query, job_config=job_config).result()
-        return [row.contacto_id for row in results]
+        results = self._consultar(query, job_config)
+        contactos = [row.contacto_id for row in results]
+        self._cache.set(cache_key, contactos, tablas=(TABLE_USUARIO_CONTACTOS,), ttl=CACHE_TTL_PERMISOS)
+        return contactos
     
+    @_escritura(TABLE_USUARIO_CONTACTOS, parche="_parche_asignar_contactos_usuario")
     def asignar_contactos_usuario(self, email: str, instalacion_rol: str, contactos: List[str], asignado_por: str) -> Dict:
         """Asignar contactos específicos a un usuario para una instalación"""
-        delete_query = f"""
-            DELETE FROM `{TABLE_USUARIO_CONTACTOS}`
-            WHERE email_login = @email
-              AND instalacion_rol = @instalacion
-        """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("email", "STRING", email),
-                bigquery.ScalarQueryParameter("instalacion", "STRING", instalacion_rol),
-            ]
-        )
         try:
-            self.client.query(delete_query, job_config=job_config).result()
-            if contactos:
-                rows_to_insert = []
-                for contacto_id in contactos:
-                    rows_to_insert.append({
-                        'id': str(uuid.uuid4()),
-                        'email_login': email,
-                        'instalacion_rol': instalacion_rol,
-                        'contacto_id': contacto_id,
-                        'fecha_asignacion': None,
-                        'asignado_por': asignado_por
-                    })
-                table_ref = self.client.get_table(TABLE_USUARIO_CONTACTOS)
-                errors = self.client.insert_rows_json(table_ref, rows_to_insert)
-                if errors:
-                    return {'success': False, 'error': f'Error en inserción masiva: {errors}'}
+            self._merge_asignaciones(
+                TABLE_USUARIO_CONTACTOS,
+                alcance={'email_login': email, 'instalacion_rol': instalacion_rol},
+                claves=['contacto_id'],
+                campos=[('contacto_id', 'STRING'), ('asignado_por', 'STRING')],
+                filas=[{'contacto_id': cid, 'asignado_por': asignado_por} for cid in contactos or []],
+                extras={'id': 'GENERATE_UUID()', 'fecha_asignacion': 'CURRENT_TIMESTAMP()'},
+            )
             return {'success': True, 'message': f'{len(contactos)} contactos asignados'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def get_contactos_instalacion(self, instalacion_rol: str) -> List[Dict]:
         """Obtener todos los contactos disponibles para una instalación"""
+        cache_key = f"contactos_instalacion:{instalacion_rol}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         query = f"""
             SELECT 
                 c.contacto_id,
@@ -869,8 +1379,10 @@ class BigQueryService:
             ]
         )
         
-        results = self.client.query(query, job_config=job_config).result()
-        return [dict(row) for row in results]
+        results = self._consultar(query, job_config)
+        contactos = [dict(row) for row in results]
+        self._cache.set(cache_key, contactos, tablas=(TABLE_CONTACTOS, TABLE_INST_CONTACTO), ttl=CACHE_TTL_CONTACTOS)
+        return contactos
     
     def get_todos_contactos_por_instalacion(self) -> Dict[str, List[Dict]]:
         """
@@ -880,26 +1392,55 @@ class BigQueryService:
             Dict {instalacion_rol: [contactos]}
         """
         # Usar cache si está disponible
-        if hasattr(self, '_contactos_instalacion_cache') and self._contactos_instalacion_cache:
-            return self._contactos_instalacion_cache
+        cached = self._cache.get("todos_contactos_por_instalacion")
+        if cached is not None:
+            return cached
         
-        query = f"""
-            SELECT 
+        try:
+            if SYNC_INCREMENTAL:
+                filas = self._sincronizar_contactos_por_instalacion()
+            else:
+                filas = self._consultar_contactos_por_instalacion()
+            contactos_por_instalacion = self._agrupar_por_instalacion(filas)
+            
+            # Cachear resultados
+            self._cache.set(
+                "todos_contactos_por_instalacion", contactos_por_instalacion,
+                tablas=(TABLE_INST_CONTACTO, TABLE_CONTACTOS), ttl=CACHE_TTL_CONTACTOS
+            )
+            self._guardar_snapshot("todos_contactos_por_instalacion", contactos_por_instalacion)
+            
+            return contactos_por_instalacion
+        except Exception as e:
+            print(f"Error al obtener contactos por instalación: {e}")
+            return {}
+    
+    # Columnas del JOIN instalacion_contacto + contactos
+    _COLUMNAS_CONTACTO_INSTALACION = """
                 ic.instalacion_rol,
                 c.contacto_id,
                 c.nombre_contacto,
                 c.telefono,
                 c.cargo,
                 c.email
+    """
+    
+    def _consultar_contactos_por_instalacion(self, condicion: str = "", parametros: list = None) -> List[Dict]:
+        """Filas planas (instalación, contacto) de contactos activos, opcionalmente filtradas"""
+        query = f"""
+            SELECT {self._COLUMNAS_CONTACTO_INSTALACION}
             FROM `{TABLE_INST_CONTACTO}` ic
             INNER JOIN `{TABLE_CONTACTOS}` c
               ON ic.contacto_id = c.contacto_id
             WHERE c.activo = TRUE
-            ORDER BY ic.instalacion_rol, c.nombre_contacto
         """
+        if condicion:
+            query += f" AND ({condicion})"
+        query += " ORDER BY ic.instalacion_rol, c.nombre_contacto"
         
         # Configuración optimizada para la consulta
         job_config = bigquery.QueryJobConfig(
+            query_parameters=parametros or [],
             use_query_cache=True,
             use_legacy_sql=False,
             maximum_bytes_billed=500000000,  # 500MB
@@ -907,40 +1448,28 @@ class BigQueryService:
             dry_run=False
         )
         
-        try:
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
-            
-            # Agrupar por instalación evitando duplicados
-            contactos_por_instalacion = {}
-            contactos_vistos = set()  # Para evitar duplicados
-            
-            for row in results:
-                instalacion = row.instalacion_rol
-                contacto_key = f"{instalacion}_{row.contacto_id}"
-                
-                # Evitar duplicados de forma eficiente
-                if contacto_key not in contactos_vistos:
-                    contactos_vistos.add(contacto_key)
-                    
-                if instalacion not in contactos_por_instalacion:
-                    contactos_por_instalacion[instalacion] = []
-                
-                contactos_por_instalacion[instalacion].append({
-                    'contacto_id': row.contacto_id,
-                    'nombre_contacto': row.nombre_contacto,
-                    'telefono': row.telefono,
-                    'cargo': row.cargo,
-                    'email': row.email
-                })
-            
-            # Cachear resultados
-            self._contactos_instalacion_cache = contactos_por_instalacion
-            
-            return contactos_por_instalacion
-        except Exception as e:
-            print(f"Error al obtener contactos por instalación: {e}")
-            return {}
+        results = self._consultar(query, job_config)
+        return [dict(row) for row in results]
+    
+    @staticmethod
+    def _agrupar_por_instalacion(filas: List[Dict]) -> Dict[str, List[Dict]]:
+        """Agrupar filas planas por instalación evitando duplicados"""
+        contactos_por_instalacion = {}
+        contactos_vistos = set()
+        for fila in filas:
+            instalacion = fila['instalacion_rol']
+            contacto_key = (instalacion, fila['contacto_id'])
+            if contacto_key in contactos_vistos:
+                continue
+            contactos_vistos.add(contacto_key)
+            contactos_por_instalacion.setdefault(instalacion, []).append({
+                'contacto_id': fila['contacto_id'],
+                'nombre_contacto': fila.get('nombre_contacto'),
+                'telefono': fila.get('telefono'),
+                'cargo': fila.get('cargo'),
+                'email': fila.get('email')
+            })
+        return contactos_por_instalacion
     
     # ============================================
     # ROLES Y PERMISOS
@@ -949,8 +1478,9 @@ class BigQueryService:
     def get_roles(self) -> List[Dict]:
         """Obtiene todos los roles disponibles con cache"""
         # Verificar cache
-        if self._roles_cache and self._is_cache_valid():
-            return self._roles_cache
+        cached = self._cache.get("roles")
+        if cached is not None:
+            return cached
         
         query = f"""
             SELECT 
@@ -990,8 +1520,7 @@ class BigQueryService:
                 job_timeout_ms=30000  # Timeout de 30 segundos
             )
             
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
+            results = self._consultar(query, job_config)
             
             roles = []
             for row in results:
@@ -1013,8 +1542,8 @@ class BigQueryService:
                 })
             
             # Guardar en cache
-            self._roles_cache = roles
-            self._cache_timestamp = datetime.now()
+            self._cache.set("roles", roles, tablas=(TABLE_ROLES,), ttl=CACHE_TTL_ROLES)
+            self._guardar_snapshot("roles", roles)
             
             return roles
         except Exception as e:
@@ -1037,17 +1566,8 @@ class BigQueryService:
                 'activo': True
             }]
     
-    def get_usuarios_con_roles(self, cliente_rol: Optional[str] = None) -> List[Dict]:
-        """Obtiene usuarios con sus roles y permisos usando JOIN directo con cache"""
-        # Verificar cache inteligente por cliente
-        cache_key = cliente_rol or 'all'
-        if cache_key in self._usuarios_cache and self._is_cache_valid():
-            return self._usuarios_cache[cache_key]
-        
-        try:
-            # Primero intentar con JOIN a la tabla de roles
-            query = f"""
-            SELECT 
+    # Columnas del JOIN usuarios + roles (compartidas por la consulta completa y la incremental)
+    _COLUMNAS_USUARIO_CON_ROL = """
                     u.email_login,
                     u.firebase_uid,
                     u.cliente_rol,
@@ -1068,79 +1588,85 @@ class BigQueryService:
                     u.activo as usuario_activo,
                     u.ultima_sesion,
                     u.fecha_creacion
-                FROM `{TABLE_USUARIOS}` u
-                LEFT JOIN `{TABLE_ROLES}` r ON u.rol_id = r.rol_id
-                WHERE u.activo = TRUE
+    """
+    
+    @staticmethod
+    def _mapear_usuario_con_rol(row) -> Dict:
+        """Convertir una fila del JOIN usuarios + roles al diccionario que usa la app"""
+        # Manejar valores NULL de forma optimizada
+        rol_id = row.rol_id or 'CLIENTE'
+        nombre_rol = row.nombre_rol or 'Cliente'
+        return {
+            'email_login': _safe_str(row.email_login),
+            'firebase_uid': _safe_str(row.firebase_uid),
+            'cliente_rol': _safe_str(row.cliente_rol),
+            'nombre_completo': _safe_str(row.nombre_completo),
+            'cargo': _safe_str(row.cargo) if row.cargo else None,
+            'telefono': _safe_str(row.telefono) if row.telefono else None,
+            'rol_id': _safe_str(rol_id),
+            'nombre_rol': _safe_str(nombre_rol),
+            'permisos': {
+                'puede_ver_cobertura': row.puede_ver_cobertura or True,
+                'puede_ver_encuestas': row.puede_ver_encuestas or True,
+                'puede_enviar_mensajes': row.puede_enviar_mensajes or True,
+                'puede_ver_empresas': row.puede_ver_empresas or False,
+                'puede_ver_metricas_globales': row.puede_ver_metricas_globales or False,
+                'puede_ver_trabajadores': row.puede_ver_trabajadores or False,
+                'puede_ver_mensajes_recibidos': row.puede_ver_mensajes_recibidos or False,
+                'es_admin': row.es_admin or False
+            },
+            'ver_todas_instalaciones': row.ver_todas_instalaciones,
+            'activo': row.usuario_activo,
+            'ultima_sesion': row.ultima_sesion.isoformat() if row.ultima_sesion else None,
+            'fecha_creacion': row.fecha_creacion.isoformat() if row.fecha_creacion else None
+        }
+    
+    def _consultar_usuarios_con_roles(self, cliente_rol: Optional[str] = None,
+                                      condicion: str = "", parametros: list = None) -> List[Dict]:
+        """Consulta de usuarios activos con su rol (sin cache), opcionalmente filtrada"""
+        query = f"""
+            SELECT {self._COLUMNAS_USUARIO_CON_ROL}
+            FROM `{TABLE_USUARIOS}` u
+            LEFT JOIN `{TABLE_ROLES}` r ON u.rol_id = r.rol_id
+            WHERE u.activo = TRUE
         """
         
-            if cliente_rol:
-                query += f" AND u.cliente_rol = '{cliente_rol}'"
-            
-            query += " ORDER BY u.fecha_creacion DESC"
-            
-            # Configurar job para mejor rendimiento
-            job_config = bigquery.QueryJobConfig(
-                use_query_cache=True,  # Usar cache de consultas
-                use_legacy_sql=False,  # Usar SQL estándar
-                maximum_bytes_billed=1000000000  # Límite de 1GB
-            )
-            
-            query_job = self.client.query(query, job_config=job_config)
-            results = query_job.result()
-            
-            usuarios = []
-            for row in results:
-                # Manejar valores NULL de forma optimizada
-                rol_id = row.rol_id or 'CLIENTE'
-                nombre_rol = row.nombre_rol or 'Cliente'
-                
-                # Manejar codificación de caracteres especiales
-                def safe_str(value):
-                    if value is None:
-                        return None
-                    try:
-                        # Si ya es string, verificar codificación
-                        if isinstance(value, str):
-                            # Intentar codificar y decodificar para limpiar
-                            return value.encode('utf-8', errors='ignore').decode('utf-8')
-                        else:
-                            # Convertir a string y limpiar
-                            return str(value).encode('utf-8', errors='ignore').decode('utf-8')
-                    except (UnicodeEncodeError, UnicodeDecodeError, AttributeError):
-                        # Fallback: convertir a string y limpiar caracteres problemáticos
-                        try:
-                            return str(value).encode('ascii', errors='ignore').decode('ascii')
-                        except:
-                            return str(value)
-                
-                usuarios.append({
-                    'email_login': safe_str(row.email_login),
-                    'firebase_uid': safe_str(row.firebase_uid),
-                    'cliente_rol': safe_str(row.cliente_rol),
-                    'nombre_completo': safe_str(row.nombre_completo),
-                    'cargo': safe_str(row.cargo) if row.cargo else None,
-                    'telefono': safe_str(row.telefono) if row.telefono else None,
-                    'rol_id': safe_str(rol_id),
-                    'nombre_rol': safe_str(nombre_rol),
-                    'permisos': {
-                        'puede_ver_cobertura': row.puede_ver_cobertura or True,
-                        'puede_ver_encuestas': row.puede_ver_encuestas or True,
-                        'puede_enviar_mensajes': row.puede_enviar_mensajes or True,
-                        'puede_ver_empresas': row.puede_ver_empresas or False,
-                        'puede_ver_metricas_globales': row.puede_ver_metricas_globales or False,
-                        'puede_ver_trabajadores': row.puede_ver_trabajadores or False,
-                        'puede_ver_mensajes_recibidos': row.puede_ver_mensajes_recibidos or False,
-                        'es_admin': row.es_admin or False
-                    },
-                    'ver_todas_instalaciones': row.ver_todas_instalaciones,
-                    'activo': row.usuario_activo,
-                    'ultima_sesion': row.ultima_sesion.isoformat() if row.ultima_sesion else None,
-                    'fecha_creacion': row.fecha_creacion.isoformat() if row.fecha_creacion else None
-                })
+        if cliente_rol:
+            query += f" AND u.cliente_rol = '{cliente_rol}'"
+        if condicion:
+            query += f" AND ({condicion})"
+        
+        query += " ORDER BY u.fecha_creacion DESC"
+        
+        # Configurar job para mejor rendimiento
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=parametros or [],
+            use_query_cache=True,  # Usar cache de consultas
+            use_legacy_sql=False,  # Usar SQL estándar
+            maximum_bytes_billed=1000000000  # Límite de 1GB
+        )
+        
+        results = self._consultar(query, job_config)
+        return [self._mapear_usuario_con_rol(row) for row in results]
+    
+    def get_usuarios_con_roles(self, cliente_rol: Optional[str] = None) -> List[Dict]:
+        """Obtiene usuarios con sus roles y permisos usando JOIN directo con cache"""
+        # Verificar cache inteligente por cliente
+        cache_key = f"usuarios_con_roles:{cliente_rol or 'all'}"
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            if not cliente_rol and SYNC_INCREMENTAL:
+                usuarios = self._sincronizar_usuarios_con_roles()
+            else:
+                usuarios = self._consultar_usuarios_con_roles(cliente_rol)
             
             # Guardar en cache inteligente por cliente
-            self._usuarios_cache[cache_key] = usuarios
-            self._cache_timestamp = datetime.now()
+            self._cache.set(cache_key, usuarios, tablas=(TABLE_USUARIOS, TABLE_ROLES), ttl=CACHE_TTL_USUARIOS)
+            if not cliente_rol:
+                self._guardar_snapshot("usuarios_con_roles", usuarios)
             
             return usuarios
         except Exception as e:
@@ -1157,62 +1683,10 @@ class BigQueryService:
                         sys.stderr.reconfigure(encoding='utf-8')
                     
                     # Reintentar la consulta
-                    query_job = self.client.query(query, job_config=job_config)
-                    results = query_job.result()
-                    
-                    usuarios = []
-                    for row in results:
-                        # Manejar valores NULL de forma optimizada
-                        rol_id = row.rol_id or 'CLIENTE'
-                        nombre_rol = row.nombre_rol or 'Cliente'
-                        
-                        # Manejar codificación de caracteres especiales
-                        def safe_str(value):
-                            if value is None:
-                                return None
-                            try:
-                                # Si ya es string, verificar codificación
-                                if isinstance(value, str):
-                                    # Intentar codificar y decodificar para limpiar
-                                    return value.encode('utf-8', errors='ignore').decode('utf-8')
-                                else:
-                                    # Convertir a string y limpiar
-                                    return str(value).encode('utf-8', errors='ignore').decode('utf-8')
-                            except (UnicodeEncodeError, UnicodeDecodeError, AttributeError):
-                                # Fallback: convertir a string y limpiar caracteres problemáticos
-                                try:
-                                    return str(value).encode('ascii', errors='ignore').decode('ascii')
-                                except:
-                                    return str(value)
-                        
-                        usuarios.append({
-                            'email_login': safe_str(row.email_login),
-                            'firebase_uid': safe_str(row.firebase_uid),
-                            'cliente_rol': safe_str(row.cliente_rol),
-                            'nombre_completo': safe_str(row.nombre_completo),
-                            'cargo': safe_str(row.cargo) if row.cargo else None,
-                            'telefono': safe_str(row.telefono) if row.telefono else None,
-                            'rol_id': safe_str(rol_id),
-                            'nombre_rol': safe_str(nombre_rol),
-                            'permisos': {
-                                'puede_ver_cobertura': row.puede_ver_cobertura or True,
-                                'puede_ver_encuestas': row.puede_ver_encuestas or True,
-                                'puede_enviar_mensajes': row.puede_enviar_mensajes or True,
-                                'puede_ver_empresas': row.puede_ver_empresas or False,
-                                'puede_ver_metricas_globales': row.puede_ver_metricas_globales or False,
-                                'puede_ver_trabajadores': row.puede_ver_trabajadores or False,
-                                'puede_ver_mensajes_recibidos': row.puede_ver_mensajes_recibidos or False,
-                                'es_admin': row.es_admin or False
-                            },
-                            'ver_todas_instalaciones': row.ver_todas_instalaciones,
-                            'activo': row.usuario_activo,
-                            'ultima_sesion': row.ultima_sesion.isoformat() if row.ultima_sesion else None,
-                            'fecha_creacion': row.fecha_creacion.isoformat() if row.fecha_creacion else None
-                        })
+                    usuarios = self._consultar_usuarios_con_roles(cliente_rol)
                     
                     # Guardar en cache
-                    self._usuarios_cache[cache_key] = usuarios
-                    self._cache_timestamp = datetime.now()
+                    self._cache.set(cache_key, usuarios, tablas=(TABLE_USUARIOS, TABLE_ROLES), ttl=CACHE_TTL_USUARIOS)
                     
                     return usuarios
                 except Exception as e3:
@@ -1293,6 +1767,18 @@ class BigQueryService:
                 print(f"Error en fallback: {str(e2)}")
                 return []
     
+    def get_usuario_con_rol(self, email: str) -> Optional[Dict]:
+        """
+        Obtener un único usuario activo con su rol y permisos (consulta parametrizada de una fila)
+        
+        Pensado para el login: no recorre la tabla completa de usuarios.
+        """
+        usuarios = self._consultar_usuarios_con_roles(
+            condicion="u.email_login = @email",
+            parametros=[bigquery.ScalarQueryParameter("email", "STRING", email)]
+        )
+        return usuarios[0] if usuarios else None
+    
     def _get_usuarios_sin_roles(self, cliente_rol: Optional[str] = None) -> List[Dict]:
         """Obtener usuarios sin información de roles (fallback cuando la tabla roles no existe)"""
         try:
@@ -1316,7 +1802,7 @@ class BigQueryService:
             if cliente_rol:
                 query += f" AND cliente_rol = '{cliente_rol}'"
             query += " ORDER BY fecha_creacion DESC"
-            results = self.client.query(query).result()
+            results = self._consultar(query)
             usuarios = []
             for row in results:
                 rol_id = row.rol_id or 'CLIENTE'
@@ -1324,10 +1810,10 @@ class BigQueryService:
                 permisos = self._get_permisos_basicos(rol_id)
             
                 usuarios.append({
-                    'email_login': safe_str(row.email_login),
-                    'firebase_uid': safe_str(row.firebase_uid),
-                    'cliente_rol': safe_str(row.cliente_rol),
-                    'nombre_completo': safe_str(row.nombre_completo),
+                    'email_login': _safe_str(row.email_login),
+                    'firebase_uid': _safe_str(row.firebase_uid),
+                    'cliente_rol': _safe_str(row.cliente_rol),
+                    'nombre_completo': _safe_str(row.nombre_completo),
                     'cargo': row.cargo if row.cargo else None,
                     'telefono': row.telefono if row.telefono else None,
                     'rol_id': rol_id,
@@ -1392,6 +1878,7 @@ class BigQueryService:
                 'es_admin': False
             }
     
+    @_escritura(TABLE_USUARIOS, parche="_parche_actualizar_rol_usuario")
     def actualizar_rol_usuario(self, email_login: str, nuevo_rol_id: str) -> Dict:
         """Actualiza el rol de un usuario"""
         query = f"""
@@ -1414,3 +1901,472 @@ class BigQueryService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    
+    # ============================================
+    # ASIGNACIONES POR CONJUNTOS (MERGE)
+    # ============================================
+    
+    @contextmanager
+    def _origen_filas(self, nombre: str, campos: List[tuple], filas: List[Dict]):
+        """
+        Fuente SQL para leer `filas` dentro de una escritura por conjuntos.
+        
+        Hasta STAGING_UMBRAL_FILAS filas se envían como parámetro `UNNEST(@nombre)`; con más,
+        se cargan como NDJSON en una tabla temporal con un load job (gratis, sin streaming
+        buffer) que se elimina al salir; la tabla se crea con vencimiento (STAGING_EXPIRACION)
+        para que no quede huérfana si el proceso muere o el borrado falla.
+        Rinde (fuente_sql, parametros).
+        """
+        if len(filas) < STAGING_UMBRAL_FILAS:
+            yield f"UNNEST(@{nombre})", [_struct_array_param(nombre, campos, filas)]
+            return
+        
+        tabla = f"{PROJECT_ID}.{STAGING_DATASET}._staging_{nombre}_{uuid.uuid4().hex}"
+        tipos_load = {'BOOL': 'BOOLEAN', 'INT64': 'INTEGER', 'FLOAT64': 'FLOAT'}
+        esquema = [bigquery.SchemaField(campo, tipos_load.get(tipo, tipo)) for campo, tipo in campos]
+        job_config = bigquery.LoadJobConfig(
+            schema=esquema,
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        ndjson = "\n".join(
+            json.dumps({campo: fila.get(campo) for campo, _ in campos}, default=str, ensure_ascii=False)
+            for fila in filas
+        )
+        try:
+            temporal = bigquery.Table(tabla, schema=esquema)
+            temporal.expires = datetime.now(timezone.utc) + timedelta(seconds=STAGING_EXPIRACION)
+            self.client.create_table(temporal)
+            self.client.load_table_from_file(
+                io.BytesIO(ndjson.encode('utf-8')), tabla, job_config=job_config
+            ).result()
+            print(f"[STAGING] {len(filas)} filas cargadas en {tabla}")
+            yield f"`{tabla}`", []
+        finally:
+            self.client.delete_table(tabla, not_found_ok=True)
+    
+    def _merge_asignaciones(self, tabla: str, alcance: Dict[str, str], claves: List[str],
+                            campos: List[tuple], filas: List[Dict], extras: Dict[str, str] = None) -> None:
+        """
+        Dejar en `tabla`, dentro del alcance indicado, exactamente las `filas` deseadas con
+        un único MERGE: inserta las nuevas, actualiza las existentes y borra las sobrantes.
+        
+        Args:
+            alcance: columna -> valor (STRING) que delimita las filas administradas
+            claves: columnas de `campos` que identifican una fila dentro del alcance
+            campos: (columna, tipo) de cada fila deseada
+            filas: filas deseadas (las claves repetidas se descartan)
+            extras: columna -> expresión SQL usada solo al insertar (p.ej. fecha_asignacion)
+        """
+        extras = extras or {}
+        unicas = {tuple(f.get(c) for c in claves): f for f in filas}
+        
+        condicion_alcance = " AND ".join(f"t.{col} = @alcance_{col}" for col in alcance)
+        condicion_union = " AND ".join([condicion_alcance] + [f"t.{c} = s.{c}" for c in claves])
+        actualizables = [c for c, _ in campos if c not in claves]
+        columnas = list(alcance) + [c for c, _ in campos] + list(extras)
+        valores = [f"@alcance_{c}" for c in alcance] + [f"s.{c}" for c, _ in campos] + list(extras.values())
+        
+        actualizar = ""
+        if actualizables:
+            actualizar = "WHEN MATCHED THEN UPDATE SET " + ", ".join(f"{c} = s.{c}" for c in actualizables)
+        query = f"""
+            MERGE `{tabla}` t
+            USING (SELECT * FROM UNNEST(@filas)) s
+            ON {condicion_union}
+            {actualizar}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT ({", ".join(columnas)}) VALUES ({", ".join(valores)})
+            WHEN NOT MATCHED BY SOURCE AND {condicion_alcance} THEN DELETE
+        """
+        with self._origen_filas("filas", campos, list(unicas.values())) as (fuente, parametros):
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                *[bigquery.ScalarQueryParameter(f"alcance_{col}", "STRING", valor) for col, valor in alcance.items()],
+                *parametros,
+            ])
+            self.client.query(query.replace("UNNEST(@filas)", fuente), job_config=job_config).result()
+    
+    # ============================================
+    # SINCRONIZACIÓN INCREMENTAL
+    # ============================================
+    
+    def _modificado_tabla(self, tabla: str) -> Optional[str]:
+        """Fecha de modificación de una tabla (llamada de metadatos, no escanea datos)"""
+        t = self.client.get_table(tabla)
+        # Las vistas y las tablas con streaming buffer no tienen una fecha de modificación confiable
+        if t.table_type == 'TABLE' and not t.streaming_buffer and t.modified:
+            return t.modified.isoformat()
+        return None
+    
+    def _sincronizar_delta(self, nombre: str, tabla: str, filas_base: Optional[List[Dict]],
+                           consultar_todo, dependencias: tuple = (),
+                           clave=None, expr_clave: str = None,
+                           consultar_claves=None, consultar_cambios=None) -> List[Dict]:
+        """
+        Sincronizar un conjunto de filas locales con BigQuery trayendo solo lo que cambió.
+        
+        - Si ni `tabla` ni sus `dependencias` cambiaron (metadato `modified`) se reutilizan
+          las filas locales sin escanear datos.
+        - Si se indican `consultar_claves`/`consultar_cambios` (solo para tablas que reciben
+          altas y bajas, nunca actualizaciones) se traen las claves vigentes, para detectar
+          bajas, y solo las filas de claves nuevas.
+        - En cualquier otro caso se recarga completo con `consultar_todo`.
+        
+        Args:
+            clave: función fila -> clave (str), equivalente en Python de `expr_clave` (SQL)
+            consultar_claves: () -> set de claves vigentes
+            consultar_cambios: (condicion_sql, parametros) -> filas que cumplen la condición
+        """
+        store = self.snapshots
+        guardado = store.cargar(f"marca:{nombre}") if store else None
+        estado = guardado[0] if guardado else None
+        tablas = (tabla,) + tuple(dependencias)
+        modificados = {t: self._modificado_tabla(t) for t in tablas}
+        
+        def sin_cambios(t: str) -> bool:
+            return (estado is not None and modificados[t] is not None
+                    and estado.get('modificados', {}).get(t) == modificados[t])
+        
+        if filas_base is not None and all(sin_cambios(t) for t in tablas):
+            print(f"[SYNC] {nombre}: sin cambios desde la última sincronización")
+            return filas_base
+        
+        delta_posible = (
+            consultar_claves is not None and filas_base is not None and estado is not None
+            and all(sin_cambios(t) for t in dependencias)
+        )
+        if delta_posible:
+            claves = consultar_claves()
+            filas = {clave(f): f for f in filas_base if clave(f) in claves}
+            nuevas = [k for k in claves if k not in filas]
+            
+            cambios = []
+            if nuevas:
+                cambios = consultar_cambios(f"{expr_clave} IN UNNEST(@nuevas)",
+                                            [bigquery.ArrayQueryParameter("nuevas", "STRING", nuevas)])
+            for fila in cambios:
+                k = clave(fila)
+                if k in claves:
+                    filas[k] = fila
+            resultado = list(filas.values())
+            print(f"[SYNC] {nombre}: {len(cambios)} filas nuevas, "
+                  f"{len(filas_base) - (len(resultado) - len(nuevas))} bajas")
+        else:
+            resultado = consultar_todo()
+            print(f"[SYNC] {nombre}: recarga completa ({len(resultado)} filas)")
+        
+        if store:
+            store.guardar(f"marca:{nombre}", {'modificados': modificados})
+        return resultado
+    
+    def _sincronizar_usuarios_con_roles(self) -> List[Dict]:
+        """Usuarios activos con rol: se reutiliza lo guardado si usuarios_app y roles no cambiaron"""
+        usuarios = self._sincronizar_delta(
+            "usuarios_con_roles", TABLE_USUARIOS, self.get_snapshot("usuarios_con_roles"),
+            consultar_todo=self._consultar_usuarios_con_roles,
+            # Un cambio en roles afecta a todas las filas del JOIN
+            dependencias=(TABLE_ROLES,),
+            # usuarios_app recibe actualizaciones sin fecha de modificación por fila:
+            # si la tabla cambió se recarga completa
+        )
+        return sorted(usuarios, key=lambda u: u.get('fecha_creacion') or '', reverse=True)
+    
+    def _sincronizar_contactos_por_instalacion(self) -> List[Dict]:
+        """Filas (instalación, contacto), trayendo solo asignaciones nuevas desde la última carga"""
+        base = self.get_snapshot("todos_contactos_por_instalacion")
+        filas_base = None
+        if base is not None:
+            filas_base = [dict(c, instalacion_rol=inst) for inst, contactos in base.items() for c in contactos]
+        
+        def claves_vigentes():
+            query = f"""
+                SELECT CONCAT(ic.instalacion_rol, '|', ic.contacto_id) AS clave
+                FROM `{TABLE_INST_CONTACTO}` ic
+                INNER JOIN `{TABLE_CONTACTOS}` c ON ic.contacto_id = c.contacto_id
+                WHERE c.activo = TRUE
+            """
+            return {row.clave for row in self._consultar(query)}
+        
+        filas = self._sincronizar_delta(
+            "todos_contactos_por_instalacion", TABLE_INST_CONTACTO, filas_base,
+            consultar_todo=self._consultar_contactos_por_instalacion,
+            # Los datos del contacto viven en otra tabla: si cambia, recarga completa
+            dependencias=(TABLE_CONTACTOS,),
+            # instalacion_contacto solo recibe altas y bajas, nunca actualizaciones
+            clave=lambda f: f"{f.get('instalacion_rol')}|{f.get('contacto_id')}",
+            expr_clave="CONCAT(ic.instalacion_rol, '|', ic.contacto_id)",
+            consultar_claves=claves_vigentes,
+            consultar_cambios=self._consultar_contactos_por_instalacion,
+        )
+        return sorted(filas, key=lambda f: (f.get('instalacion_rol') or '', f.get('nombre_contacto') or ''))
+    
+    # ============================================
+    # COHERENCIA DEL CACHE TRAS ESCRITURAS
+    # ============================================
+    
+    def _tras_escritura(self, tablas: tuple, parche: Optional[str], resultado, args: tuple, kwargs: dict) -> None:
+        """Parchear el cache en sitio o, si no es posible, invalidar las tablas afectadas"""
+        self._retirar_vuelos(tablas)
+        exito = isinstance(resultado, dict) and resultado.get('success')
+        if exito and parche:
+            try:
+                if getattr(self, parche)(resultado, *args, **kwargs) is not False:
+                    return
+            except Exception as e:
+                print(f"[CACHE] No se pudo actualizar el cache en sitio: {e}")
+        self._cache.invalidate_tables(*tablas)
+    
+    def _rol_cacheado(self, rol_id: str) -> Optional[Dict]:
+        """Buscar un rol en el cache sin consultar BigQuery"""
+        roles = self._cache.peek("roles") or []
+        return next((r for r in roles if r.get('rol_id') == rol_id), None)
+    
+    def _contacto_cacheado(self, contacto_id: str) -> Optional[Dict]:
+        """Buscar un contacto activo en el cache sin consultar BigQuery"""
+        contactos = self._cache.peek("contactos:all") or []
+        return next((c for c in contactos if c.get('contacto_id') == contacto_id), None)
+    
+    def _parche_create_usuario(self, resultado: Dict, email: str, firebase_uid: str, cliente_rol: str,
+                               nombre_completo: str, rol_id: str = "CLIENTE", cargo: str = None,
+                               telefono: str = None, ver_todas_instalaciones: bool = False):
+        """Agregar el usuario recién creado a las listas cacheadas de usuarios con roles"""
+        rol = self._rol_cacheado(rol_id)
+        if rol is None:
+            return False
+        fila = {
+            'email_login': email,
+            'firebase_uid': firebase_uid,
+            'cliente_rol': cliente_rol,
+            'nombre_completo': nombre_completo,
+            'cargo': cargo,
+            'telefono': telefono,
+            'rol_id': rol_id,
+            'nombre_rol': rol['nombre_rol'],
+            'permisos': dict(rol['permisos']),
+            'ver_todas_instalaciones': ver_todas_instalaciones,
+            'activo': True,
+            'ultima_sesion': None,
+            'fecha_creacion': datetime.now().isoformat()
+        }
+        # La consulta ordena por fecha_creacion DESC: el nuevo usuario va primero
+        agregar = lambda usuarios: [dict(fila)] + [u for u in usuarios if u.get('email_login') != email]
+        self._cache.update("usuarios_con_roles:all", agregar)
+        self._cache.update(f"usuarios_con_roles:{cliente_rol}", agregar)
+        self._cache.invalidate_prefix("usuarios:")
+    
+    def _parche_update_usuario(self, resultado: Dict, email: str, **campos):
+        """Aplicar los campos actualizados a las filas cacheadas del usuario"""
+        return self._parche_update_usuarios(resultado, [email], **campos)
+    
+    def _parche_update_usuarios(self, resultado: Dict, emails: List[str], **campos):
+        """Aplicar los campos actualizados a las filas cacheadas de los usuarios"""
+        if 'cliente_rol' in campos:
+            # Cambia la pertenencia a las listas filtradas por cliente
+            return False
+        emails = set(emails)
+        cambios = dict(campos)
+        if 'rol_id' in campos:
+            rol = self._rol_cacheado(campos['rol_id'])
+            if rol is None:
+                return False
+            cambios['nombre_rol'] = rol['nombre_rol']
+            cambios['permisos'] = dict(rol['permisos'])
+        
+        def aplicar(valores: Dict):
+            return lambda usuarios: [dict(u, **valores) if u.get('email_login') in emails else u for u in usuarios]
+        
+        self._cache.update_prefix("usuarios:", aplicar(campos))
+        if campos.get('activo') is False:
+            # usuarios_con_roles solo contiene usuarios activos
+            self._cache.update_prefix(
+                "usuarios_con_roles:",
+                lambda usuarios: [u for u in usuarios if u.get('email_login') not in emails]
+            )
+        elif campos.get('activo') is True and not self._usuarios_activos_cacheados(emails):
+            # Reactivación: la fila completa no está en cache
+            self._cache.invalidate_prefix("usuarios_con_roles:")
+        else:
+            self._cache.update_prefix("usuarios_con_roles:", aplicar(cambios))
+    
+    def _usuarios_activos_cacheados(self, emails: set) -> bool:
+        """Indica si todos los emails ya figuran en la lista cacheada de usuarios activos
+
+        Editar un usuario activo envía activo=True sin que cambie: basta parchear sus filas.
+        """
+        usuarios = self._cache.peek("usuarios_con_roles:all")
+        if usuarios is None:
+            return False
+        return emails <= {u.get('email_login') for u in usuarios}
+    
+    def _parche_actualizar_rol_usuario(self, resultado: Dict, email_login: str, nuevo_rol_id: str):
+        """Actualizar rol y permisos del usuario en el cache"""
+        return self._parche_update_usuario(resultado, email_login, rol_id=nuevo_rol_id)
+    
+    def _parche_delete_usuario_total(self, resultado: Dict, emails: Union[str, List[str]]):
+        """Quitar del cache los usuarios eliminados y todas sus relaciones"""
+        emails = {emails} if isinstance(emails, str) else set(emails)
+        quitar = lambda usuarios: [u for u in usuarios if u.get('email_login') not in emails]
+        self._cache.update_prefix("usuarios:", quitar)
+        self._cache.update_prefix("usuarios_con_roles:", quitar)
+        for email in emails:
+            self._cache.invalidate(f"instalaciones_usuario:{email}")
+            self._cache.invalidate(f"instalaciones_usuario_detalle:{email}")
+            self._cache.invalidate_prefix(f"contactos_usuario:{email}:")
+            self._cache.invalidate(f"contacto_por_email:{email}")
+        
+        for contacto_id in resultado.get('contactos_eliminados') or []:
+            self._quitar_contacto_cacheado(contacto_id)
+    
+    def _quitar_contacto_cacheado(self, contacto_id: str) -> None:
+        """Quitar un contacto (eliminado o inactivo) de todas las listas cacheadas"""
+        quitar = lambda contactos: [c for c in contactos if c.get('contacto_id') != contacto_id]
+        self._cache.update_prefix("contactos:", quitar)
+        self._cache.update_prefix("contactos_instalacion:", quitar)
+        self._cache.update(
+            "todos_contactos_por_instalacion",
+            lambda mapa: {inst: quitar(cs) for inst, cs in mapa.items() if quitar(cs)}
+        )
+        self._cache.invalidate(f"instalaciones_contacto:{contacto_id}")
+        self._cache.invalidate_prefix("contacto_por_email:")
+    
+    def _parche_create_contacto(self, resultado: Dict, nombre: str, telefono: str,
+                                cargo: str = None, email: str = None, es_usuario_app: bool = False):
+        """Un contacto nuevo no tiene instalaciones: solo cambia la lista de contactos"""
+        self._cache.invalidate_prefix("contactos:")
+        if email:
+            self._cache.invalidate(f"contacto_por_email:{email}")
+    
+    def _parche_update_contacto(self, resultado: Dict, contacto_id: str, **campos):
+        """Aplicar los campos actualizados a las filas cacheadas del contacto"""
+        if campos.get('activo') is False:
+            self._quitar_contacto_cacheado(contacto_id)
+            return
+        if campos.get('activo') is True:
+            return False
+        
+        def aplicar(contactos):
+            return [
+                dict(c, **{k: v for k, v in campos.items() if k in c}) if c.get('contacto_id') == contacto_id else c
+                for c in contactos
+            ]
+        
+        self._cache.update_prefix("contactos:", aplicar)
+        self._cache.update_prefix("contactos_instalacion:", aplicar)
+        self._cache.update(
+            "todos_contactos_por_instalacion",
+            lambda mapa: {inst: aplicar(cs) for inst, cs in mapa.items()}
+        )
+        if 'email' in campos or 'email_usuario_app' in campos:
+            self._cache.invalidate_prefix("contacto_por_email:")
+        else:
+            self._cache.update_prefix("contacto_por_email:", lambda c: aplicar([c])[0])
+    
+    def _reubicar_contacto(self, contacto_id: str, instalaciones) -> Optional[bool]:
+        """Reflejar en el cache que el contacto quedó asignado exactamente a `instalaciones`"""
+        instalaciones = set(instalaciones)
+        contacto = self._contacto_cacheado(contacto_id)
+        if contacto is None and instalaciones:
+            return False
+        self._cache.set(
+            f"instalaciones_contacto:{contacto_id}", sorted(instalaciones),
+            tablas=(TABLE_INST_CONTACTO,), ttl=CACHE_TTL_PERMISOS
+        )
+        fila = None
+        if contacto is not None:
+            fila = {k: contacto.get(k) for k in ('contacto_id', 'nombre_contacto', 'telefono', 'cargo', 'email')}
+        
+        def ajustar(inst: str, contactos: List[Dict]) -> List[Dict]:
+            resto = [c for c in contactos if c.get('contacto_id') != contacto_id]
+            if inst in instalaciones:
+                resto.append(dict(fila))
+                resto.sort(key=lambda c: c.get('nombre_contacto') or '')
+            return resto
+        
+        for clave in self._cache.keys("contactos_instalacion:"):
+            inst = clave.split(":", 1)[1]
+            self._cache.update(clave, lambda cs, inst=inst: ajustar(inst, cs))
+        
+        def ajustar_mapa(mapa: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+            nuevo = {inst: ajustar(inst, cs) for inst, cs in mapa.items()}
+            for inst in instalaciones - set(mapa):
+                nuevo[inst] = ajustar(inst, [])
+            return {inst: cs for inst, cs in nuevo.items() if cs}
+        
+        self._cache.update("todos_contactos_por_instalacion", ajustar_mapa)
+    
+    def _parche_asignar_contacto_instalacion(self, resultado: Dict, contacto_id: str, instalacion_rol: str):
+        """Agregar la instalación a las asignaciones cacheadas del contacto"""
+        actuales = self._cache.peek(f"instalaciones_contacto:{contacto_id}")
+        if actuales is None:
+            return False
+        return self._reubicar_contacto(contacto_id, set(actuales) | {instalacion_rol})
+    
+    def _parche_sincronizar_instalaciones_contacto(self, resultado: Dict, email_usuario: str,
+                                                   instalaciones_con_cliente: Dict[str, str]):
+        """Reflejar la sincronización salvo que la eliminación haya quedado diferida"""
+        if resultado.get('eliminacion_diferida') or not resultado.get('contacto_id'):
+            return False
+        return self._reubicar_contacto(resultado['contacto_id'], (instalaciones_con_cliente or {}).keys())
+    
+    def _parche_asignar_instalaciones_contacto(self, resultado: Dict, contacto_id: str, instalaciones: List[str]):
+        """Las asignaciones del contacto quedan reemplazadas por `instalaciones`"""
+        return self._reubicar_contacto(contacto_id, instalaciones or [])
+    
+    def _guardar_instalaciones_usuario(self, email: str, detalle: Dict[str, Dict]) -> None:
+        """Escribir en el cache las instalaciones recién asignadas a un usuario"""
+        self._cache.set(
+            f"instalaciones_usuario:{email}", list(detalle.keys()),
+            tablas=(TABLE_USUARIO_INST,), ttl=CACHE_TTL_PERMISOS
+        )
+        self._cache.set(
+            f"instalaciones_usuario_detalle:{email}", detalle,
+            tablas=(TABLE_USUARIO_INST,), ttl=CACHE_TTL_PERMISOS
+        )
+    
+    def _parche_asignar_instalaciones(self, resultado: Dict, email: str, cliente_rol: str, instalaciones: List[str]):
+        """Reemplazar las asignaciones cacheadas; las que ya existían conservan su marca de encuesta"""
+        anterior = self._cache.peek(f"instalaciones_usuario_detalle:{email}")
+        if anterior is None:
+            # El MERGE no toca requiere_encuesta_individual de las filas existentes: sin
+            # el detalle previo no se conoce, así que se descarta lo cacheado del usuario
+            self._cache.invalidate(f"instalaciones_usuario:{email}")
+            self._cache.invalidate(f"instalaciones_usuario_detalle:{email}")
+            return
+        self._guardar_instalaciones_usuario(email, {
+            inst: dict(anterior.get(inst, {'requiere_encuesta_individual': False}), puede_ver=True)
+            for inst in (instalaciones or [])
+        })
+    
+    def _parche_asignar_instalaciones_multi_cliente(self, resultado: Dict, email: str,
+                                                    instalaciones_con_cliente: Dict[str, str],
+                                                    instalaciones_detalle: Dict[str, Dict] = None):
+        detalle = {}
+        for inst in (instalaciones_con_cliente or {}):
+            requiere = bool((instalaciones_detalle or {}).get(inst, {}).get('requiere_encuesta_individual', False))
+            detalle[inst] = {'puede_ver': True, 'requiere_encuesta_individual': requiere}
+        self._guardar_instalaciones_usuario(email, detalle)
+    
+    def _parche_asignar_instalaciones_usuarios(self, resultado: Dict, emails: List[str],
+                                               instalaciones_con_cliente: Dict[str, str]):
+        """Agregar las instalaciones otorgadas a las listas cacheadas de cada usuario"""
+        nuevas = list(instalaciones_con_cliente or {})
+        for email in emails:
+            self._cache.update(
+                f"instalaciones_usuario:{email}",
+                lambda actuales: actuales + [i for i in nuevas if i not in actuales]
+            )
+            self._cache.update(
+                f"instalaciones_usuario_detalle:{email}",
+                lambda detalle: {
+                    **detalle,
+                    **{i: dict(detalle.get(i, {'requiere_encuesta_individual': False}), puede_ver=True)
+                       for i in nuevas},
+                }
+            )
+    
+    def _parche_asignar_contactos_usuario(self, resultado: Dict, email: str, instalacion_rol: str,
+                                          contactos: List[str], asignado_por: str):
+        self._cache.set(
+            f"contactos_usuario:{email}:{instalacion_rol}", list(contactos or []),
+            tablas=(TABLE_USUARIO_CONTACTOS,), ttl=CACHE_TTL_PERMISOS
+        )
@@ -0,0 +1,197 @@
+"""
+Planificador de escrituras DML: turno por tabla, límite de trabajos simultáneos,
+agrupación de mutaciones compatibles y reintentos ante conflictos de concurrencia
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+# Mensajes de BigQuery que indican un conflicto transitorio (la escritura no se aplicó)
+CONFLICTOS = (
+    "could not serialize access",
+    "concurrent update",
+    "too many dml statements outstanding",
+    "exceeded rate limits",
+)
+
+
+def es_conflicto(error: Any) -> bool:
+    """Indica si un error (excepción o texto) es un conflicto de concurrencia reintentable"""
+    texto = str(error or "").lower()
+    return any(marca in texto for marca in CONFLICTOS)
+
+
+class _Grupo:
+    """Mutaciones pendientes que se ejecutarán juntas en una sola sentencia"""
+
+    def __init__(self):
+        self.elementos: List[Any] = []
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class DmlScheduler:
+    """Ordena las escrituras de BigQueryService para no chocar con los límites de DML.
+
+    - Cada tabla tiene un turno: sus mutaciones se ejecutan de a una (BigQuery serializa
+      los UPDATE/DELETE/MERGE sobre una misma tabla y rechaza los que entran en conflicto).
+    - Como máximo `max_concurrentes` trabajos de escritura corren a la vez en total.
+    - Los conflictos de serialización se reintentan con espera exponencial y jitter; durante
+      la espera se liberan el turno y el cupo.
+    - `agrupar` junta en una sola sentencia las mutaciones compatibles que esperan turno.
+    """
+
+    def __init__(self, max_concurrentes: int = 4, reintentos: int = 5, espera_base: float = 1.0):
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self._cupos = threading.BoundedSemaphore(max_concurrentes)
+        self._turnos: Dict[str, threading.Lock] = {}
+        self._grupos: Dict[Hashable, _Grupo] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'ejecutadas': 0, 'reintentos': 0, 'agrupadas': 0}
+
+    def ejecutar(self, tablas: Iterable[str], funcion: Callable[[], Any],
+                 al_terminar: Callable[[Any], None] = None):
+        """Ejecutar `funcion()` con turno exclusivo sobre `tablas`, reintentando conflictos.
+
+        La función puede lanzar el error o devolver {'success': False, 'error': ...}.
+        `al_terminar(resultado)` corre todavía dentro del turno (p.ej. parchear el cache),
+        así dos escrituras sobre la misma tabla se reflejan en el mismo orden en que se
+        aplicaron.
+        """
+        intento = 0
+        while True:
+            with self._turno(tablas):
+                try:
+                    resultado = funcion()
+                except Exception as e:
+                    if not es_conflicto(e) or intento >= self.reintentos:
+                        raise
+                else:
+                    fallo = isinstance(resultado, dict) and resultado.get('success') is False
+                    if not (fallo and es_conflicto(resultado.get('error'))) or intento >= self.reintentos:
+                        self._contar('ejecutadas')
+                        if al_terminar is not None:
+                            al_terminar(resultado)
+                        return resultado
+            # Esperar fuera del turno: otras escrituras pueden avanzar mientras tanto
+            intento += 1
+            self._contar('reintentos')
+            espera = self.espera_base * (2 ** (intento - 1)) * (1 + random.random())
+            print(f"[DML] Conflicto de concurrencia en {', '.join(self._propias(tablas))}: "
+                  f"reintento {intento}/{self.reintentos} en {espera:.1f}s")
+            time.sleep(espera)
+
+    def agrupar(self, tablas: Iterable[str], clave: Hashable, elemento: Any,
+                funcion_lote: Callable[[List[Any]], Any]):
+        """Encolar una mutación compatible con otras de la misma `clave`.
+
+        El primer llamador espera el turno de las tablas; mientras tanto, los demás con la
+        misma clave se suman al grupo. Al obtener el turno se cierra el grupo, se libera
+        el turno y se ejecuta una sola vez `funcion_lote(elementos)`, que debe tomar su
+        propio turno con `ejecutar` (p.ej. un método @_escritura). Todos reciben el mismo
+        resultado (o excepción).
+        """
+        with self._lock:
+            grupo = self._grupos.get(clave)
+            lider = grupo is None
+            if lider:
+                grupo = self._grupos[clave] = _Grupo()
+            grupo.elementos.append(elemento)
+
+        if not lider:
+            grupo.listo.wait()
+        else:
+            try:
+                with self._turno(tablas):
+                    with self._lock:
+                        self._grupos.pop(clave, None)
+                        elementos = list(grupo.elementos)
+                if len(elementos) > 1:
+                    self._contar('agrupadas', len(elementos) - 1)
+                grupo.resultado = funcion_lote(elementos)
+            except Exception as e:
+                grupo.error = e
+            finally:
+                with self._lock:
+                    if self._grupos.get(clave) is grupo:
+                        self._grupos.pop(clave, None)
+                grupo.listo.set()
+
+        if grupo.error is not None:
+            raise grupo.error
+        return grupo.resultado
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de sentencias ejecutadas, reintentos y mutaciones agrupadas"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _contar(self, nombre: str, cantidad: int = 1) -> None:
+        with self._lock:
+            self._stats[nombre] += cantidad
+
+    def _propias(self, tablas: Iterable[str]) -> Tuple[str, ...]:
+        return tuple(sorted(set(tablas)))
+
+    def _turno(self, tablas: Iterable[str]):
+        return _Turno(self, self._propias(tablas))
+
+
+class _Turno:
+    """Contexto que toma los turnos de las tablas (en orden alfabético) y luego el cupo global.
+
+    Un hilo toma todas sus tablas de una vez, en el mismo orden global que los demás, y
+    así no hay interbloqueo. Dentro de un turno se permite volver a pedir tablas ya
+    tomadas (una escritura que llama a otra sobre la misma tabla). Pedir una tabla nueva
+    rompería ese orden, por eso se rechaza con RuntimeError.
+    """
+
+    def __init__(self, planificador: DmlScheduler, tablas: Tuple[str, ...]):
+        self.planificador = planificador
+        self.tablas = tablas
+        self.nuevas: List[str] = []
+        self.tomadas: List[threading.Lock] = []
+        self.cupo = False
+
+    def __enter__(self):
+        p = self.planificador
+        propias = getattr(p._local, 'tablas', None)
+        if propias is None:
+            propias = p._local.tablas = set()
+        self.nuevas = [t for t in self.tablas if t not in propias]
+        if not self.nuevas:
+            return self
+        if propias:
+            raise RuntimeError(
+                f"Turno DML anidado pide tablas no tomadas ({', '.join(self.nuevas)}) "
+                f"mientras tiene {', '.join(sorted(propias))}: declarar todas en la escritura externa"
+            )
+        self.nuevas = []
+        # Las tablas se toman siempre en orden alfabético: dos escrituras no se bloquean mutuamente
+        for tabla in self.tablas:
+            with p._lock:
+                turno = p._turnos.setdefault(tabla, threading.Lock())
+            turno.acquire()
+            self.tomadas.append(turno)
+            propias.add(tabla)
+            self.nuevas.append(tabla)
+        # El cupo global se pide con el turno ya tomado: quien espera una tabla no
+        # ocupa cupo que otra tabla libre podría usar
+        p._cupos.acquire()
+        self.cupo = True
+        return self
+
+    def __exit__(self, *exc):
+        p = self.planificador
+        for tabla in self.nuevas:
+            p._local.tablas.discard(tabla)
+        for turno in reversed(self.tomadas):
+            turno.release()
+        if self.cupo:
+            p._cupos.release()
+        return False
@@ -3,11 +3,18 @@ Servicio de Firebase Admin - Gestión de usuarios
 """
 import firebase_admin
 from firebase_admin import auth, credentials
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, List
+import hashlib
 import os
+import uuid
 import requests
 import json
-from config.settings import FIREBASE_API_KEY, PROJECT_ID
+from config.settings import (
+    FIREBASE_API_KEY, PROJECT_ID, FIREBASE_IMPORT_LOTE, FIREBASE_IMPORT_HASH_ROUNDS
+)
+from services.http_session import get_session
 
 
 class FirebaseService:
@@ -15,6 +22,8 @@ class FirebaseService:
     
     def __init__(self):
         """Inicializar Firebase Admin SDK"""
+        # Conexiones keep-alive reutilizadas por todas las llamadas REST
+        self.http = get_session()
         try:
             # Intentar inicializar si no está inicializado
             firebase_admin.get_app()
@@ -85,6 +94,83 @@ class FirebaseService:
                 'error': f'Error al crear usuario: {str(e)}'
             }
     
+    def create_users_bulk(self, usuarios: List[Dict], hilos: int = 8) -> List[Dict]:
+        """
+        Crear muchos usuarios con la importación por lotes del Admin SDK (auth.import_users)
+        
+        Los UID se generan localmente y las contraseñas se envían como hash PBKDF2-SHA256,
+        de modo que cada llamada crea hasta FIREBASE_IMPORT_LOTE usuarios.
+        
+        Args:
+            usuarios: dicts con email, password y display_name
+            hilos: hilos para calcular los hashes de contraseña
+            
+        Returns:
+            Lista alineada con `usuarios`: {'success', 'uid', 'email'} o {'success': False, 'error'}
+        """
+        resultados: List[Optional[Dict]] = [None] * len(usuarios)
+        
+        # import_users no rechaza emails ya registrados: verificarlos antes (100 por llamada)
+        existentes = set()
+        emails = [u['email'] for u in usuarios]
+        for inicio in range(0, len(emails), 100):
+            try:
+                respuesta = auth.get_users([auth.EmailIdentifier(e) for e in emails[inicio:inicio + 100]])
+                existentes.update(user.email.lower() for user in respuesta.users if user.email)
+            except Exception as e:
+                for i in range(inicio, min(inicio + 100, len(emails))):
+                    resultados[i] = {'success': False, 'error': f'Error al verificar usuario: {str(e)}'}
+        
+        pendientes = []
+        for i, usuario in enumerate(usuarios):
+            if resultados[i] is not None:
+                continue
+            if usuario['email'].lower() in existentes:
+                resultados[i] = {'success': False, 'error': 'El email ya está registrado'}
+            else:
+                pendientes.append(i)
+        
+        def preparar(usuario: Dict):
+            salt = os.urandom(16)
+            password_hash = hashlib.pbkdf2_hmac(
+                'sha256', usuario['password'].encode('utf-8'), salt, FIREBASE_IMPORT_HASH_ROUNDS
+            )
+            return auth.ImportUserRecord(
+                uid=uuid.uuid4().hex,
+                email=usuario['email'],
+                display_name=usuario.get('display_name'),
+                email_verified=False,
+                password_hash=password_hash,
+                password_salt=salt,
+            )
+        
+        # hashlib libera el GIL: los hashes se calculan en paralelo
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            registros = list(pool.map(preparar, [usuarios[i] for i in pendientes]))
+        
+        algoritmo = auth.UserImportHash.pbkdf2_sha256(rounds=FIREBASE_IMPORT_HASH_ROUNDS)
+        for inicio in range(0, len(registros), FIREBASE_IMPORT_LOTE):
+            bloque = registros[inicio:inicio + FIREBASE_IMPORT_LOTE]
+            try:
+                respuesta = auth.import_users(bloque, hash_alg=algoritmo)
+                errores = {error.index: error.reason for error in respuesta.errors}
+            except Exception as e:
+                errores = {j: str(e) for j in range(len(bloque))}
+            
+            for j, registro in enumerate(bloque):
+                indice = pendientes[inicio + j]
+                if j in errores:
+                    resultados[indice] = {'success': False, 'error': f'Error al crear usuario: {errores[j]}'}
+                else:
+                    resultados[indice] = {
+                        'success': True,
+                        'uid': registro.uid,
+                        'email': registro.email,
+                        'display_name': registro.display_name,
+                    }
+        
+        return resultados
+    
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """
         Obtener información de un usuario por email
@@ -112,6 +198,46 @@ class FirebaseService:
             print(f"Error al obtener usuario: {e}")
             return None
     
+    def get_users_bulk(self, usuarios: List[Dict], hilos: int = 4) -> Dict[str, Dict]:
+        """
+        Obtener estado de muchos usuarios con auth.get_users (100 identificadores por
+        llamada, bloques en paralelo)
+        
+        Args:
+            usuarios: dicts con 'email' y opcionalmente 'uid' (se prefiere el UID)
+            hilos: llamadas simultáneas
+            
+        Returns:
+            Dict email (minúsculas) -> {'uid', 'disabled', 'ultima_sesion'}; los usuarios
+            que no existen en Firebase no aparecen
+        """
+        identificadores = [
+            auth.UidIdentifier(u['uid']) if u.get('uid') else auth.EmailIdentifier(u['email'])
+            for u in usuarios
+        ]
+        bloques = [identificadores[i:i + 100] for i in range(0, len(identificadores), 100)]
+        
+        def consultar(bloque):
+            try:
+                return auth.get_users(bloque).users
+            except Exception as e:
+                print(f"[FIREBASE] Error consultando {len(bloque)} usuarios: {e}")
+                return []
+        
+        estados = {}
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for registros in pool.map(consultar, bloques):
+                for user in registros:
+                    if not user.email:
+                        continue
+                    ms = user.user_metadata.last_sign_in_timestamp if user.user_metadata else None
+                    estados[user.email.lower()] = {
+                        'uid': user.uid,
+                        'disabled': user.disabled,
+                        'ultima_sesion': datetime.fromtimestamp(ms / 1000, tz=timezone.utc) if ms else None,
+                    }
+        return estados
+    
     def authenticate_user(self, email: str, password: str) -> Optional[Dict]:
         """
         Autenticar usuario con email y contraseña usando Firebase REST API
@@ -185,7 +311,7 @@ class FirebaseService:
             }
             
             # Realizar petición de autenticación
-            response = requests.post(auth_url, json=auth_data)
+            response = self.http.post(auth_url, json=auth_data)
             
             if response.status_code == 200:
                 auth_result = response.json()
@@ -272,6 +398,46 @@ class FirebaseService:
                 'error': f'Error al eliminar usuario: {str(e)}'
             }
     
+    def delete_users_bulk(self, uids: List[str]) -> Dict:
+        """
+        Eliminar varios usuarios por UID (hasta 1000 por llamada del Admin SDK)
+        
+        Returns:
+            Dict con cantidad de eliminados y errores
+        """
+        eliminados, errores = 0, []
+        for inicio in range(0, len(uids), 1000):
+            try:
+                respuesta = auth.delete_users(uids[inicio:inicio + 1000])
+                eliminados += respuesta.success_count
+                errores.extend(error.reason for error in respuesta.errors)
+            except Exception as e:
+                errores.append(str(e))
+        return {'success': not errores, 'eliminados': eliminados, 'errores': errores}
+    
+    def update_users_bulk(self, uids: List[str], hilos: int = 8, **kwargs) -> Dict:
+        """
+        Aplicar los mismos cambios (p.ej. disabled) a varios usuarios por UID
+
+        El Admin SDK no tiene actualización por lotes: las llamadas se reparten en un
+        pool acotado de hilos que reutiliza las conexiones del SDK.
+
+        Returns:
+            Dict con cantidad de actualizados y errores
+        """
+        def actualizar(uid: str) -> Optional[str]:
+            try:
+                auth.update_user(uid, **kwargs)
+                return None
+            except auth.UserNotFoundError:
+                return None
+            except Exception as e:
+                return f'{uid}: {str(e)}'
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            errores = [error for error in pool.map(actualizar, uids) if error]
+        return {'success': not errores, 'actualizados': len(uids) - len(errores), 'errores': errores}
+
     def reset_password(self, email: str, new_password: str) -> Dict:
         """
         Resetear contraseña de un usuario
@@ -0,0 +1,123 @@
+"""
+Oráculo de frescura: fecha de última modificación de todas las tablas en una consulta por ubicación
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from google.cloud import bigquery
+
+
+class FreshnessOracle:
+    """Consulta los metadatos (`__TABLES__`) de todas las tablas vigiladas.
+
+    Los datasets se agrupan por ubicación (una consulta UNION ALL no puede mezclar
+    ubicaciones) y se hace un viaje por grupo; si un grupo falla se reintenta dataset
+    por dataset, de modo que un dataset inaccesible solo afecta a sus propias tablas.
+    Las consultas se limitan a una cada `intervalo` segundos; entre medio se usan los
+    últimos valores conocidos. Las vistas y tablas no encontradas no tienen fecha
+    confiable (None) y siempre se consideran modificadas.
+    """
+
+    TIPO_TABLA = 1  # __TABLES__.type: 1 tabla, 2 vista, 3 externa
+
+    def __init__(self, client_fn: Callable[[], "bigquery.Client"], tablas: Iterable[str], intervalo: float = 30):
+        self._client_fn = client_fn
+        self.tablas: Tuple[str, ...] = tuple(dict.fromkeys(tablas))
+        self.intervalo = intervalo
+        self._modificados: Dict[str, Optional[int]] = {}
+        self._ultima_consulta: Optional[float] = None
+        self._ubicaciones: Dict[Tuple[str, str], Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def actualizar(self, forzar: bool = False) -> Set[str]:
+        """Releer los metadatos y devolver las tablas que cambiaron desde la lectura anterior"""
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and self._ultima_consulta is not None and ahora - self._ultima_consulta < self.intervalo:
+                return set()
+            anteriores = self._modificados
+            self._modificados = self._consultar()
+            self._ultima_consulta = ahora
+            # Una tabla vista por primera vez es la línea base, no un cambio
+            return {t for t in self.tablas
+                    if self._modificados.get(t) is None
+                    or (t in anteriores and self._modificados.get(t) != anteriores.get(t))}
+
+    def marca(self, tablas: Iterable[str]) -> Optional[Tuple]:
+        """Fechas de modificación conocidas de las tablas (None si alguna es desconocida)
+
+        La primera llamada lee los metadatos, para que las entradas guardadas antes de
+        cualquier "Sincronizar" también queden marcadas.
+        """
+        if self._ultima_consulta is None:
+            self.actualizar()
+        marca = tuple(self._modificados.get(t) for t in tablas)
+        if not marca or any(m is None for m in marca):
+            return None
+        return marca
+
+    def vigente(self, tablas: Iterable[str], marca: Optional[Tuple]) -> bool:
+        """Indica si ninguna de las tablas cambió desde que se tomó `marca`"""
+        tablas = tuple(tablas)
+        if marca is None or not tablas:
+            return False
+        self.actualizar()
+        return self.marca(tablas) == marca
+
+    def _consultar(self) -> Dict[str, Optional[int]]:
+        """Una consulta UNION ALL sobre `__TABLES__` por cada ubicación de datasets"""
+        por_dataset = defaultdict(list)
+        for tabla in self.tablas:
+            proyecto, dataset, nombre = tabla.split('.')
+            por_dataset[(proyecto, dataset)].append(nombre)
+
+        por_ubicacion = defaultdict(dict)
+        for dataset, nombres in por_dataset.items():
+            por_ubicacion[self._ubicacion(dataset)][dataset] = nombres
+
+        modificados: Dict[str, Optional[int]] = {}
+        for ubicacion, datasets in por_ubicacion.items():
+            try:
+                modificados.update(self._consultar_grupo(datasets, ubicacion))
+            except Exception as e:
+                if len(datasets) == 1:
+                    print(f"[FRESCURA] No se pudieron leer los metadatos de {', '.join(map('.'.join, datasets))}: {e}")
+                    continue
+                print(f"[FRESCURA] Falló la consulta en {ubicacion or 'ubicación desconocida'}; se consulta cada dataset: {e}")
+                for dataset, nombres in datasets.items():
+                    try:
+                        modificados.update(self._consultar_grupo({dataset: nombres}, ubicacion))
+                    except Exception as e_dataset:
+                        # Sus tablas quedan sin fecha: se consideran modificadas
+                        print(f"[FRESCURA] No se pudieron leer los metadatos de {'.'.join(dataset)}: {e_dataset}")
+        return modificados
+
+    def _ubicacion(self, dataset: Tuple[str, str]) -> Optional[str]:
+        """Ubicación de un dataset (se pide una sola vez; None si no se pudo obtener)"""
+        if dataset not in self._ubicaciones:
+            try:
+                self._ubicaciones[dataset] = self._client_fn().get_dataset('.'.join(dataset)).location
+            except Exception as e:
+                print(f"[FRESCURA] No se pudo obtener la ubicación de {'.'.join(dataset)}: {e}")
+                return None
+        return self._ubicaciones[dataset]
+
+    def _consultar_grupo(self, datasets: Dict[Tuple[str, str], list], ubicacion: Optional[str]) -> Dict[str, Optional[int]]:
+        partes, parametros = [], []
+        for i, ((proyecto, dataset), nombres) in enumerate(datasets.items()):
+            partes.append(f"""
+                SELECT CONCAT(project_id, '.', dataset_id, '.', table_id) AS tabla,
+                       last_modified_time, type
+                FROM `{proyecto}.{dataset}.__TABLES__`
+                WHERE table_id IN UNNEST(@tablas_{i})
+            """)
+            parametros.append(bigquery.ArrayQueryParameter(f"tablas_{i}", "STRING", nombres))
+
+        job_config = bigquery.QueryJobConfig(query_parameters=parametros, use_query_cache=False)
+        filas = self._client_fn().query(" UNION ALL ".join(partes), job_config=job_config, location=ubicacion).result()
+        return {
+            row.tabla: (row.last_modified_time if row.type == self.TIPO_TABLA else None)
+            for row in filas
+        }
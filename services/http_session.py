@@ -0,0 +1,54 @@
+"""
+Sesión HTTP compartida (pool de conexiones keep-alive, timeouts y reintentos) para APIs REST
+"""
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config.settings import HTTP_TIMEOUT, HTTP_REINTENTOS, HTTP_POOL_CONEXIONES
+
+
+class SesionHTTP(requests.Session):
+    """requests.Session con timeout por defecto: ninguna llamada puede quedar colgada"""
+
+    def __init__(self, timeout=HTTP_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_sesion: Optional[SesionHTTP] = None
+_lock = threading.Lock()
+
+
+def get_session() -> SesionHTTP:
+    """Obtener la sesión compartida (se crea una sola vez; requests.Session es segura entre hilos
+    para peticiones independientes)"""
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                reintentos = Retry(
+                    total=HTTP_REINTENTOS,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({'GET', 'POST'}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adaptador = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONEXIONES,
+                    pool_maxsize=HTTP_POOL_CONEXIONES,
+                    max_retries=reintentos,
+                )
+                sesion = SesionHTTP()
+                sesion.mount('https://', adaptador)
+                sesion.mount('http://', adaptador)
+                _sesion = sesion
+    return _sesion
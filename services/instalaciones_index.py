@@ -0,0 +1,82 @@
+"""
+Índice en memoria de la jerarquía zona -> cliente -> instalación, para que los filtros
+de las pantallas no recorran la lista completa de instalaciones en cada cambio
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+from services.search_index import IndiceBusqueda
+
+
+class InstalacionesIndex:
+    """Instalaciones indexadas por zona, cliente y texto (instalación, cliente y zona).
+
+    Las posiciones refieren a `instalaciones`, en el mismo orden en que se recibieron.
+    Se construye una vez por versión de los datos y no se modifica después: puede
+    compartirse entre hilos y pantallas.
+    """
+
+    def __init__(self, instalaciones: Iterable):
+        self.instalaciones: List = list(instalaciones)
+        self._por_zona: Dict[str, Set[int]] = {}
+        self._por_cliente: Dict[str, Set[int]] = {}
+        self._clientes_por_zona: Dict[str, Set[str]] = {}
+        for posicion, inst in enumerate(self.instalaciones):
+            zona = getattr(inst, 'zona', None)
+            cliente = getattr(inst, 'cliente_rol', None)
+            if zona:
+                self._por_zona.setdefault(zona, set()).add(posicion)
+            if cliente:
+                self._por_cliente.setdefault(cliente, set()).add(posicion)
+                if zona:
+                    self._clientes_por_zona.setdefault(zona, set()).add(cliente)
+        self._zonas = sorted(self._por_zona)
+        self._clientes = sorted(self._por_cliente)
+        self._texto = IndiceBusqueda.de_elementos(
+            self.instalaciones,
+            lambda i: (getattr(i, 'instalacion_rol', None), getattr(i, 'cliente_rol', None), getattr(i, 'zona', None)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.instalaciones)
+
+    def zonas(self) -> List[str]:
+        """Zonas con al menos una instalación (ordenadas)"""
+        return list(self._zonas)
+
+    def clientes(self, zona: Optional[str] = None) -> List[str]:
+        """Clientes de una zona, o todos si `zona` es None (ordenados)"""
+        if zona is None:
+            return list(self._clientes)
+        return sorted(self._clientes_por_zona.get(zona, ()))
+
+    def filtrar(self, zona: Optional[str] = None, cliente: Optional[str] = None,
+                texto: str = "") -> Optional[Set[int]]:
+        """Posiciones que cumplen todos los filtros indicados (None = sin filtro)
+
+        Se parte del conjunto más chico y se intersecta con los demás, de modo que el
+        costo depende del tamaño del resultado y no del total de instalaciones.
+        """
+        conjuntos = []
+        if zona is not None:
+            conjuntos.append(self._por_zona.get(zona, set()))
+        if cliente is not None:
+            conjuntos.append(self._por_cliente.get(cliente, set()))
+        if texto and texto.strip():
+            conjuntos.append(self._texto.buscar(texto))
+        if not conjuntos:
+            return None
+        conjuntos.sort(key=len)
+        resultado = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            resultado.intersection_update(conjunto)
+            if not resultado:
+                break
+        return resultado
+
+    def seleccionar(self, zona: Optional[str] = None, cliente: Optional[str] = None,
+                    texto: str = "") -> List:
+        """Instalaciones que cumplen los filtros, en el orden original"""
+        posiciones = self.filtrar(zona, cliente, texto)
+        if posiciones is None:
+            return list(self.instalaciones)
+        return [self.instalaciones[p] for p in sorted(posiciones)]
@@ -0,0 +1,172 @@
+"""
+Cache en memoria para resultados de consultas (TTL por clave + expulsión LRU)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class _Entrada:
+    """Valor cacheado junto a su vencimiento y las tablas de las que depende"""
+    __slots__ = ('valor', 'expira', 'tablas', 'ttl', 'marca')
+
+    def __init__(self, valor: Any, expira: float, tablas: Tuple[str, ...], ttl: int = 0, marca: Any = None):
+        self.valor = valor
+        self.expira = expira
+        self.tablas = tablas
+        self.ttl = ttl
+        self.marca = marca
+
+
+class QueryCache:
+    """Cache con TTL por clave, tamaño acotado (LRU), contadores e invalidación por tabla.
+
+    Si se asigna `frescura` (ver FreshnessOracle), una entrada vencida cuyas tablas no
+    cambiaron desde que se guardó se renueva en lugar de descartarse.
+    """
+
+    def __init__(self, max_entradas: int = 256, ttl_defecto: int = 300):
+        self.max_entradas = max_entradas
+        self.ttl_defecto = ttl_defecto
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._versiones: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.expulsiones = 0
+        self.renovaciones = 0
+        self.frescura = None
+
+    def get(self, clave: str, default: Any = None) -> Any:
+        """Obtener un valor vigente; las entradas vencidas cuentan como miss"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return default
+            if entrada.expira > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return entrada.valor
+
+        # Vencida: consultar la frescura fuera del lock (puede requerir un viaje a BigQuery)
+        vigente = self.frescura is not None and self.frescura.vigente(entrada.tablas, entrada.marca)
+        with self._lock:
+            if self._entradas.get(clave) is not entrada:
+                self.misses += 1
+                return default
+            if vigente:
+                entrada.expira = time.monotonic() + entrada.ttl
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                self.renovaciones += 1
+                return entrada.valor
+            self._eliminar(clave)
+            self.misses += 1
+            return default
+
+    def peek(self, clave: str, default: Any = None) -> Any:
+        """Valor vigente sin revalidar ni contar en las estadísticas (no consulta BigQuery)"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.expira <= time.monotonic():
+                return default
+            return entrada.valor
+
+    def set(self, clave: str, valor: Any, tablas: Iterable[str] = (), ttl: Optional[int] = None) -> None:
+        """Guardar un valor asociado a las tablas de origen de la consulta"""
+        ttl = self.ttl_defecto if ttl is None else ttl
+        tablas = tuple(tablas)
+        # Fuera del lock: la primera marca consulta los metadatos en BigQuery
+        marca = self.frescura.marca(tablas) if self.frescura is not None else None
+        with self._lock:
+            if clave in self._entradas:
+                self._eliminar(clave)
+            entrada = _Entrada(valor, time.monotonic() + ttl, tablas, ttl, marca)
+            self._entradas[clave] = entrada
+            self._incrementar_version(entrada.tablas)
+            while len(self._entradas) > self.max_entradas:
+                clave_lru = next(iter(self._entradas))
+                self._eliminar(clave_lru)
+                self.expulsiones += 1
+
+    def update(self, clave: str, funcion: Callable[[Any], Any]) -> bool:
+        """Reemplazar el valor vigente de una clave por `funcion(valor)` conservando vigencia y tablas"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada.expira <= time.monotonic():
+                return False
+            entrada.valor = funcion(entrada.valor)
+            self._incrementar_version(entrada.tablas)
+            return True
+
+    def keys(self, prefijo: str = "") -> List[str]:
+        """Claves vigentes que comienzan con el prefijo"""
+        ahora = time.monotonic()
+        with self._lock:
+            return [c for c, e in self._entradas.items() if c.startswith(prefijo) and e.expira > ahora]
+
+    def update_prefix(self, prefijo: str, funcion: Callable[[Any], Any]) -> int:
+        """Aplicar `update` a todas las claves vigentes con el prefijo"""
+        with self._lock:
+            claves = self.keys(prefijo)
+            for clave in claves:
+                self.update(clave, funcion)
+            return len(claves)
+
+    def invalidate(self, clave: str) -> bool:
+        """Eliminar una clave puntual"""
+        with self._lock:
+            if clave not in self._entradas:
+                return False
+            self._eliminar(clave)
+            return True
+
+    def invalidate_prefix(self, prefijo: str) -> int:
+        """Eliminar todas las claves que comienzan con el prefijo"""
+        with self._lock:
+            claves = [c for c in self._entradas if c.startswith(prefijo)]
+            for clave in claves:
+                self._eliminar(clave)
+            return len(claves)
+
+    def invalidate_tables(self, *tablas: str) -> int:
+        """Eliminar todas las entradas que dependen de alguna de las tablas"""
+        objetivo = set(tablas)
+        with self._lock:
+            claves = [c for c, e in self._entradas.items() if objetivo.intersection(e.tablas)]
+            for clave in claves:
+                self._eliminar(clave)
+            return len(claves)
+
+    def clear(self) -> None:
+        """Vaciar el cache completo"""
+        with self._lock:
+            for entrada in self._entradas.values():
+                self._incrementar_version(entrada.tablas)
+            self._entradas.clear()
+
+    def version(self, tabla: str) -> int:
+        """Versión de los datos cacheados de una tabla (cambia con cada escritura o invalidación)"""
+        with self._lock:
+            return self._versiones.get(tabla, 0)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de uso del cache"""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expulsiones': self.expulsiones,
+                'renovaciones': self.renovaciones,
+            }
+
+    def _eliminar(self, clave: str) -> None:
+        entrada = self._entradas.pop(clave)
+        self._incrementar_version(entrada.tablas)
+
+    def _incrementar_version(self, tablas: Tuple[str, ...]) -> None:
+        for tabla in tablas:
+            self._versiones[tabla] = self._versiones.get(tabla, 0) + 1
@@ -0,0 +1,109 @@
+"""
+Índice de búsqueda en memoria (trigramas normalizados) para filtrar listas grandes sin
+volver a recorrerlas ni consultar servicios en cada tecla
+"""
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas y sin tildes ("José Peña" -> "jose pena")"""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+class IndiceBusqueda:
+    """Índice de trigramas sobre documentos identificados por su posición.
+
+    Cada documento es el texto normalizado de los campos buscables de un elemento.
+    `buscar` devuelve las posiciones que contienen todas las palabras de la consulta
+    (como subcadena): las palabras de 3 o más caracteres intersectan las listas de sus
+    trigramas y luego se verifican; las más cortas unen las listas de los trigramas que
+    las contienen. Las listas se guardan como arreglos compactos de enteros.
+    """
+
+    N = 3
+
+    def __init__(self, textos: Sequence[str], claves: Sequence = ()):
+        self.claves = tuple(claves)
+        self._textos: List[str] = [normalizar(t) for t in textos]
+        ngramas: Dict[str, List[int]] = {}
+        for posicion, texto in enumerate(self._textos):
+            for ngrama in {texto[i:i + self.N] for i in range(len(texto) - self.N + 1)}:
+                ngramas.setdefault(ngrama, []).append(posicion)
+        # Listas ordenadas por posición (se recorren en orden creciente)
+        self._ngramas: Dict[str, array] = {ngrama: array('I', lista) for ngrama, lista in ngramas.items()}
+        self._cortos = [p for p, texto in enumerate(self._textos) if len(texto) < self.N]
+
+    @classmethod
+    def de_elementos(cls, elementos: Iterable, campos: Callable[[object], Iterable[Optional[str]]],
+                     clave: Callable[[object], object] = None) -> "IndiceBusqueda":
+        """Construir el índice uniendo (con un separador) los campos de cada elemento"""
+        elementos = list(elementos)
+        textos = ["\x1f".join(c or "" for c in campos(e)) for e in elementos]
+        return cls(textos, [clave(e) for e in elementos] if clave else ())
+
+    def __len__(self) -> int:
+        return len(self._textos)
+
+    def corresponde(self, claves: Sequence) -> bool:
+        """Indica si el índice se construyó sobre exactamente estos elementos, en este orden"""
+        return len(claves) == len(self.claves) and all(a == b for a, b in zip(claves, self.claves))
+
+    def buscar(self, consulta: str) -> Optional[Set[int]]:
+        """Posiciones que contienen todas las palabras de la consulta (None = sin filtro)"""
+        palabras = sorted(set(normalizar(consulta).split()), key=len, reverse=True)
+        if not palabras:
+            return None
+
+        candidatos: Optional[Set[int]] = None
+        verificar = []
+        for palabra in palabras:
+            encontrados = self._buscar_palabra(palabra)
+            if len(palabra) > self.N:
+                # Tener todos los trigramas no garantiza que estén contiguos
+                verificar.append(palabra)
+            candidatos = encontrados if candidatos is None else candidatos & encontrados
+            if not candidatos:
+                return set()
+
+        if not verificar:
+            return candidatos
+        return {p for p in candidatos if all(palabra in self._textos[p] for palabra in verificar)}
+
+    def _buscar_palabra(self, palabra: str) -> Set[int]:
+        if len(palabra) < self.N:
+            # Toda aparición de una palabra corta está dentro de algún trigrama que la contiene
+            encontrados = set()
+            for ngrama, lista in self._ngramas.items():
+                if palabra in ngrama:
+                    encontrados.update(lista)
+            encontrados.update(p for p in self._cortos if palabra in self._textos[p])
+            return encontrados
+
+        listas = []
+        for i in range(len(palabra) - self.N + 1):
+            lista = self._ngramas.get(palabra[i:i + self.N])
+            if not lista:
+                return set()
+            listas.append(lista)
+        listas.sort(key=len)
+        encontrados = set(listas[0])
+        for lista in listas[1:]:
+            if len(encontrados) * 16 < len(lista):
+                # Pocos candidatos: búsqueda binaria en la lista ordenada
+                encontrados = {p for p in encontrados if _contiene(lista, p)}
+            else:
+                encontrados.intersection_update(lista)
+            if not encontrados:
+                break
+        return encontrados
+
+
+def _contiene(lista: array, valor: int) -> bool:
+    i = bisect_left(lista, valor)
+    return i < len(lista) and lista[i] == valor
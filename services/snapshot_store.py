@@ -0,0 +1,92 @@
+"""
+Snapshots persistentes (SQLite) de las últimas consultas para un arranque en frío inmediato
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+def _serializar(valor: Any):
+    """Convertir tipos de BigQuery que JSON no soporta"""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+
+class SnapshotStore:
+    """Guarda el último resultado de cada consulta, etiquetado con la versión de esquema"""
+
+    def __init__(self, ruta: Path, version_esquema: int = 1):
+        self.ruta = Path(ruta)
+        self.version_esquema = version_esquema
+        self._lock = threading.Lock()
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    clave TEXT PRIMARY KEY,
+                    version_esquema INTEGER NOT NULL,
+                    guardado_en REAL NOT NULL,
+                    datos TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Una conexión por operación (se usa desde varios hilos del pool)"""
+        conn = sqlite3.connect(str(self.ruta), timeout=5)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def guardar(self, clave: str, valor: Any) -> bool:
+        """Reemplazar el snapshot de una clave"""
+        try:
+            datos = json.dumps(valor, default=_serializar, ensure_ascii=False)
+            with self._lock, self._conectar() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (clave, version_esquema, guardado_en, datos) VALUES (?, ?, ?, ?)",
+                    (clave, self.version_esquema, time.time(), datos)
+                )
+            return True
+        except Exception as e:
+            print(f"[SNAPSHOT] No se pudo guardar '{clave}': {e}")
+            return False
+
+    def cargar(self, clave: str) -> Optional[Tuple[Any, float]]:
+        """Obtener (valor, guardado_en) o None si no existe o es de otra versión de esquema"""
+        try:
+            with self._conectar() as conn:
+                fila = conn.execute(
+                    "SELECT version_esquema, guardado_en, datos FROM snapshots WHERE clave = ?",
+                    (clave,)
+                ).fetchone()
+            if fila is None:
+                return None
+            version, guardado_en, datos = fila
+            if version != self.version_esquema:
+                self.eliminar(clave)
+                return None
+            return json.loads(datos), guardado_en
+        except Exception as e:
+            print(f"[SNAPSHOT] No se pudo leer '{clave}': {e}")
+            return None
+
+    def eliminar(self, clave: str) -> None:
+        with self._lock, self._conectar() as conn:
+            conn.execute("DELETE FROM snapshots WHERE clave = ?", (clave,))
+
+    def limpiar(self) -> None:
+        """Borrar todos los snapshots"""
+        with self._lock, self._conectar() as conn:
+            conn.execute("DELETE FROM snapshots")
@@ -14,10 +14,10 @@ class ContactosService:
     
     @property
     def bigquery_service(self):
-        """Obtener servicio de BigQuery (inicialización perezosa)"""
+        """Obtener servicio de BigQuery compartido (inicialización perezosa)"""
         if self._bigquery_service is None:
-            from services.bigquery_service import BigQueryService
-            self._bigquery_service = BigQueryService()
+            from config.architecture import controllers
+            self._bigquery_service = controllers.get_bigquery_service()
         return self._bigquery_service
     
     def get_contactos(self, cliente_rol: Optional[str] = None) -> List[Contacto]:
@@ -29,6 +29,17 @@ class ContactosService:
             print(f"Error al obtener contactos: {e}")
             return []
     
+    def get_contactos_snapshot(self) -> Optional[List[Contacto]]:
+        """Últimos contactos guardados en disco"""
+        try:
+            contactos_data = self.bigquery_service.get_snapshot("contactos")
+            if contactos_data is None:
+                return None
+            return [Contacto.from_dict(contacto) for contacto in contactos_data]
+        except Exception as e:
+            print(f"Error al leer snapshot de contactos: {e}")
+            return None
+    
     def get_contacto_by_email(self, email: str) -> Optional[Contacto]:
         """Obtener contacto por email"""
         try:
@@ -70,6 +81,20 @@ class ContactosService:
             print(f"Error al obtener contactos por instalación: {e}")
             return {}
     
+    def get_todos_contactos_por_instalacion_snapshot(self) -> Optional[Dict[str, List[Contacto]]]:
+        """Último mapa instalación -> contactos guardado en disco"""
+        try:
+            contactos_data = self.bigquery_service.get_snapshot("todos_contactos_por_instalacion")
+            if contactos_data is None:
+                return None
+            return {
+                instalacion: [Contacto.from_dict(contacto) for contacto in contactos]
+                for instalacion, contactos in contactos_data.items()
+            }
+        except Exception as e:
+            print(f"Error al leer snapshot de contactos por instalación: {e}")
+            return None
+    
     def get_contactos_usuario(self, email: str, instalacion_rol: str) -> List[str]:
         """Obtener contactos asignados a un usuario para una instalación"""
         try:
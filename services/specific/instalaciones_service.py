@@ -1,9 +1,11 @@
 """
 Servicio específico para gestión de instalaciones
 """
+import threading
 from typing import List, Optional, Dict, Any
 # Importación removida para inicialización perezosa
 from models.instalacion_model import Instalacion, InstalacionUsuario
+from services.instalaciones_index import InstalacionesIndex
 
 
 class InstalacionesService:
@@ -11,28 +13,42 @@ class InstalacionesService:
     
     def __init__(self):
         self._bigquery_service = None
+        # Índice zona -> cliente -> instalación de la última versión de los datos
+        self._indice: Optional[InstalacionesIndex] = None
+        self._indice_origen = None
+        self._indice_lock = threading.Lock()
     
     @property
     def bigquery_service(self):
-        """Obtener servicio de BigQuery (inicialización perezosa)"""
+        """Obtener servicio de BigQuery compartido (inicialización perezosa)"""
         if self._bigquery_service is None:
-            from services.bigquery_service import BigQueryService
-            self._bigquery_service = BigQueryService()
+            from config.architecture import controllers
+            self._bigquery_service = controllers.get_bigquery_service()
         return self._bigquery_service
     
     def get_instalaciones(self, cliente_rol: Optional[str] = None) -> List[Instalacion]:
         """Obtener lista de instalaciones"""
         try:
-            if cliente_rol:
-                instalaciones_data = self.bigquery_service.get_instalaciones(cliente_rol)
-            else:
-                instalaciones_data = self.bigquery_service.get_instalaciones_con_zonas()
-            
+            if not cliente_rol:
+                # Ya convertidas al construir el índice de la versión vigente
+                return list(self.get_indice().instalaciones)
+            instalaciones_data = self.bigquery_service.get_instalaciones(cliente_rol)
             return [Instalacion.from_dict(inst) for inst in instalaciones_data]
         except Exception as e:
             print(f"Error al obtener instalaciones: {e}")
             return []
     
+    def get_instalaciones_snapshot(self) -> Optional[List[Instalacion]]:
+        """Últimas instalaciones (con zonas) guardadas en disco"""
+        try:
+            instalaciones_data = self.bigquery_service.get_snapshot("instalaciones_con_zonas")
+            if instalaciones_data is None:
+                return None
+            return [Instalacion.from_dict(inst) for inst in instalaciones_data]
+        except Exception as e:
+            print(f"Error al leer snapshot de instalaciones: {e}")
+            return None
+    
     def get_instalaciones_con_zonas(self, cliente_rol: Optional[str] = None) -> List[Instalacion]:
         """Obtener instalaciones con información de zonas"""
         try:
@@ -87,15 +103,32 @@ class InstalacionesService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def get_indice(self, revalidar: bool = True) -> InstalacionesIndex:
+        """Índice de instalaciones (con zonas) de los datos vigentes
+
+        Se reconstruye solo cuando el cache entrega otra lista (recarga o invalidación
+        de las tablas de origen); si no, se reutiliza. Con `revalidar=False` se devuelve
+        el último índice construido sin consultar el cache ni BigQuery (seguro desde
+        el hilo de la interfaz); solo si aún no hay ninguno se carga.
+        """
+        with self._indice_lock:
+            if self._indice is not None and not revalidar:
+                return self._indice
+        datos = self.bigquery_service.get_instalaciones_con_zonas()
+        with self._indice_lock:
+            if self._indice is not None and self._indice_origen is datos:
+                return self._indice
+        indice = InstalacionesIndex(Instalacion.from_dict(inst) for inst in datos)
+        if datos:
+            # Una lista vacía suele ser un error de consulta (no se cachea): no fijarla
+            with self._indice_lock:
+                self._indice, self._indice_origen = indice, datos
+        return indice
+    
     def get_zonas(self) -> List[str]:
         """Obtener lista de zonas disponibles"""
         try:
-            instalaciones = self.get_instalaciones()
-            zonas = set()
-            for inst in instalaciones:
-                if inst.zona:
-                    zonas.add(inst.zona)
-            return sorted(list(zonas))
+            return self.get_indice().zonas()
         except Exception as e:
             print(f"Error al obtener zonas: {e}")
             return []
@@ -103,12 +136,7 @@ class InstalacionesService:
     def get_clientes_por_zona(self, zona: str) -> List[str]:
         """Obtener clientes de una zona específica"""
         try:
-            instalaciones = self.get_instalaciones()
-            clientes = set()
-            for inst in instalaciones:
-                if inst.zona == zona:
-                    clientes.add(inst.cliente_rol)
-            return sorted(list(clientes))
+            return self.get_indice().clientes(zona)
         except Exception as e:
             print(f"Error al obtener clientes por zona: {e}")
             return []
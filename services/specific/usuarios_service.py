@@ -1,7 +1,12 @@
 """
 Servicio específico para gestión de usuarios
 """
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Dict, Any
+from config.settings import (
+    CARGA_MASIVA_HILOS, CARGA_MASIVA_LOTE, FIREBASE_IMPORT_LOTE, CACHE_TTL_FIREBASE
+)
+from services.query_cache import QueryCache
 # Importaciones removidas para inicialización perezosa
 from models.usuario_model import Usuario
 
@@ -12,32 +17,75 @@ class UsuariosService:
     def __init__(self):
         self._bigquery_service = None
         self._firebase_service = None
+        # Estado de Firebase por email (una entrada por usuario)
+        self._estado_firebase = QueryCache(max_entradas=20000, ttl_defecto=CACHE_TTL_FIREBASE)
     
     @property
     def bigquery_service(self):
-        """Obtener servicio de BigQuery (inicialización perezosa)"""
+        """Obtener servicio de BigQuery compartido (inicialización perezosa)"""
         if self._bigquery_service is None:
-            from services.bigquery_service import BigQueryService
-            self._bigquery_service = BigQueryService()
+            from config.architecture import controllers
+            self._bigquery_service = controllers.get_bigquery_service()
         return self._bigquery_service
     
     @property
     def firebase_service(self):
-        """Obtener servicio de Firebase (inicialización perezosa)"""
+        """Obtener servicio de Firebase compartido (inicialización perezosa)"""
         if self._firebase_service is None:
-            from services.firebase_service import FirebaseService
-            self._firebase_service = FirebaseService()
+            from config.architecture import controllers
+            self._firebase_service = controllers.get_firebase_service()
         return self._firebase_service
     
     def get_usuarios(self, cliente_rol: Optional[str] = None) -> List[Usuario]:
         """Obtener lista de usuarios"""
         try:
             usuarios_data = self.bigquery_service.get_usuarios_con_roles(cliente_rol)
-            return [Usuario.from_dict(usuario) for usuario in usuarios_data]
+            usuarios = [Usuario.from_dict(usuario) for usuario in usuarios_data]
+            # Aplicar el estado de Firebase ya conocido (sin llamadas de red)
+            self._aplicar_estado_firebase(usuarios)
+            return usuarios
         except Exception as e:
             print(f"Error al obtener usuarios: {e}")
             return []
     
+    def enriquecer_con_firebase(self, usuarios: List[Usuario]) -> List[Usuario]:
+        """
+        Completar activo/ultima_sesion con el estado real de Firebase
+        
+        Solo se consultan (en lotes de 100) los usuarios que no están en el cache.
+        """
+        faltantes = [u for u in usuarios if self._estado_firebase.get(u.email_login.lower()) is None]
+        if faltantes:
+            estados = self.firebase_service.get_users_bulk(
+                [{'uid': u.firebase_uid, 'email': u.email_login} for u in faltantes]
+            )
+            for u in faltantes:
+                # Guardar también los inexistentes para no volver a consultarlos
+                estado = estados.get(u.email_login.lower(), {'uid': None})
+                self._estado_firebase.set(u.email_login.lower(), estado)
+        self._aplicar_estado_firebase(usuarios)
+        return usuarios
+    
+    def _aplicar_estado_firebase(self, usuarios: List[Usuario]) -> None:
+        for usuario in usuarios:
+            estado = self._estado_firebase.get(usuario.email_login.lower())
+            if not estado or not estado.get('uid'):
+                continue
+            usuario.activo = usuario.activo and not estado['disabled']
+            if estado['ultima_sesion']:
+                usuario.ultima_sesion = estado['ultima_sesion']
+    
+    def get_usuarios_snapshot(self) -> Optional[List[Usuario]]:
+        """Últimos usuarios guardados en disco (para mostrar antes de consultar BigQuery)"""
+        try:
+            usuarios_data = self.bigquery_service.get_snapshot("usuarios_con_roles")
+            if usuarios_data is None:
+                return None
+            return [Usuario.from_dict(usuario) for usuario in usuarios_data]
+        except Exception as e:
+            print(f"Error al leer snapshot de usuarios: {e}")
+            return None
+    
     def get_usuario_by_email(self, email: str) -> Optional[Usuario]:
         """Obtener usuario por email"""
         try:
@@ -87,6 +135,71 @@ class UsuariosService:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def crear_usuarios_masivo(self, usuarios: List[Dict[str, Any]],
+                              progreso: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
+        """
+        Crear muchos usuarios: Firebase con importación por lotes (FIREBASE_IMPORT_LOTE por
+        llamada) y BigQuery por lotes de CARGA_MASIVA_LOTE en un solo script. La importación
+        del bloque siguiente corre mientras se escribe en BigQuery el bloque actual.
+        
+        Args:
+            usuarios: usuarios validados por CargaMasivaDialog (ver crear_usuarios_lote)
+            progreso: callback opcional progreso(porcentaje, mensaje)
+            
+        Returns:
+            Dict con 'creados' (emails) y 'fallidos' (lista de "email: error")
+        """
+        total = len(usuarios)
+        creados: List[str] = []
+        fallidos: List[str] = []
+        pasos = {'firebase': 0, 'bigquery': 0}
+        
+        def avanzar(mensaje: str):
+            if progreso and total:
+                progreso(int((pasos['firebase'] + pasos['bigquery']) * 100 / (2 * total)), mensaje)
+        
+        def importar(bloque: List[Dict[str, Any]]):
+            return self.firebase_service.create_users_bulk(
+                [{'email': u['email'], 'password': u.get('password') or "TempPassword123!",
+                  'display_name': u['nombre']} for u in bloque],
+                hilos=CARGA_MASIVA_HILOS,
+            )
+        
+        def guardar_lote(lote: List[Dict[str, Any]]):
+            avanzar(f"Guardando {len(lote)} usuarios en BigQuery...")
+            resultado = self.bigquery_service.crear_usuarios_lote(lote)
+            if resultado['success']:
+                creados.extend(u['email'] for u in lote)
+            else:
+                # Rollback: eliminar de Firebase los usuarios que no quedaron en BigQuery
+                self.firebase_service.delete_users_bulk([u['firebase_uid'] for u in lote])
+                fallidos.extend(f"{u['email']}: BigQuery: {resultado.get('error')}" for u in lote)
+            pasos['bigquery'] += len(lote)
+            avanzar(f"{len(creados)} de {total} usuarios creados")
+        
+        bloques = [usuarios[i:i + FIREBASE_IMPORT_LOTE] for i in range(0, total, FIREBASE_IMPORT_LOTE)]
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            avanzar("Creando usuarios en Firebase...")
+            siguiente = pool.submit(importar, bloques[0]) if bloques else None
+            for n, bloque in enumerate(bloques):
+                resultados = siguiente.result()
+                siguiente = pool.submit(importar, bloques[n + 1]) if n + 1 < len(bloques) else None
+                
+                listos = []
+                for usuario, firebase_result in zip(bloque, resultados):
+                    if firebase_result['success']:
+                        listos.append(dict(usuario, firebase_uid=firebase_result['uid']))
+                    else:
+                        fallidos.append(f"{usuario['email']}: Firebase: {firebase_result.get('error')}")
+                        pasos['bigquery'] += 1
+                pasos['firebase'] += len(bloque)
+                avanzar(f"{pasos['firebase']} de {total} usuarios creados en Firebase")
+                
+                for inicio in range(0, len(listos), CARGA_MASIVA_LOTE):
+                    guardar_lote(listos[inicio:inicio + CARGA_MASIVA_LOTE])
+        
+        return {'success': not fallidos, 'creados': creados, 'fallidos': fallidos}
+    
     def update_usuario(self, email: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Actualizar usuario"""
         try:
@@ -111,13 +224,68 @@ class UsuariosService:
             return {'success': False, 'error': str(e)}
     
     def toggle_usuario_activo(self, email: str, activo: bool) -> Dict[str, Any]:
-        """Activar/desactivar usuario"""
+        """Activar/desactivar usuario (en BigQuery y su cuenta de Firebase)"""
+        # Sin UID: _uids_firebase lo resuelve por email
+        usuario = Usuario(email_login=email, firebase_uid=None, cliente_rol=None, nombre_completo=None)
+        return self.toggle_usuarios_activo([usuario], activo)
+    
+    def _uids_firebase(self, usuarios: List[Usuario]) -> List[str]:
+        """UID de Firebase de cada usuario (los que faltan se buscan por email en lotes de 100)"""
+        uids = [u.firebase_uid for u in usuarios if u.firebase_uid]
+        sin_uid = [u for u in usuarios if not u.firebase_uid]
+        if sin_uid:
+            estados = self.firebase_service.get_users_bulk([{'email': u.email_login} for u in sin_uid])
+            uids.extend(e['uid'] for e in estados.values() if e.get('uid'))
+        return uids
+    
+    def toggle_usuarios_activo(self, usuarios: List[Usuario], activo: bool) -> Dict[str, Any]:
+        """Activar/desactivar varios usuarios: un UPDATE en BigQuery y sus cuentas en Firebase"""
         try:
-            result = self.bigquery_service.update_usuario(email, activo=activo)
+            result = self.bigquery_service.update_usuarios([u.email_login for u in usuarios], activo=activo)
+            if not result.get('success'):
+                return result
+            
+            fb = self.firebase_service.update_users_bulk(
+                self._uids_firebase(usuarios), hilos=CARGA_MASIVA_HILOS, disabled=not activo
+            )
+            for usuario in usuarios:
+                self._estado_firebase.update(
+                    usuario.email_login.lower(), lambda estado: dict(estado, disabled=not activo)
+                )
+            if not fb.get('success'):
+                return {'success': False, 'error': 'Firebase: ' + '; '.join(fb['errores'][:5])}
             return result
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def cambiar_rol_usuarios(self, emails: List[str], rol_id: str) -> Dict[str, Any]:
+        """Asignar el mismo rol a varios usuarios con un único UPDATE"""
+        try:
+            return self.bigquery_service.update_usuarios(emails, rol_id=rol_id)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def asignar_instalaciones_usuarios(self, emails: List[str],
+                                       instalaciones_con_cliente: Dict[str, str]) -> Dict[str, Any]:
+        """Otorgar instalaciones a varios usuarios (conserva las que ya tenían)"""
+        try:
+            return self.bigquery_service.asignar_instalaciones_usuarios(emails, instalaciones_con_cliente)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def delete_usuarios(self, usuarios: List[Usuario]) -> Dict[str, Any]:
+        """Eliminar varios usuarios: borrado por lotes en Firebase y un script en BigQuery"""
+        try:
+            fb = self.firebase_service.delete_users_bulk(self._uids_firebase(usuarios))
+            if not fb.get('success'):
+                return {'success': False, 'error': 'Firebase: ' + '; '.join(fb['errores'][:5])}
+            
+            for usuario in usuarios:
+                self._estado_firebase.invalidate(usuario.email_login.lower())
+            return self.bigquery_service.delete_usuario_total([u.email_login for u in usuarios])
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
     def get_roles(self) -> List[Dict[str, Any]]:
         """Obtener lista de roles disponibles"""
         try:
@@ -126,6 +294,14 @@ class UsuariosService:
             print(f"Error al obtener roles: {e}")
             return []
     
+    def get_roles_snapshot(self) -> Optional[List[Dict[str, Any]]]:
+        """Últimos roles guardados en disco"""
+        try:
+            return self.bigquery_service.get_snapshot("roles")
+        except Exception as e:
+            print(f"Error al leer snapshot de roles: {e}")
+            return None
+    
     def update_rol_usuario(self, email: str, rol_id: str) -> Dict[str, Any]:
         """Actualizar rol de usuario"""
         try:
@@ -0,0 +1,112 @@
+"""
+Cola persistente (SQLite) de escrituras diferidas: mutaciones que BigQuery rechazó
+temporalmente (filas en streaming buffer) y que se reintentan en segundo plano
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.snapshot_store import _serializar
+
+
+class WriteQueue:
+    """Mutaciones pendientes identificadas por una clave.
+
+    Encolar con una clave ya pendiente reemplaza sus datos: cada entrada describe el
+    estado deseado más reciente, de modo que reintentarla nunca deshace un cambio posterior.
+    """
+
+    def __init__(self, ruta: Path):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pendientes (
+                    clave TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    datos TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    proximo_intento REAL NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    ultimo_error TEXT
+                )
+            """)
+
+    @contextmanager
+    def _conectar(self):
+        """Una conexión por operación (se usa desde varios hilos del pool)"""
+        conn = sqlite3.connect(str(self.ruta), timeout=5)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def encolar(self, clave: str, tipo: str, datos: Any, demora: float) -> None:
+        """Agregar (o reemplazar) una mutación a reintentar dentro de `demora` segundos"""
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                """
+                INSERT INTO pendientes (clave, tipo, datos, creado_en, proximo_intento)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(clave) DO UPDATE SET
+                    tipo = excluded.tipo, datos = excluded.datos,
+                    proximo_intento = excluded.proximo_intento, ultimo_error = NULL
+                """,
+                (clave, tipo, json.dumps(datos, default=_serializar, ensure_ascii=False), ahora, ahora + demora)
+            )
+
+    def vencidas(self, limite: int = 50) -> List[Dict]:
+        """Entradas cuyo próximo intento ya llegó (las más antiguas primero)"""
+        with self._conectar() as conn:
+            filas = conn.execute(
+                """
+                SELECT clave, tipo, datos, intentos FROM pendientes
+                WHERE proximo_intento <= ? ORDER BY creado_en LIMIT ?
+                """,
+                (time.time(), limite)
+            ).fetchall()
+        return [
+            {'clave': clave, 'tipo': tipo, 'datos': json.loads(datos), 'intentos': intentos}
+            for clave, tipo, datos, intentos in filas
+        ]
+
+    def completar(self, clave: str, datos: Any = None) -> None:
+        """Quitar una entrada aplicada (si se indican `datos`, solo si no fue reemplazada entretanto)"""
+        with self._lock, self._conectar() as conn:
+            if datos is None:
+                conn.execute("DELETE FROM pendientes WHERE clave = ?", (clave,))
+            else:
+                conn.execute(
+                    "DELETE FROM pendientes WHERE clave = ? AND datos = ?",
+                    (clave, json.dumps(datos, default=_serializar, ensure_ascii=False))
+                )
+
+    def reprogramar(self, clave: str, error: str, demora: float) -> None:
+        """Registrar un intento fallido y posponer el siguiente"""
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                """
+                UPDATE pendientes
+                SET intentos = intentos + 1, ultimo_error = ?, proximo_intento = ?
+                WHERE clave = ?
+                """,
+                (error[:500], time.time() + demora, clave)
+            )
+
+    def estado(self) -> Dict[str, Optional[Any]]:
+        """Cantidad de pendientes, próximo intento (epoch) y último error registrado"""
+        with self._conectar() as conn:
+            cantidad, proximo = conn.execute(
+                "SELECT COUNT(*), MIN(proximo_intento) FROM pendientes"
+            ).fetchone()
+            error = conn.execute(
+                "SELECT ultimo_error FROM pendientes WHERE ultimo_error IS NOT NULL ORDER BY proximo_intento DESC LIMIT 1"
+            ).fetchone()
+        return {'cantidad': cantidad, 'proximo_intento': proximo, 'ultimo_error': error[0] if error else None}
@@ -0,0 +1,43 @@
+"""
+Pruebas del oráculo de frescura con metadatos simulados
+"""
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+
+from services.freshness import FreshnessOracle
+from services.query_cache import QueryCache
+
+
+class OraculoFalso(FreshnessOracle):
+    """Oráculo que devuelve fechas fijas en vez de consultar `__TABLES__`"""
+
+    def __init__(self, fechas):
+        super().__init__(lambda: None, fechas.keys(), intervalo=0)
+        self.fechas = dict(fechas)
+        self.lecturas = 0
+
+    def _consultar(self):
+        self.lecturas += 1
+        return dict(self.fechas)
+
+
+def test_primera_lectura_es_linea_base():
+    oraculo = OraculoFalso({'p.d.a': 1, 'p.d.b': 2})
+
+    assert oraculo.actualizar(forzar=True) == set()
+
+    oraculo.fechas['p.d.b'] = 3
+    assert oraculo.actualizar(forzar=True) == {'p.d.b'}
+
+
+def test_entradas_guardadas_antes_de_sincronizar_quedan_marcadas():
+    oraculo = OraculoFalso({'p.d.a': 1})
+    cache = QueryCache(ttl_defecto=0)
+    cache.frescura = oraculo
+
+    cache.set('clave', 'valor', tablas=['p.d.a'])
+
+    assert oraculo.lecturas == 1
+    # Vencida pero sin cambios en la tabla: se renueva en vez de volver a consultar
+    assert cache.get('clave') == 'valor'
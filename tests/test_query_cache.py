@@ -0,0 +1,35 @@
+"""
+Pruebas del cache de consultas
+"""
+from services.query_cache import QueryCache
+
+
+class FrescuraContada:
+    """Oráculo que solo cuenta cuántas veces se le consulta"""
+
+    def __init__(self):
+        self.consultas = 0
+
+    def marca(self, tablas):
+        return ('m',)
+
+    def vigente(self, tablas, marca):
+        self.consultas += 1
+        return True
+
+
+def test_peek_no_revalida_entradas_vencidas():
+    cache = QueryCache(ttl_defecto=0)
+    cache.frescura = FrescuraContada()
+    cache.set('roles', ['ADMIN'], tablas=['p.d.roles'])
+
+    assert cache.peek('roles') is None
+    assert cache.frescura.consultas == 0
+
+
+def test_peek_devuelve_entradas_vigentes_sin_contar_hits():
+    cache = QueryCache()
+    cache.set('roles', ['ADMIN'], tablas=['p.d.roles'])
+
+    assert cache.peek('roles') == ['ADMIN']
+    assert cache.stats()['hits'] == 0
@@ -0,0 +1,58 @@
+"""
+Pruebas de UsuariosService con servicios de BigQuery y Firebase simulados
+"""
+from services.specific.usuarios_service import UsuariosService
+
+
+class BigQueryFalso:
+    def __init__(self):
+        self.updates = []
+
+    def update_usuarios(self, emails, **campos):
+        self.updates.append((list(emails), campos))
+        return {'success': True, 'actualizados': len(emails)}
+
+
+class FirebaseFalso:
+    def __init__(self, uids):
+        self.uids = uids
+        self.consultados = []
+        self.actualizados = []
+
+    def get_users_bulk(self, usuarios, hilos=4):
+        self.consultados.extend(u['email'] for u in usuarios)
+        return {u['email'].lower(): {'uid': self.uids[u['email']], 'disabled': False}
+                for u in usuarios if u['email'] in self.uids}
+
+    def update_users_bulk(self, uids, hilos=8, **kwargs):
+        self.actualizados.append((list(uids), kwargs))
+        return {'success': True, 'actualizados': len(uids), 'errores': []}
+
+
+def _servicio(uids):
+    servicio = UsuariosService()
+    servicio._bigquery_service = BigQueryFalso()
+    servicio._firebase_service = FirebaseFalso(uids)
+    return servicio
+
+
+def test_toggle_usuario_activo_desactiva_en_bigquery_y_firebase():
+    servicio = _servicio({'ana@wfsa.cl': 'uid-ana'})
+
+    resultado = servicio.toggle_usuario_activo('ana@wfsa.cl', False)
+
+    assert resultado['success'] is True
+    assert servicio.bigquery_service.updates == [(['ana@wfsa.cl'], {'activo': False})]
+    # El UID se resuelve por email y la cuenta queda deshabilitada
+    assert servicio.firebase_service.consultados == ['ana@wfsa.cl']
+    assert servicio.firebase_service.actualizados == [(['uid-ana'], {'disabled': True})]
+
+
+def test_toggle_usuario_activo_reactiva_cuenta_firebase():
+    servicio = _servicio({'ana@wfsa.cl': 'uid-ana'})
+
+    resultado = servicio.toggle_usuario_activo('ana@wfsa.cl', True)
+
+    assert resultado['success'] is True
+    assert servicio.bigquery_service.updates == [(['ana@wfsa.cl'], {'activo': True})]
+    assert servicio.firebase_service.actualizados == [(['uid-ana'], {'disabled': False})]
@@ -8,10 +8,10 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QFont
-from services.firebase_service import FirebaseService
-from services.bigquery_service import BigQueryService
+from config.architecture import controllers
 from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY
 from ui.loading_dialog import ProgressDialog
+from ui.workers import TaskRunner
 from pathlib import Path
 import openpyxl
 from openpyxl.styles import Font as ExcelFont, PatternFill, Alignment, Border, Side
@@ -24,10 +24,11 @@ class CargaMasivaDialog(QDialog):
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.firebase_service = FirebaseService()
-        self.bigquery_service = BigQueryService()
+        self.firebase_service = controllers.get_firebase_service()
+        self.bigquery_service = controllers.bigquery_service
         self.usuarios_validados = []
         self.errores_validacion = []
+        self.tareas = TaskRunner(self)
         
         self.setWindowTitle("Carga Masiva de Usuarios")
         self.setMinimumSize(1000, 700)
@@ -824,105 +825,29 @@ class CargaMasivaDialog(QDialog):
         if respuesta != QMessageBox.Yes:
             return
         
-        # Crear barra de progreso
-        total_pasos = len(self.usuarios_validados) * 4  # Firebase + BigQuery + Instalaciones + Contacto (si aplica)
-        progress = ProgressDialog(self, "Creando Usuarios", total_pasos)
-        progress.show()
-        QApplication.processEvents()
-        
-        usuarios_creados = 0
-        usuarios_fallidos = []
-        paso_actual = 0
-        
-        for idx, usuario in enumerate(self.usuarios_validados, start=1):
-            try:
-                # Paso 1: Crear en Firebase
-                paso_actual += 1
-                progress.update_progress(
-                    paso_actual,
-                    f"[{idx}/{len(self.usuarios_validados)}] Creando en Firebase: {usuario['email']}"
-                )
-                
-                password_eff = usuario.get('password') or "TempPassword123!"
-                firebase_result = self.firebase_service.create_user(
-                    email=usuario['email'],
-                    password=password_eff,
-                    display_name=usuario['nombre']
-                )
-                
-                if not firebase_result['success']:
-                    raise Exception(f"Firebase: {firebase_result.get('error')}")
-                
-                # Paso 2: Crear en BigQuery
-                paso_actual += 1
-                progress.update_progress(
-                    paso_actual,
-                    f"[{idx}/{len(self.usuarios_validados)}] Guardando en BigQuery: {usuario['email']}"
-                )
-                
-                bq_result = self.bigquery_service.create_usuario(
-                    email=usuario['email'],
-                    firebase_uid=firebase_result['uid'],
-                    cliente_rol=usuario['cliente_rol'],
-                    nombre_completo=usuario['nombre'],
-                    rol_id=usuario['rol'],
-                    cargo=usuario['cargo'],
-                    telefono=usuario['telefono'],
-                    ver_todas_instalaciones=False
-                )
-                
-                if not bq_result['success']:
-                    raise Exception(f"BigQuery: {bq_result.get('error')}")
-                
-                # Paso 3: Asignar instalaciones
-                paso_actual += 1
-                progress.update_progress(
-                    paso_actual,
-                    f"[{idx}/{len(self.usuarios_validados)}] Asignando instalaciones: {usuario['email']}"
-                )
-                
-                inst_result = self.bigquery_service.asignar_instalaciones_multi_cliente(
-                    usuario['email'],
-                    usuario['instalaciones_con_cliente']
-                )
-                
-                if not inst_result['success']:
-                    raise Exception(f"Instalaciones: {inst_result.get('error')}")
-                
-                # Paso 4: Crear contacto si es necesario
-                paso_actual += 1
-                if usuario['es_contacto'] == 'SI':
-                    progress.update_progress(
-                        paso_actual,
-                        f"[{idx}/{len(self.usuarios_validados)}] Creando contacto: {usuario['email']}"
-                    )
-                    
-                    contacto_result = self.bigquery_service.create_contacto(
-                        nombre=usuario['nombre'],
-                        telefono=usuario['telefono'],
-                        cargo=usuario['cargo'],
-                        email=usuario['email'],
-                        es_usuario_app=True
-                    )
-                    
-                    if contacto_result['success']:
-                        # Sincronizar instalaciones
-                        sync_result = self.bigquery_service.sincronizar_instalaciones_contacto(
-                            usuario['email'],
-                            usuario['instalaciones_con_cliente']
-                        )
-                else:
-                    progress.update_progress(
-                        paso_actual,
-                        f"[{idx}/{len(self.usuarios_validados)}] Omitiendo contacto para: {usuario['email']}"
-                    )
-                
-                usuarios_creados += 1
-                
-            except Exception as e:
-                usuarios_fallidos.append(f"{usuario['email']}: {str(e)}")
+        # Crear barra de progreso (porcentaje sobre Firebase + BigQuery)
+        self.progress = ProgressDialog(self, "Creando Usuarios", 100)
+        self.progress.show()
+        self.btn_crear.setEnabled(False)
         
-        progress.close()
+        self.tareas.ejecutar(
+            "crear_usuarios", controllers.get_usuarios_controller().crear_usuarios_masivo,
+            list(self.usuarios_validados),
+            on_resultado=self._on_usuarios_creados,
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error al crear usuarios:\n{error}"),
+            on_progreso=self.progress.update_progress,
+            on_terminado=self._on_creacion_terminada,
+        )
+    
+    def _on_creacion_terminada(self):
+        self.progress.close()
+        self.btn_crear.setEnabled(True)
+    
+    def _on_usuarios_creados(self, resultado):
+        """Mostrar el resumen de la carga masiva"""
+        self.progress.close()
+        usuarios_creados = len(resultado['creados'])
+        usuarios_fallidos = resultado['fallidos']
         
         # Mostrar resumen
         if usuarios_fallidos:
@@ -176,3 +176,28 @@ class ProgressDialog(QDialog):
         from PySide6.QtWidgets import QApplication
         QApplication.processEvents()
 
+
+class InlineLoading(QLabel):
+    """Indicador de carga no modal para mostrar sobre una tabla mientras corre una consulta"""
+    
+    def __init__(self, parent=None, texto="⏳ Cargando..."):
+        super().__init__(texto, parent)
+        self.texto_defecto = texto
+        self.setAlignment(Qt.AlignCenter)
+        self.setStyleSheet(f"""
+            font-size: 13px;
+            color: {COLOR_PRIMARY};
+            padding: 6px;
+            background-color: #e3f2fd;
+            border-radius: 4px;
+        """)
+        self.hide()
+    
+    def iniciar(self, texto=None):
+        """Mostrar el indicador (opcionalmente con otro texto)"""
+        self.setText(texto or self.texto_defecto)
+        self.show()
+    
+    def detener(self):
+        """Ocultar el indicador"""
+        self.hide()
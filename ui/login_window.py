@@ -1,14 +1,15 @@
 """
 Ventana de Login para Panel Admin WFSA
 """
+from concurrent.futures import ThreadPoolExecutor
 from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
     QLineEdit, QPushButton, QMessageBox, QFrame
 )
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QPixmap, QFont
-from services.firebase_service import FirebaseService
-from services.bigquery_service import BigQueryService
+from ui.workers import TaskRunner
+from config.architecture import controllers
 from config.settings import COLOR_PRIMARY, COLOR_SECONDARY
 import firebase_admin
 from firebase_admin import auth as firebase_auth
@@ -21,9 +22,10 @@ class LoginWindow(QDialog):
     
     def __init__(self):
         super().__init__()
-        self.firebase_service = FirebaseService()
-        self.bigquery_service = BigQueryService()
+        self.firebase_service = controllers.get_firebase_service()
+        self.bigquery_service = controllers.bigquery_service
         self.usuario_autenticado = None
+        self.tareas = TaskRunner(self)
         
         self.setWindowTitle("Iniciar Sesion - Panel Admin")
         self.setMinimumSize(450, 550)
@@ -166,6 +168,8 @@ class LoginWindow(QDialog):
     
     def iniciar_sesion(self):
         """Procesar inicio de sesión"""
+        if self.tareas.en_curso("login"):
+            return
         email = self.email_input.text().strip()
         password = self.password_input.text()
         
@@ -179,77 +183,88 @@ class LoginWindow(QDialog):
         self.btn_login.setEnabled(False)
         self.btn_login.setText("Verificando...")
         
+        print(f"[LOGIN] Autenticando usuario: {email}")
+        self.tareas.ejecutar(
+            "login", self._verificar_credenciales, email, password,
+            on_resultado=self._on_credenciales_verificadas,
+            on_error=lambda error: QMessageBox.critical(self, "Error",
+                                                        f"Error al iniciar sesión:\n{error}"),
+            on_terminado=self._restaurar_boton,
+        )
+    
+    def _verificar_credenciales(self, email: str, password: str):
+        """Se ejecuta fuera del hilo de la interfaz: Firebase y BigQuery en paralelo.
+        
+        La latencia del login es la mayor de las dos llamadas y no su suma.
+        """
+        pool = ThreadPoolExecutor(max_workers=2)
         try:
-            # Autenticar usuario con email y contraseña
-            print(f"[LOGIN] Autenticando usuario: {email}")
-            usuario_firebase = self.firebase_service.authenticate_user(email, password)
-            
+            futuro_firebase = pool.submit(self.firebase_service.authenticate_user, email, password)
+            futuro_usuario = pool.submit(self.bigquery_service.get_usuario_con_rol, email)
+            usuario_firebase = futuro_firebase.result()
             if not usuario_firebase:
-                print(f"[LOGIN] Autenticación fallida para: {email}")
-                QMessageBox.critical(self, "Error de Autenticacion",
-                                   "Usuario no encontrado o credenciales invalidas")
-                return
-            
-            print(f"[LOGIN] Usuario autenticado en Firebase: {usuario_firebase.get('uid')}")
-            
-            # Verificar en BigQuery que tenga permisos de admin
-            print(f"[LOGIN] Consultando permisos en BigQuery...")
-            usuarios = self.bigquery_service.get_usuarios_con_roles()
-            usuario_data = None
-            
-            for usuario in usuarios:
-                if usuario.get('email_login') == email:
-                    usuario_data = usuario
-                    break
-            
-            if not usuario_data:
-                print(f"[LOGIN] Usuario no encontrado en BigQuery")
-                QMessageBox.critical(self, "Error de Acceso",
-                                   "Tu usuario no tiene acceso al Panel de Administracion.\n\n"
-                                   "Contacta al administrador del sistema.")
-                return
-            
-            print(f"[LOGIN] Usuario encontrado en BigQuery: {usuario_data.get('rol_id')}")
-            
-            # Verificar permisos de admin
-            permisos = usuario_data.get('permisos', {})
-            es_admin = permisos.get('es_admin', False)
-            
-            print(f"[LOGIN] Permisos de admin: {es_admin}")
-            
-            if not es_admin:
-                print(f"[LOGIN] Usuario no tiene permisos de admin")
-                QMessageBox.critical(self, "Acceso Denegado",
-                                   f"Tu rol ({usuario_data.get('nombre_rol', 'Usuario')}) no tiene "
-                                   f"permisos de administrador.\n\n"
-                                   f"Solo administradores pueden acceder a este panel.")
-                return
-            
-            # Verificar que el usuario esté activo
-            if not usuario_data.get('activo', False):
-                print(f"[LOGIN] Usuario está inactivo")
-                QMessageBox.critical(self, "Usuario Inactivo",
-                                   "Tu cuenta esta desactivada.\n\n"
-                                   "Contacta al administrador del sistema.")
-                return
-            
-            # Login exitoso
-            self.usuario_autenticado = usuario_data
-            
-            # Emitir señal de login exitoso
-            self.login_successful.emit(usuario_data)
-            
-            # Pasar directamente a la pantalla principal sin mensaje
-            self.accept()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error",
-                               f"Error al iniciar sesión:\n{str(e)}")
-        
+                # Credenciales inválidas: no esperar ni exponer el resultado de BigQuery
+                return None, None
+            return usuario_firebase, futuro_usuario.result()
         finally:
-            # Rehabilitar botón
-            self.btn_login.setEnabled(True)
-            self.btn_login.setText("Iniciar Sesión")
+            pool.shutdown(wait=False)
+    
+    def _on_credenciales_verificadas(self, resultado):
+        usuario_firebase, usuario_data = resultado
+        email = self.email_input.text().strip()
+        
+        if not usuario_firebase:
+            print(f"[LOGIN] Autenticación fallida para: {email}")
+            QMessageBox.critical(self, "Error de Autenticacion",
+                               "Usuario no encontrado o credenciales invalidas")
+            return
+        
+        print(f"[LOGIN] Usuario autenticado en Firebase: {usuario_firebase.get('uid')}")
+        
+        if not usuario_data:
+            print(f"[LOGIN] Usuario no encontrado en BigQuery")
+            QMessageBox.critical(self, "Error de Acceso",
+                               "Tu usuario no tiene acceso al Panel de Administracion.\n\n"
+                               "Contacta al administrador del sistema.")
+            return
+        
+        print(f"[LOGIN] Usuario encontrado en BigQuery: {usuario_data.get('rol_id')}")
+        
+        # Verificar permisos de admin
+        permisos = usuario_data.get('permisos', {})
+        es_admin = permisos.get('es_admin', False)
+        
+        print(f"[LOGIN] Permisos de admin: {es_admin}")
+        
+        if not es_admin:
+            print(f"[LOGIN] Usuario no tiene permisos de admin")
+            QMessageBox.critical(self, "Acceso Denegado",
+                               f"Tu rol ({usuario_data.get('nombre_rol', 'Usuario')}) no tiene "
+                               f"permisos de administrador.\n\n"
+                               f"Solo administradores pueden acceder a este panel.")
+            return
+        
+        # Verificar que el usuario esté activo
+        if not usuario_data.get('activo', False):
+            print(f"[LOGIN] Usuario está inactivo")
+            QMessageBox.critical(self, "Usuario Inactivo",
+                               "Tu cuenta esta desactivada.\n\n"
+                               "Contacta al administrador del sistema.")
+            return
+        
+        # Login exitoso
+        self.usuario_autenticado = usuario_data
+        
+        # Emitir señal de login exitoso
+        self.login_successful.emit(usuario_data)
+        
+        # Pasar directamente a la pantalla principal sin mensaje
+        self.accept()
+    
+    def _restaurar_boton(self):
+        """Rehabilitar botón"""
+        self.btn_login.setEnabled(True)
+        self.btn_login.setText("Iniciar Sesión")
     
     def get_usuario_autenticado(self):
         """Obtener datos del usuario autenticado"""
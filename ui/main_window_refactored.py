@@ -3,15 +3,16 @@ Ventana principal refactorizada
 """
 from PySide6.QtWidgets import (
     QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
-    QHBoxLayout, QLabel, QPushButton, QStatusBar
+    QHBoxLayout, QLabel, QPushButton, QStatusBar, QProgressBar
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QIcon
 # Importación removida para evitar inicialización temprana
 from ui.tabs.usuarios_tab_refactored import UsuariosTab
 from ui.tabs.instalaciones_tab_refactored import InstalacionesTab
 from ui.tabs.contactos_tab_refactored import ContactosTab
-from config.settings import COLOR_PRIMARY, COLOR_SUCCESS
+from ui.workers import TaskRunner
+from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, PENDIENTES_INTERVALO
 
 
 class MainWindow(QMainWindow):
@@ -20,6 +21,7 @@ class MainWindow(QMainWindow):
     def __init__(self, usuario_logueado):
         super().__init__()
         self.usuario_logueado = usuario_logueado
+        self.tareas = TaskRunner(self)
         self.init_ui()
     
     def init_ui(self):
@@ -114,6 +116,25 @@ class MainWindow(QMainWindow):
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("✅ Aplicación iniciada correctamente")
         
+        # Progreso de la precarga de datos tras el login
+        self.precarga_bar = QProgressBar()
+        self.precarga_bar.setRange(0, 100)
+        self.precarga_bar.setMaximumWidth(200)
+        self.precarga_bar.setMaximumHeight(16)
+        self.precarga_bar.setFormat("Precargando datos %p%")
+        self.precarga_bar.hide()
+        self.status_bar.addPermanentWidget(self.precarga_bar)
+        
+        # Escrituras diferidas (streaming buffer) que se reintentan en segundo plano
+        self.pendientes_label = QLabel()
+        self.pendientes_label.setStyleSheet("color: #FF9800; font-weight: bold; padding: 0 8px;")
+        self.pendientes_label.hide()
+        self.status_bar.addPermanentWidget(self.pendientes_label)
+        self.pendientes_timer = QTimer(self)
+        self.pendientes_timer.setInterval(PENDIENTES_INTERVALO * 1000)
+        self.pendientes_timer.timeout.connect(self.procesar_pendientes)
+        self.pendientes_timer.start()
+        
         # Aplicar estilos globales
         self.setStyleSheet("""
             QMainWindow {
@@ -121,11 +142,63 @@ class MainWindow(QMainWindow):
             }
         """)
     
+    def iniciar_precarga(self):
+        """Cargar en paralelo los datos de todas las pestañas para que cambiar de pestaña sea inmediato"""
+        from config.architecture import controllers
+        self.precarga_bar.setValue(0)
+        self.precarga_bar.show()
+        self.status_bar.showMessage("🔄 Precargando datos...")
+        self.tareas.ejecutar(
+            "precarga", controllers.get_bigquery_service().precalentar,
+            on_resultado=self._on_precarga_terminada,
+            on_error=lambda error: self.show_status_message(f"⚠️ Error en la precarga: {error}", 5000),
+            on_progreso=lambda porcentaje, mensaje: self.precarga_bar.setValue(porcentaje),
+            on_terminado=self.precarga_bar.hide,
+        )
+    
+    def _on_precarga_terminada(self, resultado):
+        # Aplicar de inmediato lo que quedó pendiente de sesiones anteriores
+        self.procesar_pendientes()
+        fallidas = [nombre for nombre, ok in resultado.items() if not ok]
+        if fallidas:
+            self.show_status_message(f"⚠️ No se pudo precargar: {', '.join(fallidas)}", 5000)
+        else:
+            self.show_status_message("✅ Datos precargados", 3000)
+    
+    def procesar_pendientes(self):
+        """Reintentar en segundo plano las escrituras diferidas vencidas y mostrar cuántas quedan"""
+        if self.tareas.en_curso("pendientes"):
+            return
+        from config.architecture import controllers
+        self.tareas.ejecutar(
+            "pendientes", controllers.get_bigquery_service().procesar_pendientes,
+            on_resultado=self._on_pendientes_procesados,
+            on_error=lambda error: print(f"[PENDIENTES] Error al procesar la cola: {error}"),
+        )
+    
+    def _on_pendientes_procesados(self, estado):
+        if estado.get('aplicadas'):
+            self.show_status_message(f"✅ {estado['aplicadas']} cambios diferidos aplicados", 4000)
+        cantidad = estado.get('cantidad') or 0
+        self.pendientes_label.setVisible(cantidad > 0)
+        if cantidad:
+            self.pendientes_label.setText(f"⏳ {cantidad} cambios pendientes")
+            tooltip = "Cambios bloqueados por el streaming buffer de BigQuery; se reintentan automáticamente"
+            if estado.get('proximo_intento'):
+                from datetime import datetime
+                proximo = datetime.fromtimestamp(estado['proximo_intento']).strftime("%H:%M")
+                tooltip += f"\nPróximo intento: {proximo}"
+            if estado.get('ultimo_error'):
+                tooltip += f"\nÚltimo error: {estado['ultimo_error']}"
+            self.pendientes_label.setToolTip(tooltip)
+    
     def show_status_message(self, message, duration=3000):
         """Mostrar mensaje en la barra de estado"""
         self.status_bar.showMessage(message, duration)
     
     def closeEvent(self, event):
         """Manejar cierre de la aplicación"""
-        # Aquí podrías agregar lógica de limpieza si es necesario
+        # Descartar la precarga en curso (el pool termina los jobs por su cuenta)
+        self.pendientes_timer.stop()
+        self.tareas.cancelar_todo()
         event.accept()
@@ -0,0 +1,310 @@
+"""
+Modelos de tabla (Qt model/view) para listas grandes: el texto se calcula al pintar
+"""
+from typing import Callable, List, Optional, Set
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+from PySide6.QtGui import QBrush, QColor
+
+from models.usuario_model import Usuario
+from services.instalaciones_index import InstalacionesIndex
+
+
+class UsuariosTableModel(QAbstractTableModel):
+    """Modelo de solo lectura sobre una lista de `Usuario`.
+
+    No crea un item por celda: `data()` formatea el valor de la fila pedida, y la vista
+    solo pide las filas visibles. Al refrescar con los mismos usuarios en el mismo orden
+    se emite `dataChanged` solo para las filas que cambiaron (se conserva la selección).
+    """
+
+    COLUMNAS = ["Email", "Nombre", "Rol", "Cargo", "Estado", "Última Sesión", "Fecha Creación"]
+    COL_ROL = 2
+
+    def __init__(self, color_rol: Callable[[str], str], parent=None):
+        super().__init__(parent)
+        self._color_rol = color_rol
+        self._usuarios: List[Usuario] = []
+        self._firmas: List[tuple] = []
+        self._pinceles = {}
+
+    # --- Interfaz del modelo ---
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._usuarios)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNAS)
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNAS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        usuario = self._usuarios[index.row()]
+        columna = index.column()
+        if role == Qt.DisplayRole:
+            return self._texto(usuario, columna)
+        if role == Qt.BackgroundRole and columna == self.COL_ROL:
+            return self._pincel(usuario.rol_id)
+        if role == Qt.ToolTipRole:
+            if columna == 0:
+                return usuario.email_login
+            if columna == self.COL_ROL:
+                return f"Rol: {usuario.nombre_rol}\nID: {usuario.rol_id}"
+        return None
+
+    # --- Datos ---
+
+    def usuario(self, fila: int) -> Optional[Usuario]:
+        """Usuario de una fila (None si está fuera de rango)"""
+        return self._usuarios[fila] if 0 <= fila < len(self._usuarios) else None
+
+    def usuarios(self) -> List[Usuario]:
+        return list(self._usuarios)
+
+    def set_usuarios(self, usuarios: List[Usuario]) -> None:
+        """Mostrar `usuarios`: avisa solo las filas cambiadas si la lista es la misma"""
+        usuarios = list(usuarios)
+        firmas = [self._firma(u) for u in usuarios]
+        mismos = (
+            len(usuarios) == len(self._usuarios)
+            and all(a.email_login == b.email_login for a, b in zip(usuarios, self._usuarios))
+        )
+        if not mismos:
+            self.beginResetModel()
+            self._usuarios, self._firmas = usuarios, firmas
+            self.endResetModel()
+            return
+
+        cambiadas = [i for i, (nueva, vieja) in enumerate(zip(firmas, self._firmas)) if nueva != vieja]
+        self._usuarios, self._firmas = usuarios, firmas
+        # Agrupar filas consecutivas en un solo aviso
+        inicio = anterior = None
+        for fila in cambiadas + [None]:
+            if fila is not None and anterior is not None and fila == anterior + 1:
+                anterior = fila
+                continue
+            if inicio is not None:
+                self.dataChanged.emit(self.index(inicio, 0), self.index(anterior, len(self.COLUMNAS) - 1))
+            inicio = anterior = fila
+
+    # --- Auxiliares ---
+
+    @staticmethod
+    def _firma(usuario: Usuario) -> tuple:
+        """Valores que se muestran: si no cambian, la fila no se repinta"""
+        return (usuario.nombre_completo, usuario.rol_id, usuario.nombre_rol, usuario.cargo,
+                usuario.activo, usuario.ultima_sesion, usuario.fecha_creacion)
+
+    @staticmethod
+    def _texto(usuario: Usuario, columna: int) -> str:
+        if columna == 0:
+            return usuario.email_login
+        if columna == 1:
+            return usuario.nombre_completo or "Sin nombre"
+        if columna == 2:
+            return usuario.nombre_rol
+        if columna == 3:
+            return usuario.cargo or "-"
+        if columna == 4:
+            return "🟢 Activo" if usuario.activo else "🔴 Inactivo"
+        if columna == 5:
+            return usuario.ultima_sesion.strftime("%d/%m/%Y %H:%M") if usuario.ultima_sesion else "Nunca"
+        if columna == 6:
+            return usuario.fecha_creacion.strftime("%d/%m/%Y") if usuario.fecha_creacion else "N/A"
+        return ""
+
+    def _pincel(self, rol_id: str) -> QBrush:
+        """Un QBrush por rol, reutilizado en todas las filas"""
+        pincel = self._pinceles.get(rol_id)
+        if pincel is None:
+            pincel = self._pinceles[rol_id] = QBrush(QColor(self._color_rol(rol_id)))
+        return pincel
+
+
+class PermisosTableModel(QAbstractTableModel):
+    """Permisos de un usuario por instalación (columnas Ver y Encuesta marcables).
+
+    El estado vive en un diccionario por `instalacion_rol`, independiente de lo que
+    muestre la vista: filtrar no crea ni destruye widgets y al guardar se incluyen
+    también las filas ocultas por el filtro.
+    """
+
+    COLUMNAS = ["Ver", "Encuesta", "Instalación", "Zona", "Cliente"]
+    COL_VER, COL_ENCUESTA = 0, 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._instalaciones: List = []
+        # instalacion_rol -> requiere_encuesta_individual (presente = puede ver)
+        self._marcadas = {}
+
+    # --- Interfaz del modelo ---
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._instalaciones)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNAS)
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNAS[section]
+        return None
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        banderas = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == self.COL_VER:
+            banderas |= Qt.ItemIsUserCheckable
+        elif index.column() == self.COL_ENCUESTA:
+            # La encuesta solo se puede marcar en instalaciones visibles para el usuario
+            banderas = Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+            if self._instalacion(index.row()) in self._marcadas:
+                banderas |= Qt.ItemIsEnabled
+        return banderas
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        inst = self._instalaciones[index.row()]
+        inst_id = getattr(inst, 'instalacion_rol', None)
+        columna = index.column()
+        if role == Qt.CheckStateRole:
+            if columna == self.COL_VER:
+                return Qt.Checked if inst_id in self._marcadas else Qt.Unchecked
+            if columna == self.COL_ENCUESTA:
+                return Qt.Checked if self._marcadas.get(inst_id) else Qt.Unchecked
+        elif role == Qt.DisplayRole:
+            if columna == 2:
+                return inst_id or ""
+            if columna == 3:
+                return getattr(inst, 'zona', None) or ""
+            if columna == 4:
+                return getattr(inst, 'cliente_rol', None) or ""
+        return None
+
+    def setData(self, index: QModelIndex, value, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        inst_id = self._instalacion(index.row())
+        if not inst_id:
+            return False
+        marcado = Qt.CheckState(value) == Qt.Checked
+        if index.column() == self.COL_VER:
+            if marcado:
+                self._marcadas.setdefault(inst_id, False)
+            else:
+                # Sin acceso tampoco hay encuesta
+                self._marcadas.pop(inst_id, None)
+        elif index.column() == self.COL_ENCUESTA:
+            if inst_id not in self._marcadas:
+                return False
+            self._marcadas[inst_id] = marcado
+        else:
+            return False
+        self.dataChanged.emit(self.index(index.row(), self.COL_VER), self.index(index.row(), self.COL_ENCUESTA))
+        return True
+
+    # --- Datos ---
+
+    def cargar(self, instalaciones: List, asignadas_detalle: dict) -> None:
+        """Mostrar `instalaciones` marcando las asignadas ({instalacion_rol: detalle})"""
+        self.beginResetModel()
+        self._instalaciones = list(instalaciones)
+        self._marcadas = {
+            inst_id: bool((detalle or {}).get('requiere_encuesta_individual'))
+            for inst_id, detalle in (asignadas_detalle or {}).items()
+        }
+        self.endResetModel()
+
+    def instalacion(self, fila: int):
+        return self._instalaciones[fila] if 0 <= fila < len(self._instalaciones) else None
+
+    def asignaciones(self) -> List[dict]:
+        """Instalaciones marcadas en todo el modelo (incluidas las que el filtro oculta)"""
+        return [
+            {
+                'instalacion_rol': inst.instalacion_rol,
+                'cliente_rol': getattr(inst, 'cliente_rol', None),
+                'puede_ver': True,
+                'requiere_encuesta_individual': bool(self._marcadas[inst.instalacion_rol]),
+            }
+            for inst in self._instalaciones
+            if getattr(inst, 'instalacion_rol', None) in self._marcadas
+        ]
+
+    def cantidad_marcadas(self) -> int:
+        return len(self.asignaciones())
+
+    def _instalacion(self, fila: int) -> Optional[str]:
+        inst = self.instalacion(fila)
+        return getattr(inst, 'instalacion_rol', None) if inst is not None else None
+
+
+class InstalacionesFiltroProxy(QSortFilterProxyModel):
+    """Filtro por zona, cliente y texto resuelto con un `InstalacionesIndex`.
+
+    Las filas del modelo origen deben ser `indice.instalaciones`, en el mismo orden:
+    cada cambio de filtro calcula una vez las posiciones aceptadas y las filas solo se
+    comparan contra ese conjunto.
+    """
+
+    TODAS_ZONAS = "Todas las zonas"
+    TODOS_CLIENTES = "Todos los clientes"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.zona = self.TODAS_ZONAS
+        self.cliente = self.TODOS_CLIENTES
+        self.texto = ""
+        self._indice: Optional[InstalacionesIndex] = None
+        self._filas: Optional[Set[int]] = None
+
+    def set_indice(self, indice: Optional[InstalacionesIndex]) -> None:
+        self._indice = indice
+        self._aplicar()
+
+    def set_filtros(self, zona: str, cliente: str, texto: str) -> None:
+        self.zona, self.cliente, self.texto = zona, cliente, texto or ""
+        self._aplicar()
+
+    def _aplicar(self) -> None:
+        self._filas = None
+        if self._indice is not None:
+            self._filas = self._indice.filtrar(
+                zona=self.zona if self.zona and self.zona != self.TODAS_ZONAS else None,
+                cliente=self.cliente if self.cliente and self.cliente != self.TODOS_CLIENTES else None,
+                texto=self.texto,
+            )
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        return self._filas is None or source_row in self._filas
+
+
+class UsuariosFiltroProxy(QSortFilterProxyModel):
+    """Filtro de la tabla de usuarios: filas que devolvió el índice de búsqueda y rol"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filas: Optional[Set[int]] = None
+        self._rol: Optional[str] = None
+
+    def set_filtro(self, filas: Optional[Set[int]], rol: Optional[str] = None) -> None:
+        """`filas`: posiciones en el modelo origen (None = todas); `rol`: nombre_rol o None"""
+        self._filas, self._rol = filas, rol
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if self._filas is not None and source_row not in self._filas:
+            return False
+        if self._rol is not None:
+            usuario = self.sourceModel().usuario(source_row)
+            return usuario is not None and usuario.nombre_rol == self._rol
+        return True
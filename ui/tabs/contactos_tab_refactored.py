@@ -8,14 +8,17 @@ from PySide6.QtWidgets import (
     QHeaderView, QListWidget, QListWidgetItem, QDialogButtonBox, QGroupBox,
     QScrollArea, QFrame, QApplication, QFileDialog, QTextEdit
 )
-from PySide6.QtCore import Signal, Qt
+from PySide6.QtCore import Signal, Qt, QTimer
 from PySide6.QtGui import QFont, QColor
 from controllers.contactos_controller import ContactosController
 from controllers.instalaciones_controller import InstalacionesController
 from models.contacto_model import Contacto
-from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY
-from ui.loading_dialog import ProgressDialog
+from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY, BUSQUEDA_DEBOUNCE_MS
+from ui.loading_dialog import ProgressDialog, InlineLoading
+from ui.workers import TaskRunner
+from services.search_index import IndiceBusqueda
 from datetime import datetime
+import re
 
 
 class ContactosTab(QWidget):
@@ -31,6 +34,12 @@ class ContactosTab(QWidget):
         
         self.datos_cargados = False
         self.contacto_inst_count = {}
+        # Datos en memoria para filtrar sin consultar servicios
+        self.contactos_data = []
+        self.indice = None
+        self.contactos_por_instalacion = {}  # instalacion_rol -> {contacto_id}
+        # Consultas en segundo plano (los resultados obsoletos se descartan)
+        self.tareas = TaskRunner(self)
         self.init_ui()
     
     def init_ui(self):
@@ -95,7 +104,12 @@ class ContactosTab(QWidget):
                 font-size: 14px;
             }
         """)
-        self.search_input.textChanged.connect(self.filtrar_contactos)
+        # Filtrar cuando se deja de teclear, no en cada tecla
+        self._busqueda_timer = QTimer(self)
+        self._busqueda_timer.setSingleShot(True)
+        self._busqueda_timer.setInterval(BUSQUEDA_DEBOUNCE_MS)
+        self._busqueda_timer.timeout.connect(self.filtrar_contactos)
+        self.search_input.textChanged.connect(lambda _: self._busqueda_timer.start())
         toolbar.addWidget(self.search_input)
         
         # Filtro por instalación
@@ -108,6 +122,10 @@ class ContactosTab(QWidget):
         toolbar.addStretch()
         layout.addLayout(toolbar)
         
+        # Indicador de carga (no bloquea la ventana)
+        self.cargando = InlineLoading(self, "⏳ Cargando contactos...")
+        layout.addWidget(self.cargando)
+        
         # Tabla de contactos (solo lectura)
         self.table = QTableWidget()
         self.table.setColumnCount(6)
@@ -147,74 +165,156 @@ class ContactosTab(QWidget):
     def showEvent(self, event):
         """Cargar datos la primera vez que se muestra el tab"""
         super().showEvent(event)
-        if not self.datos_cargados:
+        if not self.datos_cargados and not self.tareas.en_curso("contactos"):
             self.cargar_contactos()
 
     @property
     def contactos_controller(self):
         """Obtener controlador de contactos (inicialización perezosa)"""
         if self._contactos_controller is None:
-            from controllers.contactos_controller import ContactosController
-            self._contactos_controller = ContactosController()
+            from config.architecture import controllers
+            self._contactos_controller = controllers.get_contactos_controller()
         return self._contactos_controller
     
     @property
     def instalaciones_controller(self):
         """Obtener controlador de instalaciones (inicialización perezosa)"""
         if self._instalaciones_controller is None:
-            from controllers.instalaciones_controller import InstalacionesController
-            self._instalaciones_controller = InstalacionesController()
+            from config.architecture import controllers
+            self._instalaciones_controller = controllers.get_instalaciones_controller()
         return self._instalaciones_controller
     
-    def cargar_contactos(self):
-        """Cargar contactos desde el controlador"""
+    def cargar_contactos(self, revalidar: bool = False):
+        """Cargar contactos desde el controlador en segundo plano
+
+        Args:
+            revalidar: releer antes los metadatos de las tablas e invalidar lo que cambió
+        """
+        texto = None
+        if not self.datos_cargados and self._mostrar_snapshot():
+            texto = "🔄 Actualizando datos guardados..."
+        self.cargando.iniciar(texto)
+        self.tareas.ejecutar(
+            "contactos", self._consultar_contactos, revalidar=revalidar,
+            on_resultado=self._on_contactos_cargados,
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error al cargar contactos: {error}"),
+            on_terminado=self.cargando.detener,
+        )
+    
+    def _mostrar_snapshot(self) -> bool:
+        """Mostrar de inmediato los últimos datos guardados en disco mientras se revalida"""
         try:
-            # Obtener contactos del controlador
-            contactos = self.contactos_controller.get_contactos()
-            
-            # Cargar filtros
-            self.cargar_filtros()
-            
-            # Asegurar que no haya filtro de texto activo por defecto
-            self.search_input.clear()
-            
-            # Prefetch: obtener todas las relaciones instalación->contactos y calcular conteo por contacto
-            try:
-                inst_map = self.contactos_controller.get_todos_contactos_por_instalacion() or {}
-                counts = {}
-                for _inst, lista in inst_map.items():
-                    for c in lista:
-                        cid = getattr(c, 'contacto_id', None) if hasattr(c, 'contacto_id') else (c.get('contacto_id') if isinstance(c, dict) else None)
-                        if cid:
-                            counts[cid] = counts.get(cid, 0) + 1
-                self.contacto_inst_count = counts
-            except Exception:
-                self.contacto_inst_count = {}
-            
-            # Mostrar contactos en la tabla
+            contactos = self.contactos_controller.get_contactos_snapshot()
+            if contactos is None:
+                return False
+            inst_map = self.contactos_controller.get_todos_contactos_por_instalacion_snapshot() or {}
+            self.contactos_por_instalacion = self._invertir_instalaciones(inst_map)
+            self.contacto_inst_count = self._contar_instalaciones(self.contactos_por_instalacion)
+            self.cargar_filtros(self.instalaciones_controller.get_instalaciones_snapshot() or [])
             self.mostrar_contactos(contactos)
-            
-            self.datos_cargados = True
-            
+            return True
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al cargar contactos: {str(e)}")
+            print(f"Error mostrando snapshot de contactos: {e}")
+            return False
     
-    def cargar_filtros(self):
-        """Cargar opciones de filtros"""
+    def _consultar_contactos(self, revalidar: bool = False):
+        """Se ejecuta fuera del hilo de la interfaz: no tocar widgets aquí"""
+        if revalidar:
+            from config.architecture import controllers
+            controllers.get_bigquery_service().revalidar()
+        contactos = self.contactos_controller.get_contactos()
         try:
-            # Cargar instalaciones
             instalaciones = self.instalaciones_controller.get_instalaciones()
-            
-            self.instalacion_filter_combo.clear()
-            self.instalacion_filter_combo.addItem("Todas las instalaciones")
-            for instalacion in instalaciones:
-                self.instalacion_filter_combo.addItem(instalacion.instalacion_rol)
-                
         except Exception as e:
             print(f"Error al cargar filtros: {e}")
+            instalaciones = []
+        
+        # Prefetch: obtener todas las relaciones instalación->contactos y calcular conteo por contacto
+        try:
+            por_instalacion = self._invertir_instalaciones(self.contactos_controller.get_todos_contactos_por_instalacion() or {})
+        except Exception:
+            por_instalacion = {}
+        counts = self._contar_instalaciones(por_instalacion)
+        # El índice de búsqueda se construye aquí, una vez por carga
+        return contactos, instalaciones, counts, por_instalacion, self._indexar_contactos(contactos)
+    
+    @staticmethod
+    def _invertir_instalaciones(inst_map):
+        """{instalacion_rol: [contactos]} -> {instalacion_rol: {contacto_id}}"""
+        por_instalacion = {}
+        for inst, lista in inst_map.items():
+            ids = set()
+            for c in lista:
+                cid = getattr(c, 'contacto_id', None) if hasattr(c, 'contacto_id') else (c.get('contacto_id') if isinstance(c, dict) else None)
+                if cid:
+                    ids.add(cid)
+            por_instalacion[inst] = ids
+        return por_instalacion
+    
+    @staticmethod
+    def _contar_instalaciones(por_instalacion):
+        """Contar en cuántas instalaciones participa cada contacto"""
+        counts = {}
+        for ids in por_instalacion.values():
+            for cid in ids:
+                counts[cid] = counts.get(cid, 0) + 1
+        return counts
     
-    def mostrar_contactos(self, contactos):
-        """Mostrar contactos en la tabla"""
+    @staticmethod
+    def _solo_digitos(texto):
+        return re.sub(r"\D", "", texto or "")
+    
+    @classmethod
+    def _indexar_contactos(cls, contactos):
+        # El teléfono se indexa también solo con dígitos: "+56 9 1234" encuentra "56912345678"
+        return IndiceBusqueda.de_elementos(
+            contactos,
+            lambda c: (c.nombre_contacto, c.email, c.telefono, cls._solo_digitos(c.telefono)),
+            clave=lambda c: c.contacto_id,
+        )
+    
+    def _on_contactos_cargados(self, datos):
+        contactos, instalaciones, self.contacto_inst_count, self.contactos_por_instalacion, indice = datos
+        
+        # Cargar filtros
+        self.cargar_filtros(instalaciones)
+        
+        # Asegurar que no haya filtro de texto activo por defecto
+        self.search_input.blockSignals(True)
+        self.search_input.clear()
+        self.search_input.blockSignals(False)
+        
+        # Mostrar contactos en la tabla
+        self.mostrar_contactos(contactos, indice)
+        
+        self.datos_cargados = True
+    
+    def cargar_filtros(self, instalaciones):
+        """Cargar opciones de filtros (se conserva la instalación elegida si sigue existiendo)"""
+        seleccionada = self.instalacion_filter_combo.currentText()
+        self.instalacion_filter_combo.blockSignals(True)
+        self.instalacion_filter_combo.clear()
+        self.instalacion_filter_combo.addItem("Todas las instalaciones")
+        for instalacion in instalaciones:
+            self.instalacion_filter_combo.addItem(instalacion.instalacion_rol)
+        indice = self.instalacion_filter_combo.findText(seleccionada)
+        self.instalacion_filter_combo.setCurrentIndex(max(indice, 0))
+        self.instalacion_filter_combo.blockSignals(False)
+    
+    def mostrar_contactos(self, contactos, indice=None):
+        """Mostrar contactos en la tabla y aplicar los filtros actuales
+
+        Args:
+            contactos: lista completa de contactos
+            indice: índice de búsqueda ya construido sobre `contactos` (si no, se reutiliza
+                el actual cuando corresponde a los mismos contactos, o se construye)
+        """
+        if indice is None and not (self.indice and self.indice.corresponde([c.contacto_id for c in contactos])):
+            indice = self._indexar_contactos(contactos)
+        if indice is not None:
+            self.indice = indice
+        self.contactos_data = list(contactos)
+        
         self.table.setRowCount(len(contactos))
         
         for row, contacto in enumerate(contactos):
@@ -244,31 +344,33 @@ class ContactosTab(QWidget):
             self.table.setItem(row, 5, instalaciones_item)
             
             # Sin acciones (solo lectura)
+        
+        self.filtrar_contactos()
+    
+    def _buscar_filas(self, texto):
+        """Filas que coinciden con el texto (None = sin filtro)"""
+        if self.indice is None:
+            return None
+        filas = self.indice.buscar(texto)
+        # Un teléfono escrito con separadores ("+56 9-1234") se busca también solo con dígitos
+        digitos = self._solo_digitos(texto)
+        if filas is not None and digitos and re.fullmatch(r"[\d\s+\-().]+", texto.strip()):
+            filas |= self.indice.buscar(digitos) or set()
+        return filas
     
     def filtrar_contactos(self):
-        """Filtrar contactos por criterios"""
-        try:
-            # Obtener todos los contactos
-            contactos = self.contactos_controller.get_contactos()
-            
-            # Filtrar por texto
-            texto = self.search_input.text().lower()
-            if texto:
-                contactos = [cont for cont in contactos if 
-                           texto in cont.nombre_contacto.lower() or 
-                           (cont.telefono and texto in cont.telefono.lower()) or 
-                           (cont.email and texto in cont.email.lower())]
-            
-            # Filtrar por instalación
-            instalacion_seleccionada = self.instalacion_filter_combo.currentText()
-            if instalacion_seleccionada != "Todas las instalaciones":
-                # TODO: Implementar filtro por instalación
-                pass
-            
-            self.mostrar_contactos(contactos)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al filtrar contactos: {str(e)}")
+        """Filtrar la tabla por texto (índice en memoria) e instalación, sin consultar servicios"""
+        filas = self._buscar_filas(self.search_input.text())
+        
+        # Filtrar por instalación con el índice instalación -> contactos
+        instalacion_seleccionada = self.instalacion_filter_combo.currentText()
+        ids = None
+        if instalacion_seleccionada and instalacion_seleccionada != "Todas las instalaciones":
+            ids = self.contactos_por_instalacion.get(instalacion_seleccionada, set())
+        
+        for row, contacto in enumerate(self.contactos_data):
+            visible = (filas is None or row in filas) and (ids is None or contacto.contacto_id in ids)
+            self.table.setRowHidden(row, not visible)
     
     def nuevo_contacto(self):
         """Crear nuevo contacto"""
@@ -298,14 +400,9 @@ class ContactosTab(QWidget):
         QMessageBox.information(self, "Instalaciones", f"Contacto: {contacto.nombre_contacto}")
     
     def sincronizar_contactos(self):
-        """Forzar recarga desde BigQuery ignorando cache"""
+        """Recargar desde BigQuery solo lo que cambió (según metadatos de las tablas)"""
         try:
-            try:
-                from services.bigquery_service import BigQueryService
-                BigQueryService().clear_cache()
-            except Exception:
-                pass
-            self.cargar_contactos()
+            self.cargar_contactos(revalidar=True)
             self.status_message.emit("Contactos sincronizados", 3000)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error al sincronizar contactos: {str(e)}")
@@ -8,13 +8,15 @@ from PySide6.QtWidgets import (
     QHeaderView, QListWidget, QListWidgetItem, QDialogButtonBox, QGroupBox,
     QScrollArea, QFrame, QApplication, QFileDialog, QTextEdit
 )
-from PySide6.QtCore import Signal, Qt
+from PySide6.QtCore import Signal, Qt, QTimer
 from PySide6.QtGui import QFont, QColor
 from controllers.instalaciones_controller import InstalacionesController
 from controllers.contactos_controller import ContactosController
 from models.instalacion_model import Instalacion
-from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY
-from ui.loading_dialog import ProgressDialog
+from config.settings import COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY, BUSQUEDA_DEBOUNCE_MS
+from ui.loading_dialog import ProgressDialog, InlineLoading
+from ui.workers import TaskRunner
+from services.instalaciones_index import InstalacionesIndex
 from datetime import datetime
 
 
@@ -31,6 +33,10 @@ class InstalacionesTab(QWidget):
         
         self.datos_cargados = False
         self.contactos_por_instalacion = {}
+        # Índice zona -> cliente -> instalación: los filtros no vuelven a consultar servicios
+        self.indice = None
+        # Consultas en segundo plano (los resultados obsoletos se descartan)
+        self.tareas = TaskRunner(self)
         self.init_ui()
     
     def init_ui(self):
@@ -77,7 +83,12 @@ class InstalacionesTab(QWidget):
                 font-size: 14px;
             }
         """)
-        self.search_input.textChanged.connect(self.filtrar_instalaciones)
+        # Filtrar cuando se deja de teclear, no en cada tecla
+        self._busqueda_timer = QTimer(self)
+        self._busqueda_timer.setSingleShot(True)
+        self._busqueda_timer.setInterval(BUSQUEDA_DEBOUNCE_MS)
+        self._busqueda_timer.timeout.connect(self.filtrar_instalaciones)
+        self.search_input.textChanged.connect(lambda _: self._busqueda_timer.start())
         toolbar.addWidget(self.search_input)
         
         # Filtro por cliente
@@ -97,6 +108,10 @@ class InstalacionesTab(QWidget):
         toolbar.addStretch()
         layout.addLayout(toolbar)
         
+        # Indicador de carga (no bloquea la ventana)
+        self.cargando = InlineLoading(self, "⏳ Cargando instalaciones...")
+        layout.addWidget(self.cargando)
+        
         # Tabla de instalaciones
         self.table = QTableWidget()
         self.table.setColumnCount(5)
@@ -135,71 +150,106 @@ class InstalacionesTab(QWidget):
     def showEvent(self, event):
         """Cargar datos la primera vez que se muestra el tab"""
         super().showEvent(event)
-        if not self.datos_cargados:
+        if not self.datos_cargados and not self.tareas.en_curso("instalaciones"):
             self.cargar_instalaciones()
 
     @property
     def instalaciones_controller(self):
         """Obtener controlador de instalaciones (inicialización perezosa)"""
         if self._instalaciones_controller is None:
-            from controllers.instalaciones_controller import InstalacionesController
-            self._instalaciones_controller = InstalacionesController()
+            from config.architecture import controllers
+            self._instalaciones_controller = controllers.get_instalaciones_controller()
         return self._instalaciones_controller
     
     @property
     def contactos_controller(self):
         """Obtener controlador de contactos (inicialización perezosa)"""
         if self._contactos_controller is None:
-            from controllers.contactos_controller import ContactosController
-            self._contactos_controller = ContactosController()
+            from config.architecture import controllers
+            self._contactos_controller = controllers.get_contactos_controller()
         return self._contactos_controller
     
-    def cargar_instalaciones(self):
-        """Cargar instalaciones desde el controlador"""
+    def cargar_instalaciones(self, revalidar: bool = False):
+        """Cargar instalaciones desde el controlador en segundo plano
+
+        Args:
+            revalidar: releer antes los metadatos de las tablas e invalidar lo que cambió
+        """
+        texto = None
+        if not self.datos_cargados and self._mostrar_snapshot():
+            texto = "🔄 Actualizando datos guardados..."
+        self.cargando.iniciar(texto)
+        self.tareas.ejecutar(
+            "instalaciones", self._consultar_instalaciones, revalidar=revalidar,
+            on_resultado=self._on_instalaciones_cargadas,
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error al cargar instalaciones: {error}"),
+            on_terminado=self.cargando.detener,
+        )
+    
+    def _mostrar_snapshot(self) -> bool:
+        """Mostrar de inmediato los últimos datos guardados en disco mientras se revalida"""
         try:
-            # Obtener instalaciones del controlador
-            instalaciones = self.instalaciones_controller.get_instalaciones()
-            
-            # Prefetch de contactos por instalación (una sola query)
-            try:
-                self.contactos_por_instalacion = self.contactos_controller.get_todos_contactos_por_instalacion() or {}
-            except Exception:
-                self.contactos_por_instalacion = {}
-            
-            # Cargar filtros
-            self.cargar_filtros()
-            
-            # Asegurar que no haya filtro de texto activo por defecto
-            self.search_input.clear()
-            
-            # Mostrar instalaciones en la tabla
-            self.mostrar_instalaciones(instalaciones)
-            
-            self.datos_cargados = True
-            
+            instalaciones = self.instalaciones_controller.get_instalaciones_snapshot()
+            if instalaciones is None:
+                return False
+            self.contactos_por_instalacion = self.contactos_controller.get_todos_contactos_por_instalacion_snapshot() or {}
+            self.indice = InstalacionesIndex(instalaciones)
+            self.cargar_filtros(self.indice)
+            self.filtrar_instalaciones()
+            return True
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al cargar instalaciones: {str(e)}")
+            print(f"Error mostrando snapshot de instalaciones: {e}")
+            return False
     
-    def cargar_filtros(self):
-        """Cargar opciones de filtros"""
+    def _consultar_instalaciones(self, revalidar: bool = False):
+        """Se ejecuta fuera del hilo de la interfaz: no tocar widgets aquí"""
+        if revalidar:
+            from config.architecture import controllers
+            controllers.get_bigquery_service().revalidar()
+        # El índice se reutiliza mientras no cambie la versión de los datos
+        indice = self.instalaciones_controller.get_indice()
+        # Prefetch de contactos por instalación (una sola query)
         try:
-            # Cargar clientes
-            instalaciones = self.instalaciones_controller.get_instalaciones()
-            clientes = sorted(set(inst.cliente_rol for inst in instalaciones))
-            
-            self.cliente_filter_combo.clear()
-            self.cliente_filter_combo.addItem("Todos los clientes")
-            for cliente in clientes:
-                self.cliente_filter_combo.addItem(cliente)
-            
-            # Cargar zonas
-            zonas = self.instalaciones_controller.get_zonas()
-            self.zona_filter_combo.clear()
-            self.zona_filter_combo.addItem("Todas las zonas")
-            for zona in zonas:
-                self.zona_filter_combo.addItem(zona)
+            contactos_por_instalacion = self.contactos_controller.get_todos_contactos_por_instalacion() or {}
+        except Exception:
+            contactos_por_instalacion = {}
+        return indice, contactos_por_instalacion
+    
+    def _on_instalaciones_cargadas(self, datos):
+        self.indice, self.contactos_por_instalacion = datos
+        
+        # Cargar filtros
+        self.cargar_filtros(self.indice)
+        
+        # Asegurar que no haya filtro de texto activo por defecto
+        self.search_input.blockSignals(True)
+        self.search_input.clear()
+        self.search_input.blockSignals(False)
+        
+        # Mostrar instalaciones en la tabla (con los filtros de zona/cliente vigentes)
+        self.filtrar_instalaciones()
+        
+        self.datos_cargados = True
+    
+    def cargar_filtros(self, indice):
+        """Cargar opciones de filtros (se conserva la selección si sigue existiendo)"""
+        try:
+            for combo, todos, opciones in (
+                (self.cliente_filter_combo, "Todos los clientes", indice.clientes()),
+                (self.zona_filter_combo, "Todas las zonas", indice.zonas()),
+            ):
+                seleccionado = combo.currentText()
+                combo.blockSignals(True)
+                combo.clear()
+                combo.addItem(todos)
+                for opcion in opciones:
+                    combo.addItem(opcion)
+                combo.setCurrentIndex(max(combo.findText(seleccionado), 0))
+                combo.blockSignals(False)
                 
         except Exception as e:
+            self.cliente_filter_combo.blockSignals(False)
+            self.zona_filter_combo.blockSignals(False)
             print(f"Error al cargar filtros: {e}")
     
     def mostrar_instalaciones(self, instalaciones):
@@ -233,33 +283,16 @@ class InstalacionesTab(QWidget):
             # Sin columna de acciones (vista solo lectura)
     
     def filtrar_instalaciones(self):
-        """Filtrar instalaciones por criterios"""
-        try:
-            # Obtener todos los instalaciones
-            instalaciones = self.instalaciones_controller.get_instalaciones()
-            
-            # Filtrar por texto
-            texto = self.search_input.text().lower()
-            if texto:
-                instalaciones = [inst for inst in instalaciones if 
-                               texto in inst.instalacion_rol.lower() or 
-                               texto in inst.cliente_rol.lower() or 
-                               (inst.zona and texto in inst.zona.lower())]
-            
-            # Filtrar por cliente
-            cliente_seleccionado = self.cliente_filter_combo.currentText()
-            if cliente_seleccionado != "Todos los clientes":
-                instalaciones = [inst for inst in instalaciones if inst.cliente_rol == cliente_seleccionado]
-            
-            # Filtrar por zona
-            zona_seleccionada = self.zona_filter_combo.currentText()
-            if zona_seleccionada != "Todas las zonas":
-                instalaciones = [inst for inst in instalaciones if inst.zona == zona_seleccionada]
-            
-            self.mostrar_instalaciones(instalaciones)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al filtrar instalaciones: {str(e)}")
+        """Filtrar por texto, cliente y zona con el índice en memoria (sin consultar servicios)"""
+        if self.indice is None:
+            return
+        cliente_seleccionado = self.cliente_filter_combo.currentText()
+        zona_seleccionada = self.zona_filter_combo.currentText()
+        self.mostrar_instalaciones(self.indice.seleccionar(
+            zona=zona_seleccionada if zona_seleccionada and zona_seleccionada != "Todas las zonas" else None,
+            cliente=cliente_seleccionado if cliente_seleccionado and cliente_seleccionado != "Todos los clientes" else None,
+            texto=self.search_input.text(),
+        ))
     
     def nueva_instalacion(self):
         """Crear nueva instalación"""
@@ -290,14 +323,9 @@ class InstalacionesTab(QWidget):
         QMessageBox.information(self, "Contactos", f"Instalación: {instalacion.instalacion_rol}\nContactos: {len(contactos)}")
     
     def sincronizar_instalaciones(self):
-        """Forzar recarga desde BigQuery ignorando cache"""
+        """Recargar desde BigQuery solo lo que cambió (según metadatos de las tablas)"""
         try:
-            try:
-                from services.bigquery_service import BigQueryService
-                BigQueryService().clear_cache()
-            except Exception:
-                pass
-            self.cargar_instalaciones()
+            self.cargar_instalaciones(revalidar=True)
             self.status_message.emit("Instalaciones sincronizadas", 3000)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error al sincronizar instalaciones: {str(e)}")
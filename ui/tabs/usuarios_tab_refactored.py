@@ -5,10 +5,10 @@ from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QToolButton,
     QTableWidget, QTableWidgetItem, QLineEdit, QLabel,
     QDialog, QFormLayout, QComboBox, QCheckBox, QMessageBox,
-    QHeaderView, QListWidget, QListWidgetItem, QDialogButtonBox, QGroupBox, QTabWidget,
-    QScrollArea, QFrame, QApplication, QFileDialog, QTextEdit
+    QHeaderView, QTableView, QListWidget, QListWidgetItem, QDialogButtonBox, QGroupBox, QTabWidget,
+    QScrollArea, QFrame, QApplication, QFileDialog, QTextEdit, QMenu, QInputDialog
 )
-from PySide6.QtCore import Signal, Qt
+from PySide6.QtCore import Signal, Qt, QTimer
 from PySide6.QtGui import QFont, QColor
 from controllers.usuarios_controller import UsuariosController
 from controllers.instalaciones_controller import InstalacionesController
@@ -16,10 +16,16 @@ from controllers.contactos_controller import ContactosController
 from models.usuario_model import Usuario
 from config.settings import (
     COLOR_PRIMARY, COLOR_SUCCESS, COLOR_ERROR, COLOR_SECONDARY,
-    COLOR_ADMIN, COLOR_SUBGERENTE, COLOR_JEFE, COLOR_SUPERVISOR, COLOR_GERENTE, COLOR_CLIENTE
+    COLOR_ADMIN, COLOR_SUBGERENTE, COLOR_JEFE, COLOR_SUPERVISOR, COLOR_GERENTE, COLOR_CLIENTE,
+    BUSQUEDA_DEBOUNCE_MS
 )
-from ui.loading_dialog import ProgressDialog
+from ui.loading_dialog import ProgressDialog, InlineLoading
+from ui.workers import TaskRunner
 from ui.carga_masiva_dialog import CargaMasivaDialog
+from ui.table_models import (
+    UsuariosTableModel, UsuariosFiltroProxy, PermisosTableModel, InstalacionesFiltroProxy
+)
+from services.search_index import IndiceBusqueda
 from pathlib import Path
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
@@ -38,13 +44,15 @@ class UsuariosTab(QWidget):
         self._instalaciones_controller = None
         self._contactos_controller = None
         
+        # Consultas en segundo plano (los resultados obsoletos se descartan)
+        self.tareas = TaskRunner(self)
         self.datos_cargados = False
         self.init_ui()
     
     def showEvent(self, event):
         """Cargar usuarios la primera vez que se muestra el tab"""
         super().showEvent(event)
-        if not self.datos_cargados:
+        if not self.datos_cargados and not self.tareas.en_curso("usuarios"):
             try:
                 self.cargar_usuarios()
             except Exception as e:
@@ -112,14 +120,19 @@ class UsuariosTab(QWidget):
                 font-size: 14px;
             }
         """)
-        self.search_input.textChanged.connect(self.filtrar_usuarios)
+        # La búsqueda espera a que se deje de teclear y se resuelve con el índice en memoria
+        self._busqueda_timer = QTimer(self)
+        self._busqueda_timer.setSingleShot(True)
+        self._busqueda_timer.setInterval(BUSQUEDA_DEBOUNCE_MS)
+        self._busqueda_timer.timeout.connect(self.filtrar_usuarios)
+        self.search_input.textChanged.connect(lambda _: self._busqueda_timer.start())
         toolbar.addWidget(self.search_input)
         
         # Filtro por rol
         toolbar.addWidget(QLabel("Rol:"))
         self.rol_filter_combo = QComboBox()
         self.rol_filter_combo.addItem("Todos los roles")
-        self.rol_filter_combo.currentTextChanged.connect(self.filtrar_usuarios)
+        self.rol_filter_combo.currentTextChanged.connect(lambda _: self.filtrar_usuarios())
         toolbar.addWidget(self.rol_filter_combo)
         
         # Botón limpiar cache
@@ -260,19 +273,57 @@ class UsuariosTab(QWidget):
         """)
         acciones_bar.addWidget(self.btn_eliminar_sel)
         
+        # Acciones masivas sobre todas las filas seleccionadas (una escritura por acción)
+        self.btn_masivo_sel = QToolButton()
+        self.btn_masivo_sel.setText("Acciones masivas")
+        self.btn_masivo_sel.setToolTip("Aplicar una acción a todos los usuarios seleccionados")
+        self.btn_masivo_sel.setEnabled(False)
+        self.btn_masivo_sel.setPopupMode(QToolButton.InstantPopup)
+        menu_masivo = QMenu(self.btn_masivo_sel)
+        menu_masivo.addAction("🟢 Activar", lambda: self.accion_toggle_masivo(True))
+        menu_masivo.addAction("🔴 Desactivar", lambda: self.accion_toggle_masivo(False))
+        menu_masivo.addAction("Cambiar rol...", self.accion_cambiar_rol_masivo)
+        menu_masivo.addAction("Asignar instalaciones...", self.accion_asignar_instalaciones_masivo)
+        self.btn_masivo_sel.setMenu(menu_masivo)
+        self.btn_masivo_sel.setStyleSheet(f"""
+            QToolButton {{
+                background-color: {COLOR_PRIMARY};
+                color: white;
+                padding: 8px 14px;
+                border: none;
+                border-radius: 5px;
+                font-weight: bold;
+            }}
+            QToolButton:hover {{
+                background-color: #025a8a;
+            }}
+            QToolButton:disabled {{
+                background-color: #b3d4e6; color: #f0f0f0;
+            }}
+        """)
+        acciones_bar.addWidget(self.btn_masivo_sel)
+        
         acciones_bar.addStretch()
         layout.addLayout(acciones_bar)
         
-        # Tabla de usuarios
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels([
-            "Email", "Nombre", "Rol", "Cargo", "Estado", "Última Sesión", "Fecha Creación"
-        ])
-        # Selección por fila y única
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SingleSelection)
-        self.table.itemSelectionChanged.connect(self.update_action_buttons)
+        # Indicador de carga (no bloquea la ventana)
+        self.cargando = InlineLoading(self, "⏳ Cargando usuarios...")
+        layout.addWidget(self.cargando)
+        
+        # Tabla de usuarios (modelo/vista: solo se formatean las filas visibles)
+        self.modelo = UsuariosTableModel(self.get_rol_color, self)
+        self.proxy = UsuariosFiltroProxy(self)
+        self.proxy.setSourceModel(self.modelo)
+        self.indice = None
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(34)
+        self.table.setWordWrap(False)
+        # Selección por fila; Ctrl/Shift para seleccionar varias (acciones masivas)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.ExtendedSelection)
+        self.table.selectionModel().selectionChanged.connect(lambda *_: self.update_action_buttons())
         
         # Configurar tabla
         header = self.table.horizontalHeader()
@@ -285,16 +336,16 @@ class UsuariosTab(QWidget):
         header.setSectionResizeMode(6, QHeaderView.ResizeToContents)  # Fecha Creación
         
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 gridline-color: #ddd;
                 background-color: white;
                 alternate-background-color: #f8f9fa;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #eee;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #e3f2fd;
                 color: #333333;
             }
@@ -309,117 +360,138 @@ class UsuariosTab(QWidget):
     def usuarios_controller(self):
         """Obtener controlador de usuarios (inicialización perezosa)"""
         if self._usuarios_controller is None:
-            from controllers.usuarios_controller import UsuariosController
-            self._usuarios_controller = UsuariosController()
+            from config.architecture import controllers
+            self._usuarios_controller = controllers.get_usuarios_controller()
         return self._usuarios_controller
     
     @property
     def instalaciones_controller(self):
         """Obtener controlador de instalaciones (inicialización perezosa)"""
         if self._instalaciones_controller is None:
-            from controllers.instalaciones_controller import InstalacionesController
-            self._instalaciones_controller = InstalacionesController()
+            from config.architecture import controllers
+            self._instalaciones_controller = controllers.get_instalaciones_controller()
         return self._instalaciones_controller
     
     @property
     def contactos_controller(self):
         """Obtener controlador de contactos (inicialización perezosa)"""
         if self._contactos_controller is None:
-            from controllers.contactos_controller import ContactosController
-            self._contactos_controller = ContactosController()
+            from config.architecture import controllers
+            self._contactos_controller = controllers.get_contactos_controller()
         return self._contactos_controller
     
-    def cargar_usuarios(self):
-        """Cargar usuarios desde el controlador"""
+    def cargar_usuarios(self, revalidar: bool = False):
+        """Cargar usuarios desde el controlador en segundo plano
+
+        Args:
+            revalidar: releer antes los metadatos de las tablas e invalidar lo que cambió
+        """
+        texto = None
+        if not self.datos_cargados and self._mostrar_snapshot():
+            texto = "🔄 Actualizando datos guardados..."
+        self.cargando.iniciar(texto)
+        self.tareas.ejecutar(
+            "usuarios", self._consultar_usuarios, revalidar=revalidar,
+            on_resultado=self._on_usuarios_cargados,
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error al cargar usuarios: {error}"),
+            on_terminado=self.cargando.detener,
+        )
+    
+    def _mostrar_snapshot(self) -> bool:
+        """Mostrar de inmediato los últimos datos guardados en disco mientras se revalida"""
         try:
-            # Obtener usuarios del controlador
-            usuarios = self.usuarios_controller.get_usuarios()
-            
-            # Cargar roles para el filtro
-            self.cargar_roles_filtro()
-            
-            # Mostrar usuarios en la tabla
+            usuarios = self.usuarios_controller.get_usuarios_snapshot()
+            if usuarios is None:
+                return False
+            self.cargar_roles_filtro(self.usuarios_controller.get_roles_snapshot() or [])
             self.mostrar_usuarios(usuarios)
-            
-            self.datos_cargados = True
-            
+            return True
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al cargar usuarios: {str(e)}")
+            print(f"Error mostrando snapshot de usuarios: {e}")
+            return False
     
-    def cargar_roles_filtro(self):
+    def _consultar_usuarios(self, revalidar: bool = False):
+        """Se ejecuta fuera del hilo de la interfaz: no tocar widgets aquí"""
+        if revalidar:
+            from config.architecture import controllers
+            controllers.get_bigquery_service().revalidar()
+        usuarios = self.usuarios_controller.get_usuarios()
+        # El índice de búsqueda se construye aquí, una vez por carga
+        return usuarios, self.usuarios_controller.get_roles(), self._indexar_usuarios(usuarios)
+    
+    @staticmethod
+    def _indexar_usuarios(usuarios):
+        return IndiceBusqueda.de_elementos(
+            usuarios,
+            lambda u: (u.nombre_completo, u.email_login, u.cliente_rol),
+            clave=lambda u: u.email_login,
+        )
+    
+    def _on_usuarios_cargados(self, datos):
+        usuarios, roles, indice = datos
+        # Cargar roles para el filtro
+        self.cargar_roles_filtro(roles)
+        # Mostrar usuarios; los filtros activos se aplican sobre la vista
+        self.mostrar_usuarios(usuarios, indice)
+        self.datos_cargados = True
+        # Completar con el estado real de Firebase sin bloquear la tabla
+        self.tareas.ejecutar(
+            "firebase", self.usuarios_controller.enriquecer_con_firebase, usuarios,
+            on_resultado=self._on_estado_firebase,
+        )
+    
+    def _on_estado_firebase(self, usuarios):
+        self.mostrar_usuarios(usuarios)
+    
+    def cargar_roles_filtro(self, roles=None):
         """Cargar roles en el combo de filtro"""
         try:
-            roles = self.usuarios_controller.get_roles()
+            if roles is None:
+                roles = self.usuarios_controller.get_roles()
+            seleccionado = self.rol_filter_combo.currentText()
+            self.rol_filter_combo.blockSignals(True)
             self.rol_filter_combo.clear()
             self.rol_filter_combo.addItem("Todos los roles")
             
             for rol in roles:
                 self.rol_filter_combo.addItem(rol['nombre_rol'])
+            
+            # Conservar el filtro elegido mientras la recarga estaba en curso
+            idx = self.rol_filter_combo.findText(seleccionado)
+            self.rol_filter_combo.setCurrentIndex(max(idx, 0))
+            self.rol_filter_combo.blockSignals(False)
                 
         except Exception as e:
+            self.rol_filter_combo.blockSignals(False)
             print(f"Error al cargar roles: {e}")
     
-    def mostrar_usuarios(self, usuarios):
-        """Mostrar usuarios en la tabla"""
-        # Guardar referencia para selección
-        self.usuarios_actuales = usuarios
-        # Limpiar selección previa
-        try:
-            self.table.clearSelection()
-        except Exception:
-            pass
-        self.table.setRowCount(len(usuarios))
-        
-        for row, usuario in enumerate(usuarios):
-            # Email
-            email_item = QTableWidgetItem(usuario.email_login)
-            email_item.setToolTip(usuario.email_login)
-            self.table.setItem(row, 0, email_item)
-            
-            # Nombre completo
-            nombre_item = QTableWidgetItem(usuario.nombre_completo or "Sin nombre")
-            self.table.setItem(row, 1, nombre_item)
-            
-            # Rol con color
-            rol_item = QTableWidgetItem(usuario.nombre_rol)
-            rol_color = self.get_rol_color(usuario.rol_id)
-            rol_item.setBackground(QColor(rol_color))
-            rol_item.setToolTip(f"Rol: {usuario.nombre_rol}\nID: {usuario.rol_id}")
-            self.table.setItem(row, 2, rol_item)
-            
-            # Cargo
-            cargo_item = QTableWidgetItem(usuario.cargo or "-")
-            self.table.setItem(row, 3, cargo_item)
-            
-            # Estado
-            estado_text = "🟢 Activo" if usuario.activo else "🔴 Inactivo"
-            estado_item = QTableWidgetItem(estado_text)
-            self.table.setItem(row, 4, estado_item)
-            
-            # Última sesión
-            ultima_sesion = usuario.ultima_sesion.strftime("%d/%m/%Y %H:%M") if usuario.ultima_sesion else "Nunca"
-            ultima_sesion_item = QTableWidgetItem(ultima_sesion)
-            self.table.setItem(row, 5, ultima_sesion_item)
-            
-            # Fecha creación
-            fecha_creacion = usuario.fecha_creacion.strftime("%d/%m/%Y") if usuario.fecha_creacion else "N/A"
-            fecha_creacion_item = QTableWidgetItem(fecha_creacion)
-            self.table.setItem(row, 6, fecha_creacion_item)
-            
-            # (Columna Acciones eliminada: acciones ahora están en la barra superior)
-        
+    def mostrar_usuarios(self, usuarios, indice=None):
+        """Mostrar usuarios en la tabla (solo se repintan las filas que cambiaron)
+
+        Args:
+            indice: índice de búsqueda ya construido sobre `usuarios` (si no, se reutiliza
+                el actual cuando corresponde a los mismos usuarios o se construye)
+        """
+        self.modelo.set_usuarios(usuarios)
+        if indice is None and not (self.indice and self.indice.corresponde([u.email_login for u in usuarios])):
+            indice = self._indexar_usuarios(usuarios)
+        if indice is not None:
+            self.indice = indice
+        self.filtrar_usuarios()
         # Actualizar botones de acciones basados en selección
         self.update_action_buttons()
 
+    def get_selected_usuarios(self):
+        """Devuelve los usuarios de todas las filas seleccionadas (en orden de la tabla)."""
+        filas = sorted({
+            self.proxy.mapToSource(index).row() for index in self.table.selectionModel().selectedRows()
+        })
+        return [u for u in (self.modelo.usuario(row) for row in filas) if u is not None]
+
     def get_selected_usuario(self):
-        """Devuelve el usuario actualmente seleccionado o None."""
-        selected_indexes = self.table.selectedIndexes()
-        if not selected_indexes:
-            return None
-        row = selected_indexes[0].row()
-        if hasattr(self, 'usuarios_actuales') and 0 <= row < len(self.usuarios_actuales):
-            return self.usuarios_actuales[row]
-        return None
+        """Devuelve el usuario seleccionado si hay exactamente uno, o None."""
+        seleccionados = self.get_selected_usuarios()
+        return seleccionados[0] if len(seleccionados) == 1 else None
 
     def update_action_buttons(self):
         """Habilita/deshabilita botones según la selección actual."""
@@ -429,8 +501,14 @@ class UsuariosTab(QWidget):
         self.btn_permisos_sel.setEnabled(enabled)
         # Contactos: solo para CLIENTE
         self.btn_contactos_sel.setEnabled(enabled and getattr(usuario, 'rol_id', None) == 'CLIENTE')
+        cantidad = len(self.get_selected_usuarios())
+        ocupado = self.tareas.en_curso("masivo")
         if hasattr(self, 'btn_eliminar_sel'):
-            self.btn_eliminar_sel.setEnabled(enabled)
+            self.btn_eliminar_sel.setEnabled(cantidad > 0 and not ocupado)
+            self.btn_eliminar_sel.setText("Eliminar" if cantidad <= 1 else f"Eliminar ({cantidad})")
+        if hasattr(self, 'btn_masivo_sel'):
+            self.btn_masivo_sel.setEnabled(cantidad > 0 and not ocupado)
+            self.btn_masivo_sel.setText("Acciones masivas" if cantidad <= 1 else f"Acciones masivas ({cantidad})")
 
     # Wrappers de acciones sobre el usuario seleccionado
     def accion_editar_seleccionado(self):
@@ -454,9 +532,13 @@ class UsuariosTab(QWidget):
             self.toggle_usuario(usuario)
 
     def accion_eliminar_seleccionado(self):
-        usuario = self.get_selected_usuario()
-        if not usuario:
+        usuarios = self.get_selected_usuarios()
+        if not usuarios:
+            return
+        if len(usuarios) > 1:
+            self.accion_eliminar_masivo(usuarios)
             return
+        usuario = usuarios[0]
         confirm = QMessageBox.question(
             self,
             "Eliminar usuario",
@@ -471,12 +553,104 @@ class UsuariosTab(QWidget):
         try:
             result = self.usuarios_controller.delete_usuario(usuario.email_login)
             if result.get('success'):
-                self.sincronizar_usuarios()
+                # El servicio ya quitó al usuario del cache; basta con redibujar
+                self.cargar_usuarios()
                 QMessageBox.information(self, "Usuario eliminado", f"{usuario.email_login} eliminado correctamente")
             else:
                 QMessageBox.warning(self, "Error", result.get('error', 'No se pudo eliminar el usuario'))
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error al eliminar usuario: {str(e)}")
+
+    # Acciones masivas: cada una es una sola escritura en BigQuery (y un lote en Firebase)
+    def accion_toggle_masivo(self, activo: bool):
+        usuarios = self.get_selected_usuarios()
+        if not usuarios:
+            return
+        accion = "activados" if activo else "desactivados"
+        self._ejecutar_masivo(
+            f"{len(usuarios)} usuarios {accion}",
+            self.usuarios_controller.toggle_usuarios_activo, usuarios, activo
+        )
+
+    def accion_cambiar_rol_masivo(self):
+        usuarios = self.get_selected_usuarios()
+        if not usuarios:
+            return
+        roles = self.usuarios_controller.get_roles()
+        if not roles:
+            QMessageBox.warning(self, "Cambiar rol", "No se pudieron obtener los roles")
+            return
+        nombres = [rol['nombre_rol'] for rol in roles]
+        nombre, ok = QInputDialog.getItem(
+            self, "Cambiar rol", f"Nuevo rol para {len(usuarios)} usuarios:", nombres, 0, False
+        )
+        if not ok:
+            return
+        rol_id = roles[nombres.index(nombre)]['rol_id']
+        self._ejecutar_masivo(
+            f"Rol {nombre} asignado a {len(usuarios)} usuarios",
+            self.usuarios_controller.cambiar_rol_usuarios, [u.email_login for u in usuarios], rol_id
+        )
+
+    def accion_asignar_instalaciones_masivo(self):
+        usuarios = self.get_selected_usuarios()
+        if not usuarios:
+            return
+        dialog = AsignarInstalacionesMasivoDialog(self, len(usuarios))
+        if dialog.exec() != QDialog.Accepted:
+            return
+        instalaciones = dialog.get_instalaciones_con_cliente()
+        if not instalaciones:
+            return
+        self._ejecutar_masivo(
+            f"{len(instalaciones)} instalaciones otorgadas a {len(usuarios)} usuarios",
+            self.usuarios_controller.asignar_instalaciones_usuarios,
+            [u.email_login for u in usuarios], instalaciones
+        )
+
+    def accion_eliminar_masivo(self, usuarios):
+        confirm = QMessageBox.question(
+            self,
+            "Eliminar usuarios",
+            (
+                f"¿Eliminar definitivamente a {len(usuarios)} usuarios?\n\n"
+                + "\n".join(u.email_login for u in usuarios[:10])
+                + (f"\n... y {len(usuarios) - 10} más" if len(usuarios) > 10 else "")
+                + "\n\nEsto eliminará: Firebase Auth, usuario_instalaciones, usuario_contactos, instalacion_contacto (si aplica), contactos y usuarios_app."
+            ),
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if confirm != QMessageBox.Yes:
+            return
+        self._ejecutar_masivo(
+            f"{len(usuarios)} usuarios eliminados",
+            self.usuarios_controller.delete_usuarios, usuarios
+        )
+
+    def _ejecutar_masivo(self, mensaje_exito: str, funcion, *args):
+        """Ejecutar una acción masiva en segundo plano y recargar la tabla al terminar"""
+        if self.tareas.en_curso("masivo"):
+            return
+        self.cargando.iniciar("⏳ Aplicando cambios...")
+        self.tareas.ejecutar(
+            "masivo", funcion, *args,
+            on_resultado=lambda result: self._on_accion_masiva(result, mensaje_exito),
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error en la acción masiva: {error}"),
+            on_terminado=self._on_accion_masiva_terminada,
+        )
+        self.update_action_buttons()
+
+    def _on_accion_masiva(self, result, mensaje_exito: str):
+        if result.get('success'):
+            self.status_message.emit(f"✅ {mensaje_exito}", 4000)
+        else:
+            QMessageBox.warning(self, "Error", result.get('error', 'No se pudo completar la acción'))
+
+    def _on_accion_masiva_terminada(self):
+        self.cargando.detener()
+        # Los servicios ya parchearon o invalidaron el cache; basta con recargar
+        self.cargar_usuarios()
+
     def get_rol_color(self, rol_id):
         """Obtener color para rol"""
         colores = {
@@ -489,29 +663,13 @@ class UsuariosTab(QWidget):
         }
         return colores.get(rol_id, COLOR_CLIENTE)
     
-    def filtrar_usuarios(self, texto=""):
-        """Filtrar usuarios por texto y rol"""
-        try:
-            # Obtener todos los usuarios
-            usuarios = self.usuarios_controller.get_usuarios()
-            
-            # Filtrar por texto
-            if texto:
-                texto = texto.lower()
-                usuarios = [u for u in usuarios if 
-                          texto in u.nombre_completo.lower() or 
-                          texto in u.email_login.lower() or 
-                          texto in u.cliente_rol.lower()]
-            
-            # Filtrar por rol
-            rol_seleccionado = self.rol_filter_combo.currentText()
-            if rol_seleccionado != "Todos los roles":
-                usuarios = [u for u in usuarios if u.nombre_rol == rol_seleccionado]
-            
-            self.mostrar_usuarios(usuarios)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error al filtrar usuarios: {str(e)}")
+    def filtrar_usuarios(self):
+        """Filtrar la vista por texto (índice en memoria) y rol, sin consultar servicios"""
+        filas = self.indice.buscar(self.search_input.text()) if self.indice is not None else None
+        rol_seleccionado = self.rol_filter_combo.currentText()
+        rol = rol_seleccionado if rol_seleccionado and rol_seleccionado != "Todos los roles" else None
+        self.proxy.set_filtro(filas, rol)
+        self.update_action_buttons()
     
     def nuevo_usuario(self):
         """Abrir diálogo para crear nuevo usuario"""
@@ -541,7 +699,7 @@ class UsuariosTab(QWidget):
         """Activar o desactivar un usuario"""
         try:
             nuevo_estado = not usuario.activo
-            result = self.usuarios_controller.toggle_usuario_activo(usuario.email_login, nuevo_estado)
+            result = self.usuarios_controller.toggle_usuarios_activo([usuario], nuevo_estado)
             
             if result['success']:
                 estado_text = "activado" if nuevo_estado else "desactivado"
@@ -572,18 +730,13 @@ class UsuariosTab(QWidget):
             QMessageBox.critical(self, "Error", f"Error al limpiar cache: {str(e)}")
 
     def sincronizar_usuarios(self):
-        """Forzar recarga desde BigQuery ignorando cache"""
+        """Recargar desde BigQuery solo lo que cambió (según metadatos de las tablas)"""
         try:
-            try:
-                # Limpiar cache en la instancia real usada por el controlador
-                self.usuarios_controller.service.bigquery_service.clear_cache()
-            except Exception:
-                pass
             # Resetear filtros para que la recarga muestre todo
             self.search_input.clear()
             if self.rol_filter_combo.currentIndex() != 0:
                 self.rol_filter_combo.setCurrentIndex(0)
-            self.cargar_usuarios()
+            self.cargar_usuarios(revalidar=True)
             self.status_message.emit("Lista de usuarios sincronizada", 3000)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error al sincronizar usuarios: {str(e)}")
@@ -592,14 +745,109 @@ class UsuariosTab(QWidget):
         """Abrir diálogo para carga masiva de usuarios desde Excel"""
         dialog = CargaMasivaDialog(self)
         if dialog.exec() == QDialog.Accepted:
-            try:
-                from services.bigquery_service import BigQueryService
-                BigQueryService().clear_cache()
-            except Exception:
-                pass
+            # Las altas masivas actualizan el cache a medida que se escriben
             self.cargar_usuarios()
 
 
+class AsignarInstalacionesMasivoDialog(QDialog):
+    """Diálogo para elegir instalaciones que se otorgan a varios usuarios a la vez"""
+    
+    def __init__(self, parent=None, cantidad_usuarios: int = 0):
+        super().__init__(parent)
+        self.parent_tab = parent
+        self.setWindowTitle("Asignar instalaciones")
+        self.setMinimumSize(520, 560)
+        
+        layout = QVBoxLayout(self)
+        info = QLabel(
+            f"Las instalaciones marcadas se agregarán a los {cantidad_usuarios} usuarios seleccionados.\n"
+            "Las instalaciones que ya tengan asignadas se conservan."
+        )
+        info.setWordWrap(True)
+        layout.addWidget(info)
+        
+        self.filtro_input = QLineEdit()
+        self.filtro_input.setPlaceholderText("Filtrar por instalación o cliente...")
+        self.filtro_input.textChanged.connect(self.filtrar)
+        layout.addWidget(self.filtro_input)
+        
+        self.lista = QListWidget()
+        self.lista.itemChanged.connect(self.actualizar_contador)
+        layout.addWidget(self.lista)
+        
+        self.contador_label = QLabel("0 instalaciones seleccionadas")
+        layout.addWidget(self.contador_label)
+        
+        botones = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        botones.accepted.connect(self.accept)
+        botones.rejected.connect(self.reject)
+        layout.addWidget(botones)
+        
+        self.indice = None
+        self._fila_de = {}  # posición en el índice -> fila de la lista
+        self._visibles = set()
+        self.tareas = TaskRunner(self)
+        self.cargar_instalaciones()
+    
+    def cargar_instalaciones(self):
+        """Cargar el índice de instalaciones en segundo plano"""
+        self.tareas.ejecutar(
+            "instalaciones", self.parent_tab.instalaciones_controller.get_indice,
+            on_resultado=self._on_indice_cargado,
+            on_error=lambda error: QMessageBox.critical(self, "Error", f"Error al cargar instalaciones: {error}"),
+        )
+    
+    def done(self, resultado):
+        """Descartar consultas pendientes al cerrar el diálogo"""
+        self.tareas.cancelar_todo()
+        super().done(resultado)
+    
+    def _on_indice_cargado(self, indice):
+        self.indice = indice
+        instalaciones = self.indice.instalaciones
+        orden = sorted(range(len(instalaciones)),
+                       key=lambda p: (instalaciones[p].cliente_rol or "", instalaciones[p].instalacion_rol))
+        self.lista.blockSignals(True)
+        for fila, posicion in enumerate(orden):
+            inst = instalaciones[posicion]
+            item = QListWidgetItem(f"{inst.instalacion_rol}  ({inst.cliente_rol or 'Sin cliente'})")
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            item.setData(Qt.UserRole, (inst.instalacion_rol, inst.cliente_rol))
+            self.lista.addItem(item)
+            self._fila_de[posicion] = fila
+        self.lista.blockSignals(False)
+        self._visibles = set(range(self.lista.count()))
+        # Aplicar lo que se haya escrito mientras se cargaba
+        self.filtrar(self.filtro_input.text())
+    
+    def filtrar(self, texto: str):
+        """Mostrar solo las coincidencias del índice: se tocan únicamente las filas que cambian"""
+        if self.indice is None:
+            return
+        posiciones = self.indice.filtrar(texto=texto)
+        if posiciones is None:
+            visibles = set(range(self.lista.count()))
+        else:
+            visibles = {self._fila_de[p] for p in posiciones}
+        for fila in self._visibles ^ visibles:
+            self.lista.item(fila).setHidden(fila not in visibles)
+        self._visibles = visibles
+    
+    def actualizar_contador(self, *_):
+        self.contador_label.setText(f"{len(self.get_instalaciones_con_cliente())} instalaciones seleccionadas")
+    
+    def get_instalaciones_con_cliente(self) -> dict:
+        """Instalaciones marcadas: {instalacion_rol: cliente_rol}"""
+        seleccion = {}
+        for i in range(self.lista.count()):
+            item = self.lista.item(i)
+            if item.checkState() == Qt.Checked:
+                instalacion_rol, cliente_rol = item.data(Qt.UserRole)
+                seleccion[instalacion_rol] = cliente_rol
+        return seleccion
+
+
 # Diálogo completo de Nuevo Usuario
 class NuevoUsuarioDialog(QDialog):
     """Diálogo completo para crear nuevo usuario"""
@@ -611,7 +859,9 @@ class NuevoUsuarioDialog(QDialog):
         self.setModal(True)
         self.setMinimumSize(800, 600)
         self.instalaciones_data = []
+        self.indice = None
         self.roles_data = []
+        self.tareas = TaskRunner(self)
         self.init_ui()
         self.cargar_datos()
     
@@ -770,14 +1020,27 @@ class NuevoUsuarioDialog(QDialog):
                 # Ajustar visibilidad del check según rol seleccionado
                 self._toggle_contacto_visibility()
             
-            # Cargar instalaciones
+            # Cargar instalaciones (en segundo plano: puede requerir consultar BigQuery)
             if hasattr(self.parent_tab, 'instalaciones_controller'):
-                self.instalaciones_data = self.parent_tab.instalaciones_controller.get_instalaciones_con_zonas()
-                self.mostrar_instalaciones()
-                self.cargar_filtros()
+                self.tareas.ejecutar(
+                    "instalaciones", self.parent_tab.instalaciones_controller.get_indice,
+                    on_resultado=self._on_indice_cargado,
+                    on_error=lambda error: QMessageBox.warning(self, "Error", f"Error al cargar instalaciones: {error}"),
+                )
                 
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Error al cargar datos: {str(e)}")
+    
+    def _on_indice_cargado(self, indice):
+        self.indice = indice
+        self.instalaciones_data = indice.instalaciones
+        self.mostrar_instalaciones()
+        self.cargar_filtros()
+    
+    def done(self, resultado):
+        """Descartar consultas pendientes al cerrar el diálogo"""
+        self.tareas.cancelar_todo()
+        super().done(resultado)
 
     def _toggle_contacto_visibility(self):
         try:
@@ -789,29 +1052,21 @@ class NuevoUsuarioDialog(QDialog):
     
     def cargar_filtros(self):
         """Cargar opciones para los filtros"""
-        # Zonas únicas
-        zonas = set()
-        clientes = set()
-        
-        for inst in self.instalaciones_data:
-            if hasattr(inst, 'zona') and inst.zona:
-                zonas.add(inst.zona)
-            if hasattr(inst, 'cliente_rol') and inst.cliente_rol:
-                clientes.add(inst.cliente_rol)
-        
+        if self.indice is None:
+            return
         self.zona_filter.clear()
         self.zona_filter.addItem("Todas las zonas")
-        for zona in sorted(zonas):
+        for zona in self.indice.zonas():
             self.zona_filter.addItem(zona)
         
         self.cliente_filter.clear()
         self.cliente_filter.addItem("Todos los clientes")
-        for cliente in sorted(clientes):
+        for cliente in self.indice.clientes():
             self.cliente_filter.addItem(cliente)
     
     def mostrar_instalaciones(self, instalaciones_filtradas=None):
-        """Mostrar instalaciones en la tabla"""
-        instalaciones = instalaciones_filtradas or self.instalaciones_data
+        """Mostrar instalaciones en la tabla (None = todas)"""
+        instalaciones = self.instalaciones_data if instalaciones_filtradas is None else instalaciones_filtradas
         
         # Configurar número de filas
         self.instalaciones_table.setRowCount(len(instalaciones))
@@ -843,26 +1098,15 @@ class NuevoUsuarioDialog(QDialog):
         self.actualizar_contador()
     
     def filtrar_instalaciones(self):
-        """Filtrar instalaciones por zona y cliente"""
+        """Filtrar instalaciones por zona y cliente (con el índice, sin recorrer la lista)"""
+        if self.indice is None:
+            return
         zona_seleccionada = self.zona_filter.currentText()
         cliente_seleccionado = self.cliente_filter.currentText()
-        
-        instalaciones_filtradas = []
-        
-        for inst in self.instalaciones_data:
-            # Filtro por zona
-            if zona_seleccionada != "Todas las zonas" and zona_seleccionada != "":
-                if not (hasattr(inst, 'zona') and inst.zona == zona_seleccionada):
-                    continue
-            
-            # Filtro por cliente
-            if cliente_seleccionado != "Todos los clientes" and cliente_seleccionado != "":
-                if not (hasattr(inst, 'cliente_rol') and inst.cliente_rol == cliente_seleccionado):
-                    continue
-            
-            instalaciones_filtradas.append(inst)
-        
-        self.mostrar_instalaciones(instalaciones_filtradas)
+        self.mostrar_instalaciones(self.indice.seleccionar(
+            zona=zona_seleccionada if zona_seleccionada not in ("", "Todas las zonas") else None,
+            cliente=cliente_seleccionado if cliente_seleccionado not in ("", "Todos los clientes") else None,
+        ))
     
     def limpiar_filtros(self):
         """Limpiar todos los filtros"""
@@ -1192,7 +1436,9 @@ class PermisosDialog(QDialog):
         self.setModal(True)
         self.setMinimumSize(900, 620)
         self.instalaciones_data = []
+        self.indice = None
         self.asignadas_detalle = {}
+        self.tareas = TaskRunner(self)
         self.init_ui()
         self.cargar_datos()
     
@@ -1219,14 +1465,21 @@ class PermisosDialog(QDialog):
         filtros.addStretch()
         layout.addLayout(filtros)
         
+        self.cargando = InlineLoading(self, "⏳ Cargando instalaciones y permisos...")
+        layout.addWidget(self.cargando)
+        
         self.zona_filter.currentTextChanged.connect(self.on_zona_cambiada)
         self.cliente_filter.currentTextChanged.connect(self.aplicar_filtros)
         self.search_input_perm.textChanged.connect(self.aplicar_filtros)
         
-        # Tabla de instalaciones
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["Ver", "Encuesta", "Instalación", "Zona", "Cliente"])
+        # Tabla de instalaciones: el estado de Ver/Encuesta vive en el modelo (no en widgets)
+        self.modelo = PermisosTableModel(self)
+        self.proxy = InstalacionesFiltroProxy(self)
+        self.proxy.setSourceModel(self.modelo)
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(28)
         header_t = self.table.horizontalHeader()
         header_t.setSectionResizeMode(0, QHeaderView.ResizeToContents)
         header_t.setSectionResizeMode(1, QHeaderView.ResizeToContents)
@@ -1236,47 +1489,66 @@ class PermisosDialog(QDialog):
         self.table.setAlternatingRowColors(True)
         layout.addWidget(self.table)
         
+        self.contador_label = QLabel("")
+        self.modelo.dataChanged.connect(lambda *_: self._actualizar_contador())
+        self.modelo.modelReset.connect(self._actualizar_contador)
+        layout.addWidget(self.contador_label)
+        
         # Botones
         buttons = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self.guardar_permisos)
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
+        # No permitir guardar hasta tener las asignaciones actuales
+        self.save_btn = buttons.button(QDialogButtonBox.Save)
     
     def cargar_datos(self):
-        try:
-            # Cargar instalaciones
-            self.instalaciones_data = self.parent_tab.instalaciones_controller.get_instalaciones_con_zonas()
-            # Cargar asignaciones actuales con detalle
-            self.asignadas_detalle = self.parent_tab.instalaciones_controller.get_instalaciones_usuario_detalle(self.usuario.email_login) or {}
-            self._cargar_filtros()
-            self._poblar_tabla(self.instalaciones_data)
-        except Exception as e:
-            QMessageBox.warning(self, "Permisos", f"No se pudieron cargar datos: {e}")
+        """Cargar instalaciones y asignaciones actuales en segundo plano"""
+        self.save_btn.setEnabled(False)
+        self.cargando.iniciar()
+        self.tareas.ejecutar(
+            "permisos", self._consultar_datos,
+            on_resultado=self._on_datos_cargados,
+            on_error=lambda error: QMessageBox.warning(self, "Permisos", f"No se pudieron cargar datos: {error}"),
+            on_terminado=self.cargando.detener,
+        )
+    
+    def _consultar_datos(self):
+        """Se ejecuta fuera del hilo de la interfaz: no tocar widgets aquí"""
+        controller = self.parent_tab.instalaciones_controller
+        indice = controller.get_indice()
+        detalle = controller.get_instalaciones_usuario_detalle(self.usuario.email_login) or {}
+        return indice, detalle
+    
+    def _on_datos_cargados(self, datos):
+        self.indice, self.asignadas_detalle = datos
+        self.instalaciones_data = self.indice.instalaciones
+        # Las filas del modelo siguen el orden del índice: el proxy filtra por posición
+        self.modelo.cargar(self.instalaciones_data, self.asignadas_detalle)
+        self.proxy.set_indice(self.indice)
+        self._cargar_filtros()
+        self.aplicar_filtros()
+        self.save_btn.setEnabled(True)
+    
+    def done(self, resultado):
+        """Descartar consultas pendientes al cerrar el diálogo"""
+        self.tareas.cancelar_todo()
+        super().done(resultado)
     
     def _cargar_filtros(self):
-        zonas, clientes = set(), set()
-        for inst in self.instalaciones_data:
-            if getattr(inst, 'zona', None):
-                zonas.add(inst.zona)
-            if getattr(inst, 'cliente_rol', None):
-                clientes.add(inst.cliente_rol)
         self.zona_filter.blockSignals(True); self.cliente_filter.blockSignals(True)
         self.zona_filter.clear(); self.zona_filter.addItem("Todas las zonas")
-        for z in sorted(zonas): self.zona_filter.addItem(z)
+        for z in self.indice.zonas(): self.zona_filter.addItem(z)
         self.cliente_filter.clear(); self.cliente_filter.addItem("Todos los clientes")
-        for c in sorted(clientes): self.cliente_filter.addItem(c)
+        for c in self.indice.clientes(): self.cliente_filter.addItem(c)
         self.zona_filter.blockSignals(False); self.cliente_filter.blockSignals(False)
         # Ajustar clientes según zona actual
         self._actualizar_clientes_por_zona()
 
     def _clientes_para_zona(self, zona_sel: str):
-        clientes = set()
-        for inst in self.instalaciones_data:
-            if zona_sel == "Todas las zonas" or getattr(inst, 'zona', None) == zona_sel:
-                c = getattr(inst, 'cliente_rol', None)
-                if c:
-                    clientes.add(c)
-        return sorted(clientes)
+        if self.indice is None:
+            return []
+        return self.indice.clientes(None if zona_sel == "Todas las zonas" else zona_sel)
 
     def _actualizar_clientes_por_zona(self):
         zona_sel = self.zona_filter.currentText()
@@ -1298,50 +1570,16 @@ class PermisosDialog(QDialog):
         self._actualizar_clientes_por_zona()
         self.aplicar_filtros()
     
-    def _poblar_tabla(self, instalaciones):
-        self.table.setRowCount(len(instalaciones))
-        for row, inst in enumerate(instalaciones):
-            inst_id = getattr(inst, 'instalacion_rol', None)
-            cliente = getattr(inst, 'cliente_rol', None)
-            zona = getattr(inst, 'zona', None)
-            detalle = self.asignadas_detalle.get(inst_id, {}) if inst_id else {}
-            asignada = bool(detalle)  # si existe en detalle, está asignada
-            requiere = bool(detalle.get('requiere_encuesta_individual'))
-            
-            # Ver
-            chk_ver = QCheckBox(); chk_ver.setChecked(asignada)
-            # Encuesta
-            chk_enc = QCheckBox(); chk_enc.setChecked(requiere); chk_enc.setEnabled(asignada)
-            def on_ver_toggled(checked, enc=chk_enc):
-                enc.setEnabled(checked)
-                if not checked:
-                    enc.setChecked(False)
-            chk_ver.toggled.connect(on_ver_toggled)
-            # Guardar metadata para persistencia
-            chk_ver.setProperty('instalacion_rol', inst_id)
-            chk_ver.setProperty('cliente_rol', cliente)
-            chk_enc.setProperty('instalacion_rol', inst_id)
-            
-            self.table.setCellWidget(row, 0, chk_ver)
-            self.table.setCellWidget(row, 1, chk_enc)
-            self.table.setItem(row, 2, QTableWidgetItem(inst_id or ""))
-            self.table.setItem(row, 3, QTableWidgetItem(zona or ""))
-            self.table.setItem(row, 4, QTableWidgetItem(cliente or ""))
-    
     def aplicar_filtros(self):
-        zona = self.zona_filter.currentText()
-        cliente = self.cliente_filter.currentText()
-        q = (self.search_input_perm.text() or "").lower()
-        filtradas = []
-        for inst in self.instalaciones_data:
-            if zona != "Todas las zonas" and getattr(inst, 'zona', None) != zona:
-                continue
-            if cliente != "Todos los clientes" and getattr(inst, 'cliente_rol', None) != cliente:
-                continue
-            if q and q not in (getattr(inst, 'instalacion_rol', '') or '').lower():
-                continue
-            filtradas.append(inst)
-        self._poblar_tabla(filtradas)
+        """Filtrar solo la vista: las marcas de las filas ocultas se conservan"""
+        self.proxy.set_filtros(
+            self.zona_filter.currentText(),
+            self.cliente_filter.currentText(),
+            self.search_input_perm.text(),
+        )
+    
+    def _actualizar_contador(self):
+        self.contador_label.setText(f"{self.modelo.cantidad_marcadas()} instalaciones asignadas")
     
     def _toggle_ver_todas(self, checked: bool):
         self.table.setEnabled(not checked)
@@ -1355,17 +1593,8 @@ class PermisosDialog(QDialog):
                 # Marcar ver_todas en usuario y limpiar asignaciones específicas
                 asignaciones = []
             else:
-                asignaciones = []
-                for row in range(self.table.rowCount()):
-                    chk_ver = self.table.cellWidget(row, 0)
-                    chk_enc = self.table.cellWidget(row, 1)
-                    if chk_ver and chk_ver.isChecked():
-                        asignaciones.append({
-                            'instalacion_rol': chk_ver.property('instalacion_rol'),
-                            'cliente_rol': chk_ver.property('cliente_rol'),
-                            'puede_ver': True,
-                            'requiere_encuesta_individual': bool(chk_enc.isChecked()) if chk_enc else False
-                        })
+                # Todas las marcadas, también las que el filtro actual oculta
+                asignaciones = self.modelo.asignaciones()
             # Persistir
             result = self.parent_tab.instalaciones_controller.asignar_instalaciones_usuario(self.usuario.email_login, asignaciones)
             if not result.get('success', True):
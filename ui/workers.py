@@ -0,0 +1,153 @@
+"""
+Ejecución de consultas en segundo plano (QThreadPool) con resultados vía señales Qt
+"""
+import traceback
+from typing import Callable, Dict, Optional, Tuple
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+
+
+class WorkerSignals(QObject):
+    """Señales de un Worker: viajan en cola hacia el hilo de la interfaz"""
+    resultado = Signal(str, int, object)   # canal, generación, valor
+    error = Signal(str, int, str)          # canal, generación, mensaje
+    progreso = Signal(str, int, int, str)  # canal, generación, porcentaje, mensaje
+    terminado = Signal(str, int)           # canal, generación
+
+
+class Worker(QRunnable):
+    """Ejecuta una función en un hilo del pool y emite su resultado o error"""
+
+    def __init__(self, funcion: Callable, *args, canal: str = "", generacion: int = 0,
+                 con_progreso: bool = False, **kwargs):
+        super().__init__()
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs
+        self.canal = canal
+        self.generacion = generacion
+        self.cancelado = False
+        self.signals = WorkerSignals()
+        if con_progreso:
+            # La función recibe un callback progreso(porcentaje, mensaje)
+            self.kwargs['progreso'] = self._emitir_progreso
+
+    def cancelar(self):
+        """Marcar como cancelado: el resultado se descarta al terminar"""
+        self.cancelado = True
+
+    def _emitir_progreso(self, porcentaje: int, mensaje: str = ""):
+        if not self.cancelado:
+            self.signals.progreso.emit(self.canal, self.generacion, int(porcentaje), mensaje)
+
+    @Slot()
+    def run(self):
+        try:
+            valor = self.funcion(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            if not self.cancelado:
+                self.signals.error.emit(self.canal, self.generacion, str(e))
+        else:
+            if not self.cancelado:
+                self.signals.resultado.emit(self.canal, self.generacion, valor)
+        finally:
+            self.signals.terminado.emit(self.canal, self.generacion)
+
+
+class TaskRunner(QObject):
+    """Lanza tareas en el pool global y descarta resultados obsoletos.
+
+    Cada tarea pertenece a un canal (p.ej. "usuarios"); al lanzar una nueva tarea
+    en el mismo canal la anterior queda obsoleta y su resultado no se entrega.
+    Los callbacks siempre se ejecutan en el hilo de la interfaz.
+    """
+
+    def __init__(self, parent: Optional[QObject] = None, pool: Optional[QThreadPool] = None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self._generaciones: Dict[str, int] = {}
+        self._tareas: Dict[Tuple[str, int], Tuple[Worker, Dict[str, Callable]]] = {}
+
+    def ejecutar(self, canal: str, funcion: Callable, *args,
+                 on_resultado: Callable = None, on_error: Callable = None,
+                 on_progreso: Callable = None, on_terminado: Callable = None, **kwargs) -> Worker:
+        """Ejecutar `funcion(*args, **kwargs)` en segundo plano dentro de un canal"""
+        self.cancelar(canal)
+        generacion = self._generaciones.get(canal, 0) + 1
+        self._generaciones[canal] = generacion
+
+        worker = Worker(funcion, *args, canal=canal, generacion=generacion,
+                        con_progreso=on_progreso is not None, **kwargs)
+        worker.signals.resultado.connect(self._on_resultado)
+        worker.signals.error.connect(self._on_error)
+        worker.signals.progreso.connect(self._on_progreso)
+        worker.signals.terminado.connect(self._on_terminado)
+
+        callbacks = {
+            'resultado': on_resultado,
+            'error': on_error,
+            'progreso': on_progreso,
+            'terminado': on_terminado,
+        }
+        # Mantener referencia al worker (y a sus señales) hasta que termine
+        self._tareas[(canal, generacion)] = (worker, callbacks)
+        self.pool.start(worker)
+        return worker
+
+    def cancelar(self, canal: str):
+        """Descartar el resultado de la tarea en curso del canal (si existe)"""
+        generacion = self._generaciones.get(canal)
+        if generacion is None:
+            return
+        tarea = self._tareas.get((canal, generacion))
+        if tarea:
+            tarea[0].cancelar()
+        self._generaciones[canal] = generacion + 1
+
+    def cancelar_todo(self):
+        """Descartar los resultados de todas las tareas en curso"""
+        for canal in list(self._generaciones):
+            self.cancelar(canal)
+
+    def en_curso(self, canal: Optional[str] = None) -> bool:
+        """Indica si hay tareas vigentes en el canal (o en cualquiera)"""
+        if canal is None:
+            return any(self._vigente(c, g) for c, g in self._tareas)
+        return (canal, self._generaciones.get(canal)) in self._tareas
+
+    def _vigente(self, canal: str, generacion: int) -> bool:
+        return self._generaciones.get(canal) == generacion
+
+    def _callback(self, canal: str, generacion: int, nombre: str) -> Optional[Callable]:
+        if not self._vigente(canal, generacion):
+            return None
+        tarea = self._tareas.get((canal, generacion))
+        return tarea[1].get(nombre) if tarea else None
+
+    @Slot(str, int, object)
+    def _on_resultado(self, canal: str, generacion: int, valor):
+        callback = self._callback(canal, generacion, 'resultado')
+        if callback:
+            callback(valor)
+
+    @Slot(str, int, str)
+    def _on_error(self, canal: str, generacion: int, mensaje: str):
+        callback = self._callback(canal, generacion, 'error')
+        if callback:
+            callback(mensaje)
+        elif self._vigente(canal, generacion):
+            print(f"Error en tarea '{canal}': {mensaje}")
+
+    @Slot(str, int, int, str)
+    def _on_progreso(self, canal: str, generacion: int, porcentaje: int, mensaje: str):
+        callback = self._callback(canal, generacion, 'progreso')
+        if callback:
+            callback(porcentaje, mensaje)
+
+    @Slot(str, int)
+    def _on_terminado(self, canal: str, generacion: int):
+        callback = self._callback(canal, generacion, 'terminado')
+        self._tareas.pop((canal, generacion), None)
+        if callback:
+            callback()